@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+图表数据精简
+- 长时间序列用 LTTB（Largest-Triangle-Three-Buckets）降采样到目标点数，保留峰谷形状，
+  按桶流式处理，只缓存当前桶和下一个桶
+- 分类分布取出现次数最多的 k 个取值，其余合并为“其他”
+"""
+
+import heapq
+from datetime import date, timedelta
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+# 趋势图最多保留的点数
+TREND_MAX_POINTS = 500
+# 分布图最多展示的分类数（含“其他”）
+TOP_K_CATEGORIES = 10
+OTHER_LABEL = "其他"
+
+
+def lttb_stream(points: Iterable[Tuple[float, float]], total: int, threshold: int) -> Iterator[Tuple[float, float]]:
+    """对 total 个按 x 递增的点做 LTTB 降采样，逐个产出被选中的点
+
+    首尾两点总是保留；中间的点分成 threshold - 2 个桶，每个桶选出与“上一个选中点”和
+    “下一个桶的平均点”构成三角形面积最大的点。只需要预先知道点数，不需要整个序列在内存中。
+    """
+    iterator = iter(points)
+    if threshold >= total or threshold < 3:
+        yield from iterator
+        return
+
+    bucket_size = (total - 2) / (threshold - 2)
+    # 第 i 个桶（从 0 开始）覆盖中间点的下标范围 [floor(i*size)+1, floor((i+1)*size)+1)
+    bounds = [int(i * bucket_size) + 1 for i in range(threshold - 1)]
+    bounds[-1] = total - 1
+
+    first = next(iterator)
+    yield first
+    selected = first
+
+    def take(count: int) -> List[Tuple[float, float]]:
+        return [next(iterator) for _ in range(count)]
+
+    current = take(bounds[1] - bounds[0])
+    for i in range(threshold - 2):
+        if i + 2 < len(bounds):
+            following = take(bounds[i + 2] - bounds[i + 1])
+        else:
+            following = take(1)  # 最后一个点
+        avg_x = sum(p[0] for p in following) / len(following)
+        avg_y = sum(p[1] for p in following) / len(following)
+
+        ax, ay = selected
+        best, best_area = current[0], -1.0
+        for point in current:
+            area = abs((ax - avg_x) * (point[1] - ay) - (ax - point[0]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = point, area
+        yield best
+        selected = best
+        current = following
+
+    # 循环结束时 current 只剩最后一个点
+    yield current[-1]
+
+
+def lttb(points: List[Tuple[float, float]], threshold: int) -> List[Tuple[float, float]]:
+    return list(lttb_stream(points, len(points), threshold))
+
+
+def daily_series(day_counts: Dict[str, int]) -> Tuple[int, Iterator[Tuple[float, float]], Callable[[float], str]]:
+    """把 {YYYY-MM-DD: 次数} 展开为从最早到最晚每天一个点的序列（没有数据的日期为 0）
+
+    返回 (点数, 点的迭代器, x → 标签)，x 为日期序号；日期无法解析时按原有顺序排列、不补零。
+    """
+    try:
+        parsed = {date.fromisoformat(day): count for day, count in day_counts.items()}
+    except ValueError:
+        ordered = sorted(day_counts.items())
+        points = ((float(i), float(count)) for i, (_, count) in enumerate(ordered))
+        return len(ordered), points, lambda x: ordered[int(x)][0]
+
+    start, end = min(parsed), max(parsed)
+    total = (end - start).days + 1
+
+    def generate():
+        for offset in range(total):
+            day = start + timedelta(days=offset)
+            yield float(day.toordinal()), float(parsed.get(day, 0))
+
+    return total, generate(), lambda x: date.fromordinal(int(x)).isoformat()
+
+
+def reduce_trend(day_counts: Dict[str, int], max_points: int = TREND_MAX_POINTS) -> Tuple[List[str], List[int]]:
+    """按天计数 → 趋势图的 (标签, 数值)，点数超过 max_points 时用 LTTB 降采样"""
+    total, series, label_of = daily_series(day_counts)
+    labels, values = [], []
+    for x, y in lttb_stream(series, total, max_points):
+        labels.append(label_of(x))
+        values.append(int(y))
+    return labels, values
+
+
+def top_k_with_other(counts: Dict[str, int], k: int = TOP_K_CATEGORIES,
+                     other_label: str = OTHER_LABEL) -> Tuple[List[str], List[int]]:
+    """出现次数最多的 k - 1 个分类 + “其他”（分类数不超过 k 时全部保留），按次数降序"""
+    if len(counts) <= k:
+        top = sorted(counts.items(), key=lambda item: item[1], reverse=True)
+        return [label for label, _ in top], [count for _, count in top]
+
+    top = heapq.nlargest(k - 1, counts.items(), key=lambda item: item[1])
+    other = sum(counts.values()) - sum(count for _, count in top)
+    return [label for label, _ in top] + [other_label], [count for _, count in top] + [other]
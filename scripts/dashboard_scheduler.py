@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+已保存看板的定时刷新守护进程
+维护看板注册表（查询 + 刷新间隔 + 输出路径），常驻复用同一个 SmartDashboardGenerator，
+按表的 UPDATE_TIME 判断是否需要刷新，并原子替换输出的 HTML/JSON 文件
+"""
+
+import json
+import os
+import stat
+import tempfile
+import time
+import zlib
+from datetime import date, datetime
+from typing import Dict, Any, List, Optional
+
+from smart_dashboard_generator import SmartDashboardGenerator, ResultJSONEncoder, _get_skill_root
+
+
+DEFAULT_INTERVAL = 3600
+# 到期时间相差在该窗口内的看板合并为一批刷新，共享一次 UPDATE_TIME 检查
+COALESCE_WINDOW = 30
+
+
+def _target_mode(path: str) -> int:
+    """覆盖已有文件时沿用其权限，否则按当前 umask 计算普通文件的权限"""
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def atomic_write(path: str, content: str):
+    """原子写文件：先写同目录临时文件，再 os.replace 覆盖，读者不会看到半个文件
+
+    mkstemp 创建的临时文件权限为 0600，替换前改为原文件的权限（新文件按 umask），
+    Web 服务器和其他用户仍能读取刷新后的看板。
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=os.path.splitext(path)[1], dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, _target_mode(path))
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class DashboardRegistry:
+    """已保存看板注册表（JSON 文件）
+
+    格式:
+    {
+      "dashboards": [
+        {"name": "weekly_register", "query": "最近7天注册表的数据",
+         "interval": 600, "output": "out/weekly_register.html", "output_json": "out/weekly_register.json"}
+      ]
+    }
+    """
+
+    def __init__(self, registry_file: str):
+        self.registry_file = registry_file
+        self.dashboards: List[Dict[str, Any]] = self._load()
+
+    def _load(self) -> List[Dict[str, Any]]:
+        if not os.path.exists(self.registry_file):
+            return []
+        with open(self.registry_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        dashboards = data.get("dashboards", []) if isinstance(data, dict) else []
+        return [d for d in dashboards if isinstance(d, dict) and d.get("query")]
+
+    def save(self):
+        atomic_write(
+            self.registry_file,
+            json.dumps({"dashboards": self.dashboards}, ensure_ascii=False, indent=2),
+        )
+
+    def add(self, name: str, query: str, interval: int = DEFAULT_INTERVAL,
+            output: str = None, output_json: str = None) -> Dict[str, Any]:
+        """新增或覆盖同名看板"""
+        entry = {
+            "name": name,
+            "query": query,
+            "interval": int(interval),
+            "output": output or f"dashboard_{name}.html",
+        }
+        if output_json:
+            entry["output_json"] = output_json
+        self.dashboards = [d for d in self.dashboards if d.get("name") != name] + [entry]
+        self.save()
+        return entry
+
+    def remove(self, name: str) -> bool:
+        before = len(self.dashboards)
+        self.dashboards = [d for d in self.dashboards if d.get("name") != name]
+        if len(self.dashboards) != before:
+            self.save()
+            return True
+        return False
+
+
+class DashboardScheduler:
+    def __init__(self, registry: DashboardRegistry, db_config: str = None,
+                 coalesce_window: int = COALESCE_WINDOW):
+        """初始化调度器：整个进程只创建一个生成器，连接和表结构缓存在多次刷新间复用"""
+        self.registry = registry
+        # 无人值守的刷新不预取追问（没有人会接着问，只会给数据库增加负载）
+        self.generator = SmartDashboardGenerator(db_config, keep_connection=True, prefetch=False)
+        self.coalesce_window = coalesce_window
+        # name -> 下次运行时间戳
+        self.next_run: Dict[str, float] = {}
+        # name -> 上次刷新时各源表的 UPDATE_TIME
+        self.last_update_times: Dict[str, Dict[str, Optional[str]]] = {}
+        # name -> 上次刷新的日期（相对时间窗口的看板跨天后必须重新查询）
+        self.last_refresh_dates: Dict[str, str] = {}
+        self.stats = {"refreshed": 0, "skipped_unchanged": 0, "coalesced": 0, "failed": 0}
+
+    def _initial_offset(self, dashboard: Dict[str, Any]) -> float:
+        """按名称哈希错开首次刷新时间，避免所有看板在启动时同时打到数据库"""
+        interval = max(int(dashboard.get("interval", DEFAULT_INTERVAL)), 1)
+        key = dashboard.get("name") or dashboard["query"]
+        return zlib.crc32(key.encode("utf-8")) % interval
+
+    def _schedule_new(self, now: float, stagger: bool = True):
+        for dashboard in self.registry.dashboards:
+            name = dashboard.get("name") or dashboard["query"]
+            if name not in self.next_run:
+                self.next_run[name] = now + (self._initial_offset(dashboard) if stagger else 0)
+
+    def _due_batch(self, now: float) -> List[Dict[str, Any]]:
+        """取出已到期以及将在合并窗口内到期的看板"""
+        horizon = now + self.coalesce_window
+        batch = []
+        for dashboard in self.registry.dashboards:
+            name = dashboard.get("name") or dashboard["query"]
+            if self.next_run.get(name, now) <= horizon:
+                batch.append(dashboard)
+        return batch
+
+    def _source_tables(self, plan: Dict[str, Any]) -> List[str]:
+        tables = [plan.get("primary_table")] + list(plan.get("related_tables") or [])
+        return [t for t in tables if t]
+
+    @staticmethod
+    def _date_dependent(plan: Dict[str, Any]) -> bool:
+        """计划是否依赖当天日期：时间条件都是相对时间（CURDATE()/NOW()），分表/分区裁剪也按当天计算"""
+        return bool(plan.get("time_relative") or (plan.get("query_intent") or {}).get("time_conditions"))
+
+    def _parse(self, query: str) -> Dict[str, Any]:
+        try:
+            return self.generator.parser.parse_query(query)
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    def run_batch(self, batch: List[Dict[str, Any]]) -> Dict[str, str]:
+        """刷新一批看板：相同查询只执行一次，所有源表的 UPDATE_TIME 只查一次
+
+        单个看板出错（解析、查询、写文件）只计入 failed，不影响同批其他看板和后续调度。
+        """
+        outcomes: Dict[str, str] = {}
+        db = self.generator.db
+
+        plans: Dict[str, Dict[str, Any]] = {}
+        for dashboard in batch:
+            query = dashboard["query"]
+            if query not in plans:
+                plans[query] = self._parse(query)
+
+        all_tables = sorted({
+            table for plan in plans.values() if plan.get("success")
+            for table in self._source_tables(plan)
+        })
+        try:
+            current_times = db.get_table_update_times(all_tables)
+        except Exception as e:
+            # 取不到 UPDATE_TIME 时全部按“未知”处理，照常刷新
+            print(f"⚠️ 获取表更新时间失败，本批看板全部刷新: {e}")
+            current_times = {}
+
+        today = date.today().isoformat()
+        results: Dict[str, Dict[str, Any]] = {}
+        for dashboard in batch:
+            name = dashboard.get("name") or dashboard["query"]
+            try:
+                outcomes[name] = self._refresh_one(dashboard, plans[dashboard["query"]], current_times,
+                                                   results, today)
+            except Exception as e:
+                print(f"❌ [{name}] 刷新失败: {e}")
+                outcomes[name] = "failed"
+            if outcomes[name] == "failed":
+                self.stats["failed"] += 1
+
+        return outcomes
+
+    def _refresh_one(self, dashboard: Dict[str, Any], plan: Dict[str, Any],
+                     current_times: Dict[str, Optional[str]], results: Dict[str, Dict[str, Any]],
+                     today: str) -> str:
+        """刷新单个看板，返回 refreshed / skipped / failed"""
+        name = dashboard.get("name") or dashboard["query"]
+        query = dashboard["query"]
+
+        if not plan.get("success"):
+            print(f"❌ [{name}] 解析失败: {plan.get('error', '未知错误')}")
+            return "failed"
+
+        tables = self._source_tables(plan)
+        snapshot = {t: current_times.get(t) for t in tables}
+        unknown = any(v is None for v in snapshot.values())
+        # “最近7天”等相对时间窗口随日期移动：表没有新写入，跨天后也要重新查询
+        day_changed = self._date_dependent(plan) and self.last_refresh_dates.get(name) != today
+        if (not unknown and not day_changed and self.last_update_times.get(name) == snapshot
+                and os.path.exists(dashboard["output"])):
+            self.stats["skipped_unchanged"] += 1
+            return "skipped"
+
+        if query in results:
+            self.stats["coalesced"] += 1
+        else:
+            results[query] = self.generator.process_query(query)
+        result = results[query]
+
+        if not result.get("success"):
+            print(f"❌ [{name}] 刷新失败: {result.get('error', '未知错误')}")
+            return "failed"
+
+        atomic_write(dashboard["output"], self.generator.generate_dashboard_html(result))
+        if dashboard.get("output_json"):
+            atomic_write(
+                dashboard["output_json"],
+                json.dumps(result, ensure_ascii=False, indent=2, cls=ResultJSONEncoder),
+            )
+        self.last_update_times[name] = snapshot
+        self.last_refresh_dates[name] = today
+        self.stats["refreshed"] += 1
+        print(f"✅ [{name}] 已刷新: {dashboard['output']}")
+        return "refreshed"
+
+    def run_once(self) -> Dict[str, str]:
+        """立即刷新全部看板一次（适合替代 cron 单次调用）"""
+        return self.run_batch(list(self.registry.dashboards))
+
+    def run_forever(self, poll_interval: float = 1.0):
+        """常驻运行，直到 Ctrl-C"""
+        print(f"⏰ 定时刷新已启动，共 {len(self.registry.dashboards)} 个看板")
+        try:
+            while True:
+                now = time.time()
+                self._schedule_new(now)
+                batch = self._due_batch(now)
+                if batch:
+                    print(f"🔄 {datetime.now().strftime('%H:%M:%S')} 刷新 {len(batch)} 个看板")
+                    self.run_batch(batch)
+                    finished = time.time()
+                    for dashboard in batch:
+                        name = dashboard.get("name") or dashboard["query"]
+                        self.next_run[name] = finished + int(dashboard.get("interval", DEFAULT_INTERVAL))
+                    continue
+
+                wake_at = min(self.next_run.values(), default=now + poll_interval)
+                time.sleep(min(max(wake_at - self.coalesce_window - now, poll_interval), 60))
+        except KeyboardInterrupt:
+            print(f"\n🛑 定时刷新已停止: {self.stats}")
+        finally:
+            self.generator.db.disconnect()
+
+
+def main():
+    """主函数 - 命令行使用"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="已保存看板定时刷新")
+    default_registry = os.path.join(_get_skill_root(), "saved_dashboards.json")
+    parser.add_argument("--registry", default=default_registry, help="看板注册表路径（默认 skill 目录下的 saved_dashboards.json）")
+    parser.add_argument("--db-config", default=None, help="数据库配置文件路径")
+    parser.add_argument("--add", metavar="QUERY", help="新增看板的自然语言查询")
+    parser.add_argument("--name", help="看板名称（与 --add / --remove 配合使用）")
+    parser.add_argument("--interval", type=int, default=DEFAULT_INTERVAL, help="刷新间隔（秒）")
+    parser.add_argument("--output", help="输出 HTML 路径")
+    parser.add_argument("--output-json", help="同时输出原始 JSON 结果的路径")
+    parser.add_argument("--remove", action="store_true", help="删除 --name 指定的看板")
+    parser.add_argument("--list", action="store_true", help="列出已保存的看板")
+    parser.add_argument("--once", action="store_true", help="刷新全部看板一次后退出")
+
+    args = parser.parse_args()
+    registry = DashboardRegistry(args.registry)
+
+    if args.add:
+        name = args.name or "".join(c for c in args.add[:20] if c.isalnum() or c in ("-", "_"))
+        entry = registry.add(name, args.add, args.interval, args.output, args.output_json)
+        print(f"✅ 已保存看板: {entry['name']} (每 {entry['interval']} 秒刷新) -> {entry['output']}")
+        return
+
+    if args.remove:
+        if not args.name:
+            print("❌ --remove 需要配合 --name 使用")
+        elif registry.remove(args.name):
+            print(f"🗑️ 已删除看板: {args.name}")
+        else:
+            print(f"⚠️ 未找到看板: {args.name}")
+        return
+
+    if args.list:
+        if not registry.dashboards:
+            print("（暂无已保存的看板）")
+        for d in registry.dashboards:
+            print(f"- {d.get('name')}: {d['query']} | 每 {d.get('interval', DEFAULT_INTERVAL)} 秒 | {d.get('output')}")
+        return
+
+    if not registry.dashboards:
+        print(f"⚠️ 注册表为空: {args.registry}，请先使用 --add 添加看板")
+        return
+
+    scheduler = DashboardScheduler(registry, args.db_config)
+    if args.once:
+        scheduler.run_once()
+        scheduler.generator.db.disconnect()
+        print(f"📊 刷新统计: {scheduler.stats}")
+        return
+
+    scheduler.run_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+实体配置（entity_config.json）的编译结果与热加载
+把配置编译为解析器使用的只读结构：实体匹配（实体名/表别名 → 表）、查询模式集合、时间字段映射等。
+配置文件变化时（按 mtime 轮询）只重建内容有变化的部分，其余部分直接沿用旧对象；
+新的 EntityCatalog 构建完成后整体替换旧对象，正在进行的解析继续使用旧对象，不会看到半新半旧的配置。
+
+与具体表相关的配置（实体映射、表别名、时间字段）变化时，只需要让引用了这些表或提到这些实体名的
+查询计划失效（见 EntityCatalog.changes）；其余配置参与计划缓存键（config_version），变化时全部失效。
+"""
+
+import hashlib
+import json
+import os
+import time
+from typing import Dict, List, Any, Optional, Tuple
+
+# 与具体表相关的配置段：变化时按表/实体名精确失效计划缓存，不参与 config_version
+TABLE_SECTIONS = ("entity_mappings", "table_aliases", "time_field_mappings")
+# 配置文件检查间隔（秒）：解析查询时最多每隔这么久 stat 一次文件
+DEFAULT_CHECK_INTERVAL = 2.0
+
+
+def _digest(value: Any) -> str:
+    return hashlib.md5(json.dumps(value, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:12]
+
+
+def _filter_comment_fields(mappings: Any) -> Dict[str, Any]:
+    """过滤掉注释字段（以_开头的字段）"""
+    if not isinstance(mappings, dict):
+        return {}
+    return {k: v for k, v in mappings.items() if not k.startswith('_')}
+
+
+def _flatten_entity_mappings(mappings: Any) -> Dict[str, str]:
+    """将嵌套的实体映射展平为一维字典"""
+    flat_mappings = {}
+    for category, entities in _filter_comment_fields(mappings).items():
+        if isinstance(entities, dict):
+            for entity_name, table_name in entities.items():
+                flat_mappings[entity_name] = table_name
+    return flat_mappings
+
+
+def _entity_names(entity_mappings: Dict[str, str], table_aliases: Dict[str, str]) -> Dict[str, str]:
+    """查询中可以识别的实体提及 {名称: 表名}：完整实体名、去掉“表”字的简称（“渠道表” -> “渠道”）、表别名"""
+    names: Dict[str, str] = {}
+    for entity_name, table_name in entity_mappings.items():
+        names.setdefault(entity_name, table_name)
+        if entity_name.endswith('表') and len(entity_name) > 2:
+            names.setdefault(entity_name[:-1], table_name)
+    for alias, table_name in table_aliases.items():
+        names.setdefault(alias.lower(), table_name)
+    return names
+
+
+class EntityCatalog:
+    """entity_config.json 编译后的只读结构，构建后不再修改，重新加载时整体替换"""
+
+    def __init__(self, config: Dict[str, Any], default_patterns: Dict[str, str],
+                 previous: Optional["EntityCatalog"] = None):
+        """config: entity_config.json 内容；previous: 上一版编译结果，内容未变化的部分直接沿用"""
+        self.config = config
+        self.section_digests = {name: _digest(config.get(name, {})) for name in set(config) | set(TABLE_SECTIONS)}
+        # 实体配置指纹（不含与具体表相关的配置段）：变化时计划缓存自然失效
+        self.config_version = _digest({
+            name: digest for name, digest in self.section_digests.items() if name not in TABLE_SECTIONS
+        })
+        self.rebuilt: List[str] = []
+
+        def unchanged(*sections: str) -> bool:
+            return previous is not None and all(
+                previous.section_digests.get(s) == self.section_digests.get(s) for s in sections
+            )
+
+        # 实体匹配
+        if unchanged("entity_mappings", "table_aliases"):
+            self.entity_mappings = previous.entity_mappings
+            self.table_aliases = previous.table_aliases
+            self.entity_names = previous.entity_names
+        else:
+            self.entity_mappings = _flatten_entity_mappings(config.get('entity_mappings', {}))
+            self.table_aliases = _filter_comment_fields(config.get('table_aliases', {}))
+            self.entity_names = _entity_names(self.entity_mappings, self.table_aliases)
+            self.rebuilt.append("实体匹配")
+
+        # 查询模式集合（默认模式 + 自定义模式）
+        if unchanged("custom_query_patterns"):
+            self.query_patterns = previous.query_patterns
+        else:
+            custom_patterns = (config.get('custom_query_patterns') or {}).get('examples', {})
+            self.query_patterns = dict(default_patterns)
+            self.query_patterns.update(custom_patterns)
+            self.rebuilt.append("查询模式")
+
+        # 时间字段映射
+        if unchanged("time_field_mappings"):
+            self.time_field_mappings = previous.time_field_mappings
+        else:
+            self.time_field_mappings = _filter_comment_fields(config.get('time_field_mappings', {}))
+            self.rebuilt.append("时间字段")
+
+        if unchanged("column_aliases"):
+            self.column_aliases = previous.column_aliases
+        else:
+            self.column_aliases = _filter_comment_fields(config.get('column_aliases', {}))
+            self.rebuilt.append("字段别名")
+
+        self.value_dictionary_changed = not unchanged("value_dictionary", "value_aliases")
+        if self.value_dictionary_changed:
+            self.rebuilt.append("取值字典配置")
+
+    def table_sections(self) -> Dict[str, Dict[str, str]]:
+        """与具体表相关的配置（展平后），用于和其他进程记录的版本比较"""
+        return {
+            "entity_mappings": self.entity_mappings,
+            "table_aliases": self.table_aliases,
+            "time_field_mappings": self.time_field_mappings,
+        }
+
+    @staticmethod
+    def changes(old: Dict[str, Dict[str, str]], new: Dict[str, Dict[str, str]]) -> Tuple[set, set]:
+        """比较两版表相关配置，返回 (受影响的表, 受影响的实体名/别名)
+
+        实体名或别名改指向其他表时，新旧两张表和这个名称都算受影响：提到该名称的查询需要重新匹配表。
+        """
+        tables, terms = set(), set()
+        for section in ("entity_mappings", "table_aliases"):
+            before, after = old.get(section) or {}, new.get(section) or {}
+            for name in set(before) | set(after):
+                if before.get(name) == after.get(name):
+                    continue
+                tables.update(t for t in (before.get(name), after.get(name)) if t)
+                terms.add(name.lower())
+                if name.endswith('表') and len(name) > 2:
+                    terms.add(name[:-1].lower())
+        before, after = old.get("time_field_mappings") or {}, new.get("time_field_mappings") or {}
+        tables.update(t for t in set(before) | set(after) if before.get(t) != after.get(t))
+        return tables, terms
+
+
+class ConfigWatcher:
+    """按 mtime 轮询配置文件是否变化（不依赖 inotify，任何平台都可用）"""
+
+    def __init__(self, config_file: Optional[str], check_interval: float = DEFAULT_CHECK_INTERVAL):
+        self.config_file = config_file
+        self.check_interval = check_interval
+        self._signature = self._stat()
+        self._checked_at = time.monotonic()
+
+    def _stat(self) -> Optional[tuple]:
+        if not self.config_file:
+            return None
+        try:
+            st = os.stat(self.config_file)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def poll(self) -> Optional[Dict[str, Any]]:
+        """距上次检查超过 check_interval 且文件有变化时，返回新的配置内容；否则返回 None
+
+        文件不存在或内容不是合法 JSON（例如正在写入）时保留当前配置，文件再次变化时重试。
+        """
+        now = time.monotonic()
+        if self.config_file is None or now - self._checked_at < self.check_interval:
+            return None
+        self._checked_at = now
+        signature = self._stat()
+        if signature is None or signature == self._signature:
+            return None
+        self._signature = signature
+        try:
+            with open(self.config_file, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ 重新加载 {self.config_file} 失败，继续使用当前配置: {e}")
+            return None
+        if not isinstance(config, dict):
+            print(f"⚠️ {self.config_file} 顶层必须是对象，继续使用当前配置")
+            return None
+        return config
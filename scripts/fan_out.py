@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+多库并行查询（fan-out）
+同一套 yt_* 表结构部署在多个区域 MySQL 实例上时，把同一条生成的 SQL 并发发往每个实例，
+COUNT/SUM/AVG/MAX/MIN、分组和趋势明细在本地合并成一份结果；单个实例超时或失败不影响其余结果
+"""
+
+import re
+import time
+from typing import Dict, List, Any, Optional
+
+from shard_pruner import split_aggregates, split_sql
+from prepared_statements import parameterize
+from result_rows import ResultRows
+
+DEFAULT_FAN_OUT_CONFIG = {
+    "enabled": False,
+    # 并发线程数上限
+    "max_workers": 4,
+    # 等待全部实例返回的总超时（秒），超时的实例记为失败，结果标记为部分数据
+    "timeout_seconds": 30,
+}
+
+
+def _order_items(order_clause: str) -> List[tuple]:
+    """ORDER BY a DESC, b → [("a", True), ("b", False)]（去掉表别名前缀）"""
+    if not order_clause:
+        return []
+    text = re.sub(r'^ORDER BY\s+', '', re.sub(r'\b\w+\.', '', order_clause), flags=re.IGNORECASE)
+    items = []
+    for item in text.split(","):
+        tokens = item.split()
+        if tokens:
+            items.append((tokens[0], len(tokens) > 1 and tokens[1].upper() == "DESC"))
+    return items
+
+
+def _sort_rows(rows: ResultRows, order_clause: str) -> ResultRows:
+    """按 ORDER BY 在本地排序（直接排序底层元组）；引用了结果中不存在的列时保持原顺序"""
+    items = _order_items(order_clause)
+    if not rows or not items or any(col not in rows.positions for col, _ in items):
+        return rows
+    # 从最后一个排序键开始做稳定排序；NULL 按 MySQL 习惯视为最小值
+    for col, desc in reversed(items):
+        i = rows.positions[col]
+        rows.rows.sort(key=lambda r: (r[i] is not None, r[i] if r[i] is not None else 0), reverse=desc)
+    return rows
+
+
+def _apply_limit(rows: ResultRows, limit_clause: str) -> ResultRows:
+    match = re.search(r'\d+', limit_clause or "")
+    return rows[:int(match.group(0))] if match else rows
+
+
+def merge_aggregate_rows(plan: Dict[str, Any], row_sets: List[ResultRows]) -> ResultRows:
+    """合并各实例的部分聚合结果（split_aggregates 的 inner_sql 执行结果）"""
+    groups: Dict[tuple, Dict[str, Any]] = {}
+    for rows in row_sets:
+        for row in rows:
+            key = tuple(row.get(name) for name in plan["group_names"])
+            merged = groups.get(key)
+            if merged is None:
+                merged = {name: row.get(name) for name in plan["group_names"]}
+                groups[key] = merged
+            for merge in plan["merges"]:
+                name, func = merge["name"], merge["func"]
+                if func == "AVG":
+                    for part in (f"{name}_sum", f"{name}_count"):
+                        value = row.get(part)
+                        if value is not None:
+                            merged[part] = merged.get(part, 0) + value
+                    continue
+                value = row.get(name)
+                if value is None:
+                    merged.setdefault(name, None)
+                    continue
+                current = merged.get(name)
+                if current is None:
+                    merged[name] = value
+                elif func == "SUM":
+                    merged[name] = current + value
+                elif func == "MAX":
+                    merged[name] = max(current, value)
+                elif func == "MIN":
+                    merged[name] = min(current, value)
+
+    result = []
+    for merged in groups.values():
+        for merge in plan["merges"]:
+            if merge["func"] == "AVG":
+                name = merge["name"]
+                total = merged.pop(f"{name}_sum", None)
+                count = merged.pop(f"{name}_count", None)
+                merged[name] = total / count if total is not None and count else None
+        result.append(merged)
+
+    # 无分组的聚合在所有实例都没有行时，仍返回一行（与单库 COUNT(*) 的行为一致）
+    if not result and not plan["group_names"]:
+        result.append({m["name"]: (0 if m["func"] == "SUM" else None) for m in plan["merges"]})
+    columns = plan["group_names"] + [m["name"] for m in plan["merges"]]
+    return _apply_limit(_sort_rows(ResultRows.from_records(columns, result), plan["order"]), plan["limit"])
+
+
+class FanOutExecutor:
+    def __init__(self, connectors: Dict[str, Any], config: Optional[Dict[str, Any]] = None):
+        """connectors: {实例名: SmartDBConnector}，每个实例使用各自的连接"""
+        self.connectors = connectors
+        self.config = dict(DEFAULT_FAN_OUT_CONFIG)
+        self.config.update(config or {})
+
+    @classmethod
+    def from_connector(cls, primary) -> Optional["FanOutExecutor"]:
+        """按 db_config.json 的 fan_out.databases 构建执行器；未配置时返回 None
+
+        每个实例未填写的字段（user/password/database/charset 等）继承主配置，query_guard 也沿用主配置；
+        主库本身也参与查询。
+        """
+        fan_out = primary.config.get("fan_out") if isinstance(primary.config, dict) else None
+        if not isinstance(fan_out, dict) or not fan_out.get("databases"):
+            return None
+
+        base = primary._connection_params()
+        connectors = {primary.config.get("name") or "primary": primary}
+        for i, database in enumerate(fan_out["databases"]):
+            config = dict(base)
+            config.update({k: v for k, v in database.items() if k != "name"})
+            if "query_guard" in primary.config:
+                config["query_guard"] = primary.config["query_guard"]
+            name = database.get("name") or f"db{i + 1}:{config.get('host')}"
+            connectors[name] = type(primary)(primary.config_file, config=config)
+        return cls(connectors, {k: v for k, v in fan_out.items() if k != "databases"})
+
+    @staticmethod
+    def validate(config: Any) -> List[str]:
+        """校验 fan_out 配置，返回错误列表"""
+        if not isinstance(config, dict):
+            return ["fan_out 必须是对象"]
+        errors = []
+        databases = config.get("databases", [])
+        if not isinstance(databases, list):
+            errors.append("fan_out.databases 必须是数组")
+        else:
+            for i, database in enumerate(databases):
+                if not isinstance(database, dict) or not database.get("host"):
+                    errors.append(f"fan_out.databases[{i}] 缺少 host")
+        for field in ("max_workers", "timeout_seconds"):
+            if field in config and not isinstance(config[field], (int, float)):
+                errors.append(f"fan_out.{field} 需要数字")
+        return errors
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.config.get("enabled"))
+
+    def _run_one(self, name: str, db, sql: str, params: Optional[list] = None,
+                 cancel_event=None) -> Dict[str, Any]:
+        start = time.time()
+        connected = db.connection is not None and db.connection.is_connected()
+        if not connected and not db.connect():
+            result = {"success": False, "error": "数据库连接失败"}
+        else:
+            # 实例查询的截止时间不超过 timeout_seconds：超时的实例在服务器上被取消，而不是继续运行
+            limit = db.query_timeout["seconds"]
+            timeout = min(limit, self.config["timeout_seconds"]) if limit else self.config["timeout_seconds"]
+            result = dict(db.execute_query(sql, None if params is None else tuple(params),
+                                           timeout=timeout, cancel_event=cancel_event))
+        result["elapsed"] = round(time.time() - start, 3)
+        return result
+
+    def execute(self, sql: str, cancel_event=None) -> Dict[str, Any]:
+        """在所有实例上并发执行并合并结果
+
+        聚合查询各实例执行部分聚合（AVG 拆成 SUM+COUNT）后在本地合并；明细查询合并后按原 ORDER BY/LIMIT 截取。
+        返回结构与 execute_query 一致，另带 sources（每个实例的状态）和 partial（是否缺少部分实例的数据）。
+        cancel_event 被设置时取消所有实例上仍在执行的查询。
+        """
+        from concurrent.futures import ThreadPoolExecutor, wait
+
+        plan = split_aggregates(sql)
+        run_sql = plan["inner_sql"] if plan else sql
+        # 拆分聚合在字面 SQL 上进行，发往各实例前再参数化（各实例上复用预处理语句）
+        template, params = parameterize(run_sql)
+
+        executor = ThreadPoolExecutor(max_workers=max(1, min(int(self.config["max_workers"]), len(self.connectors))))
+        futures = {
+            executor.submit(self._run_one, name, db, template, params, cancel_event): name
+            for name, db in self.connectors.items()
+        }
+        done, _ = wait(futures, timeout=self.config["timeout_seconds"])
+        # 超时的实例不再等待（线程在查询返回后自行结束）
+        executor.shutdown(wait=False)
+
+        sources, row_sets, columns = [], [], []
+        for future, name in futures.items():
+            if future not in done:
+                sources.append({"name": name, "success": False, "error": f"超时（{self.config['timeout_seconds']}s）"})
+                continue
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"success": False, "error": str(e)}
+            if result.get("partial") and result.get("timeout"):
+                # 实例超时只读到部分行：部分聚合与其他实例合并会得到错误的总数，按未返回处理
+                result = {"success": False, "error": result["warning"], "elapsed": result.get("elapsed")}
+            if result.get("success"):
+                row_sets.append(result["data"])
+                columns = columns or result["columns"]
+                sources.append({"name": name, "success": True, "row_count": result["row_count"],
+                                "elapsed": result.get("elapsed")})
+            else:
+                sources.append({"name": name, "success": False, "error": result.get("error"),
+                                "elapsed": result.get("elapsed")})
+
+        if not row_sets:
+            errors = "; ".join(f"{s['name']}: {s['error']}" for s in sources)
+            return {"success": False, "error": f"所有数据库均执行失败: {errors}", "sources": sources}
+
+        if plan:
+            data = merge_aggregate_rows(plan, row_sets)
+            columns = data.columns
+        else:
+            parts = split_sql(sql)
+            data = ResultRows(columns, [values for rows in row_sets for values in rows.rows])
+            data = _apply_limit(_sort_rows(data, parts["order"]), parts["limit"])
+
+        failed = [s["name"] for s in sources if not s["success"]]
+        if failed:
+            print(f"⚠️ 以下数据库未返回结果，看板为部分数据: {', '.join(failed)}")
+        return {
+            "success": True,
+            "data": data,
+            "columns": columns,
+            "row_count": len(data),
+            "sources": sources,
+            "partial": bool(failed),
+        }
+
+    def disconnect(self):
+        for db in self.connectors.values():
+            db.disconnect()
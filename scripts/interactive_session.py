@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+交互式查询会话（--interactive）
+整个会话复用同一个 SmartDashboardGenerator：数据库连接、表结构缓存、计划缓存和列值字典只建立一次，
+连续提问不再重复启动进程、重连和发现表。启动后在后台预取表结构，与用户输入第一个问题并行进行。
+
+直接输入自然语言查询即可执行；以冒号开头的是会话命令，省略查询时作用于上一个查询：
+
+  :sql [查询]                  只生成 SQL，不执行
+  :explain [查询]              EXPLAIN 生成的 SQL，显示估算行数、索引和成本守卫决策
+  :export 格式 [路径] [查询]    流式导出为 parquet / arrow / csv
+  :html [路径]                 用上一个查询结果生成 HTML 看板
+  :timings                     上一个查询各阶段耗时、预取耗时和计划缓存命中情况
+  :help                        显示帮助
+  :quit                        退出（也可以用 Ctrl-D）
+"""
+
+import threading
+import time
+from typing import Dict, Any, Optional
+
+from result_export import EXPORT_MODES, FILE_EXTENSIONS
+from prepared_statements import plan_statement
+from smart_dashboard_generator import _print_result_summary
+
+# readline 只用于行编辑和历史记录（上下方向键），Windows 等环境没有时不影响使用
+try:
+    import readline  # noqa: F401
+except ImportError:
+    pass
+
+PROMPT = "📝 > "
+HELP_TEXT = __doc__.split("\n\n", 2)[2].rstrip()
+
+
+class InteractiveSession:
+    def __init__(self, generator):
+        """generator 需要以 keep_connection=True 创建，查询结束后保留连接供下一次使用"""
+        self.generator = generator
+        self.db = generator.db
+        self.parser = generator.parser
+        self.last_query: Optional[str] = None
+        self.last_result: Optional[Dict[str, Any]] = None
+        self.prefetch_seconds: Optional[float] = None
+        self._prefetch_thread: Optional[threading.Thread] = None
+        self._commands = {
+            "sql": self._cmd_sql,
+            "explain": self._cmd_explain,
+            "export": self._cmd_export,
+            "html": self._cmd_html,
+            "timings": self._cmd_timings,
+            "help": self._cmd_help,
+        }
+
+    # ---------- 预取 ----------
+
+    def start_prefetch(self):
+        """连接数据库，并在后台线程预取表结构版本、全部表结构、分表族、外键和列值字典"""
+        if not self.db.connect():
+            print("⚠️ 数据库连接失败，将在执行查询时重试")
+            return
+        self._prefetch_thread = threading.Thread(target=self._prefetch, name="schema-prefetch", daemon=True)
+        self._prefetch_thread.start()
+
+    def _prefetch(self):
+        start = time.perf_counter()
+        self.db.get_schema_version()
+        self.db.discover_tables()
+        self.db.get_shard_families()
+        self.db.get_foreign_keys()
+        self.parser.value_dictionary.start_background(sorted(set(self.parser.entity_mappings.values())))
+        self.prefetch_seconds = time.perf_counter() - start
+
+    def _wait_prefetch(self):
+        """执行命令前等待预取完成（主连接不能被两个线程同时使用）"""
+        if self._prefetch_thread is not None and self._prefetch_thread.is_alive():
+            print("⏳ 正在等待表结构预取完成...")
+            self._prefetch_thread.join()
+
+    # ---------- 主循环 ----------
+
+    def run(self):
+        print("💬 交互模式：直接输入查询，:help 查看命令，:quit 或 Ctrl-D 退出")
+        self.start_prefetch()
+        try:
+            while True:
+                try:
+                    line = input(PROMPT).strip()
+                except EOFError:
+                    print()
+                    break
+                except KeyboardInterrupt:
+                    print()
+                    continue
+                if not line:
+                    continue
+                if line in (":quit", ":q", ":exit"):
+                    break
+                try:
+                    self.handle(line)
+                except KeyboardInterrupt:
+                    print("\n⚠️ 已中断")
+        finally:
+            self.close()
+
+    def handle(self, line: str):
+        """执行一行输入：会话命令或自然语言查询"""
+        self._wait_prefetch()
+        if not line.startswith(":"):
+            self._run_query(line)
+            return
+
+        name, _, rest = line[1:].partition(" ")
+        command = self._commands.get(name.lower())
+        if command is None:
+            print(f"❌ 未知命令: :{name}（输入 :help 查看可用命令）")
+            return
+        command(rest.strip())
+
+    def close(self):
+        if self.generator.fan_out is not None:
+            self.generator.fan_out.disconnect()
+        self.db.disconnect()
+        if self.generator.snapshots is not None:
+            self.generator.snapshots.close()
+
+    # ---------- 命令 ----------
+
+    def _resolve_query(self, query: str) -> Optional[str]:
+        query = query or self.last_query
+        if not query:
+            print("❌ 请给出查询（还没有上一个查询）")
+        return query
+
+    def _run_query(self, query: str):
+        result = self.generator.process_query(query)
+        self.last_query = query
+        self.last_result = result
+        if not result.get("success"):
+            print(f"❌ 查询失败: {result.get('error', '未知错误')}")
+            return
+        _print_result_summary(result)
+        timings = result["timings"]
+        print(f"⏱️ 耗时 {timings['total_ms']}ms（解析 {timings['parse_ms']}ms，执行 {timings['execute_ms']}ms）")
+
+    def _plan(self, query: str) -> Optional[Dict[str, Any]]:
+        plan = self.parser.parse_query(query)
+        self.last_query = query
+        if not plan.get("success"):
+            print(f"❌ 解析失败: {plan.get('error', '未知错误')}")
+            return None
+        return plan
+
+    def _cmd_sql(self, query: str):
+        query = self._resolve_query(query)
+        plan = self._plan(query) if query else None
+        if plan is None:
+            return
+        print("📋 匹配到表:", plan.get("primary_table"))
+        if plan.get("from_cache"):
+            print("⚡ 命中查询计划缓存")
+        print("📌 生成的SQL:")
+        print(plan.get("sql_query"))
+
+    def _cmd_explain(self, query: str):
+        query = self._resolve_query(query)
+        plan = self._plan(query) if query else None
+        if plan is None:
+            return
+        print("📌 生成的SQL:")
+        print(plan["sql_query"])
+        explained = self.db.explain_query(*plan_statement(plan))
+        if not explained["success"]:
+            print(f"❌ {explained['error']}")
+            return
+        analysis, decision = explained["analysis"], explained["decision"]
+        print(f"🔎 估算扫描行数: {analysis['estimated_rows']}")
+        if analysis["query_cost"] is not None:
+            print(f"💰 查询成本: {analysis['query_cost']}")
+        print(f"🗂️ 使用的索引: {', '.join(analysis['indexes_used']) or '无'}")
+        if analysis["full_scan_tables"]:
+            print(f"⚠️ 全表扫描: {', '.join(analysis['full_scan_tables'])}")
+        reason = f"（{decision['reason']}）" if decision["reason"] else ""
+        guard = "" if self.db.query_guard.enabled else "，query_guard 未开启，仅供参考"
+        print(f"🛡️ 成本守卫决策: {decision['decision']}{reason}{guard}")
+
+    def _cmd_export(self, rest: str):
+        mode, _, rest = rest.partition(" ")
+        if mode not in EXPORT_MODES:
+            print(f"❌ 用法: :export {'|'.join(EXPORT_MODES)} [路径{FILE_EXTENSIONS.get(mode, '')}] [查询]")
+            return
+        # 以该格式扩展名结尾的第一个参数视为输出路径，其余为查询
+        output_file = None
+        first, _, remainder = rest.strip().partition(" ")
+        if first.lower().endswith(FILE_EXTENSIONS[mode]):
+            output_file, rest = first, remainder
+        query = self._resolve_query(rest.strip())
+        if not query:
+            return
+        result = self.generator.export_query(query, mode, output_file=output_file)
+        self.last_query = query
+        if not result.get("success"):
+            print(f"❌ {result.get('error', '导出失败')}")
+            return
+        print(f"✅ 已导出 {result['row_count']} 行（{result['batches']} 批，耗时 {result['elapsed']}s）: {result['path']}")
+
+    def _cmd_html(self, output_file: str):
+        if self.last_result is None:
+            print("❌ 还没有查询结果，请先执行一个查询")
+            return
+        self.generator.create_dashboard(
+            self.last_result.get("original_query", self.last_query or ""),
+            output_file=output_file or None,
+            query_result=self.last_result,
+        )
+
+    def _cmd_timings(self, _rest: str):
+        timings = (self.last_result or {}).get("timings")
+        if timings:
+            print(f"⏱️ 上一个查询: {self.last_result.get('original_query')}")
+            # 失败的查询只有已完成阶段的耗时
+            for stage, label in (("parse_ms", "解析/计划"), ("execute_ms", "执行SQL  "), ("analyze_ms", "统计/图表")):
+                if stage in timings:
+                    print(f"  {label} {timings[stage]}ms")
+            print(f"  合计      {timings['total_ms']}ms")
+        else:
+            print("⏱️ 还没有执行过查询")
+        if self.prefetch_seconds is not None:
+            print(f"📦 表结构预取: {self.prefetch_seconds * 1000:.1f}ms（{len(self.db.table_cache)} 个表）")
+        stats = self.parser.plan_cache.stats()
+        print(f"⚡ 计划缓存: {stats['entries']} 条，命中 {stats['hits']} / 未命中 {stats['misses']}"
+              f"（命中率 {stats['hit_ratio']:.0%}）")
+
+    def _cmd_help(self, _rest: str):
+        print(HELP_TEXT)
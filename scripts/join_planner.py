@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+联表规划器
+基于 information_schema 中的外键（KEY_COLUMN_USAGE）、索引（STATISTICS）和行数估算，
+为主表和相关表选择可以走索引的连接键与连接顺序；找不到可走索引的连接键时宁可不联表，
+绝不生成笛卡尔积或两侧都全表扫描的 JOIN
+"""
+
+import re
+from typing import Dict, List, Any, Optional
+
+from smart_db_connector import SmartDBConnector
+
+# 同名但不代表关联关系的列
+NON_JOIN_COLUMNS = {
+    'created_at', 'updated_at', 'create_time', 'update_time', 'status', 'type',
+    'name', 'remark', 'deleted', 'is_deleted', 'version',
+}
+
+
+class JoinPlanner:
+    def __init__(self, db_connector: SmartDBConnector):
+        self.db = db_connector
+
+    def find_join_key(self, left: str, right: str) -> Optional[Dict[str, Any]]:
+        """找两张表之间最好的连接键
+
+        优先级：声明的外键 > 两侧都有索引的同名/xxx_id 列 > 只有一侧有索引；
+        两侧都没有索引的候选直接丢弃。
+        """
+        left_info = self.db.get_table_structure(left)
+        right_info = self.db.get_table_structure(right)
+        if not left_info or not right_info:
+            return None
+
+        candidates = []
+
+        for fk in self.db.get_foreign_keys():
+            if fk["table"] == left and fk["referenced_table"] == right:
+                candidates.append((fk["column"], fk["referenced_column"], "foreign_key"))
+            elif fk["table"] == right and fk["referenced_table"] == left:
+                candidates.append((fk["referenced_column"], fk["column"], "foreign_key"))
+
+        left_cols = left_info.get("column_names", [])
+        right_cols = right_info.get("column_names", [])
+        left_pks = left_info.get("primary_keys", [])
+        right_pks = right_info.get("primary_keys", [])
+
+        # 同名列（排除两侧各自的自增主键 id = id）
+        for col in set(left_cols) & set(right_cols):
+            if col.lower() in NON_JOIN_COLUMNS:
+                continue
+            if col in left_pks and col in right_pks and col.lower() == "id":
+                continue
+            candidates.append((col, col, "inferred"))
+
+        # xxx_id -> xxx 表的单列主键
+        candidates.extend(self._id_reference_candidates(left_cols, right, right_pks, reverse=False))
+        candidates.extend(self._id_reference_candidates(right_cols, left, left_pks, reverse=True))
+
+        best = None
+        for left_col, right_col, source in candidates:
+            left_index = self._index_on(left, left_col)
+            right_index = self._index_on(right, right_col)
+            if not left_index and not right_index:
+                continue
+
+            score = 3.0 if source == "foreign_key" else 1.0
+            score += (1.0 if left_index else 0.0) + (1.0 if right_index else 0.0)
+            if (left_index and left_index["unique"]) or (right_index and right_index["unique"]):
+                score += 0.5
+
+            edge = {
+                "left_table": left,
+                "left_column": left_col,
+                "right_table": right,
+                "right_column": right_col,
+                "source": source,
+                "left_index": left_index["name"] if left_index else None,
+                "right_index": right_index["name"] if right_index else None,
+                "score": score,
+            }
+            if best is None or edge["score"] > best["score"]:
+                best = edge
+        return best
+
+    def _id_reference_candidates(self, columns: List[str], target: str, target_pks: List[str],
+                                 reverse: bool) -> List[tuple]:
+        if len(target_pks) != 1:
+            return []
+        target_tokens = set(re.split(r'[_\s-]+', target.lower()))
+        found = []
+        for col in columns:
+            match = re.match(r'^(\w+?)_?id$', col.lower())
+            if match and match.group(1) in target_tokens:
+                pair = (target_pks[0], col) if reverse else (col, target_pks[0])
+                found.append((pair[0], pair[1], "inferred"))
+        return found
+
+    def _index_on(self, table: str, column: str) -> Optional[Dict[str, Any]]:
+        """返回以 column 为首列的索引（优先唯一索引、其次基数更高的）"""
+        best = None
+        for name, index in self.db.get_index_info(table).items():
+            if not index["columns"] or index["columns"][0] != column:
+                continue
+            candidate = {"name": name, "unique": index["unique"], "cardinality": index["cardinality"]}
+            if best is None or (candidate["unique"], candidate["cardinality"]) > (best["unique"], best["cardinality"]):
+                best = candidate
+        return best
+
+    def plan(self, primary_table: str, candidate_tables: List[str]) -> List[Dict[str, Any]]:
+        """规划连接顺序（贪心）
+
+        每一步在“已连接的表 × 剩余候选表”中选分数最高的连接键，分数相同时先连行数少的表；
+        与已连接部分没有可走索引连接键的候选表会被放弃。
+        返回按连接顺序排列的 JOIN 描述（alias 为 t1, t2 ...，主表为 t0）。
+        """
+        remaining = [t for t in dict.fromkeys(candidate_tables) if t and t != primary_table]
+        if not remaining:
+            return []
+
+        table_rows = self.db.get_table_rows([primary_table] + remaining)
+        aliases = {primary_table: "t0"}
+        joins: List[Dict[str, Any]] = []
+
+        while remaining:
+            best = None
+            for joined in list(aliases.keys()):
+                for table in remaining:
+                    edge = self.find_join_key(joined, table)
+                    if edge is None:
+                        continue
+                    rank = (edge["score"], -table_rows.get(table, 0))
+                    if best is None or rank > best[0]:
+                        best = (rank, edge)
+            if best is None:
+                break
+
+            edge = best[1]
+            table = edge["right_table"]
+            alias = f"t{len(aliases)}"
+            aliases[table] = alias
+            remaining.remove(table)
+            joins.append({
+                "table": table,
+                "alias": alias,
+                "parent_table": edge["left_table"],
+                "parent_alias": aliases[edge["left_table"]],
+                "on": f"{aliases[edge['left_table']]}.{edge['left_column']} = {alias}.{edge['right_column']}",
+                "left_column": edge["left_column"],
+                "right_column": edge["right_column"],
+                "source": edge["source"],
+                "index": edge["right_index"] or edge["left_index"],
+                "estimated_rows": table_rows.get(table, 0),
+            })
+
+        return joins
+
+    @staticmethod
+    def path_to(joins: List[Dict[str, Any]], table: str) -> List[Dict[str, Any]]:
+        """从主表连接到指定表所需的最少 JOIN（保持原有连接顺序）"""
+        by_table = {j["table"]: j for j in joins}
+        needed = set()
+        current = table
+        while current in by_table:
+            needed.add(current)
+            current = by_table[current]["parent_table"]
+        return [j for j in joins if j["table"] in needed]
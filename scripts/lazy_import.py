@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+按需导入
+MySQL 驱动、NumPy、pyarrow 等导入耗时较长或可能未安装的依赖在第一次使用时才导入：
+命中计划缓存的 --mode sql、配置检查等用不到它们的命令行路径不加载。
+每个模块只尝试导入一次，未安装的结果同样缓存，之后的调用不再重试。
+"""
+
+import importlib
+from typing import Any, Dict
+
+_UNLOADED = object()
+_modules: Dict[str, Any] = {}
+
+
+class MissingDependencyError(ImportError):
+    """必需的依赖未安装，消息为安装提示（由命令行入口打印）"""
+
+
+def optional_module(name: str):
+    """返回模块（如 "numpy"、"pyarrow.parquet"），未安装时返回 None"""
+    module = _modules.get(name, _UNLOADED)
+    if module is _UNLOADED:
+        try:
+            module = importlib.import_module(name)
+        except ImportError:
+            module = None
+        _modules[name] = module
+    return module
+
+
+def require_module(name: str, install_hint: str):
+    """返回模块，未安装时抛出 MissingDependencyError(install_hint)"""
+    module = optional_module(name)
+    if module is None:
+        raise MissingDependencyError(install_hint)
+    return module
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+查询日志回放负载测试
+把一份查询日志（自然语言查询，或 --sql 时的 SQL）按目标 QPS / 并发度回放到同一个常驻的看板生成器上，报告：
+
+- 吞吐量、整体延迟 p50 / p95 / p99（开环模式从计划发出时间算起，包含排队时间）
+- 各阶段（parse / execute / analyze / render）耗时分位数
+- 错误率（按错误类型）、计划缓存 / 预处理语句命中率、共享结果次数
+
+配合 replay_db 的录制/回放替身数据库，先 --record 对真实数据库录制一次，之后 --replay 不连接 MySQL
+即可离线重复测量；--baseline 与之前保存的报告比较，延迟、吞吐量或错误率退化超过阈值时以退出码 1 结束。
+
+日志格式：每行一条查询文本，或 JSON 对象（取 "query" 字段，--sql 时取 "sql" 字段），慢查询日志可以直接使用；
+空行和 # 开头的行忽略。
+"""
+
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from typing import Dict, List, Any, Callable, Optional
+
+STAGES = ("parse", "execute", "analyze", "render", "total")
+PERCENTILES = (50, 95, 99)
+# 与基线比较时允许的退化幅度（百分比）
+DEFAULT_MAX_REGRESSION_PCT = 20
+# 错误率允许增加的绝对值（百分点）
+ERROR_RATE_TOLERANCE = 1.0
+
+
+def load_log(path: str, sql: bool = False) -> List[str]:
+    """读取查询日志，返回查询（或 SQL）列表"""
+    field = "sql" if sql else "query"
+    entries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                try:
+                    value = json.loads(line).get(field)
+                except json.JSONDecodeError:
+                    value = None
+                if value:
+                    entries.append(value)
+                continue
+            entries.append(line)
+    return entries
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """最近秩法分位数"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def _distribution(samples: List[float]) -> Dict[str, float]:
+    summary = {f"p{p}": round(percentile(samples, p), 1) for p in PERCENTILES}
+    summary["mean"] = round(statistics.fmean(samples), 1) if samples else 0.0
+    summary["max"] = round(max(samples), 1) if samples else 0.0
+    summary["count"] = len(samples)
+    return summary
+
+
+def query_runner(generator, dashboard: bool = False) -> Callable[[str], Dict[str, Any]]:
+    """自然语言查询：process_query（dashboard=True 时再生成看板 HTML，计入 render 阶段）"""
+    def run(query: str) -> Dict[str, Any]:
+        result = generator.process_query(query)
+        stages = dict(result.get("timings") or {})
+        if result.get("success") and dashboard:
+            started = time.perf_counter()
+            generator.generate_dashboard_html(result)
+            stages["render_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return {
+            "success": bool(result.get("success")),
+            "error": None if result.get("success") else result.get("type", "error"),
+            "partial": bool(result.get("partial")),
+            "stages": stages,
+        }
+    return run
+
+
+def sql_runner(db) -> Callable[[str], Dict[str, Any]]:
+    """SQL：直接 execute_query，只有 execute 阶段"""
+    def run(sql: str) -> Dict[str, Any]:
+        started = time.perf_counter()
+        result = db.execute_query(sql)
+        return {
+            "success": bool(result.get("success")),
+            "error": None if result.get("success") else ("timeout" if result.get("timeout") else "sql_error"),
+            "partial": bool(result.get("timeout")) and bool(result.get("success")),
+            "stages": {"execute_ms": round((time.perf_counter() - started) * 1000, 1)},
+        }
+    return run
+
+
+def _timed(run: Callable[[str], Dict[str, Any]], item: str, scheduled: Optional[float]) -> Dict[str, Any]:
+    began = time.perf_counter()
+    try:
+        sample = run(item)
+    except Exception as e:
+        sample = {"success": False, "error": f"exception:{type(e).__name__}", "partial": False, "stages": {}}
+    finished = time.perf_counter()
+    sample["latency_ms"] = (finished - (scheduled if scheduled is not None else began)) * 1000
+    sample["queue_ms"] = (began - scheduled) * 1000 if scheduled is not None else 0.0
+    return sample
+
+
+def run_load(run: Callable[[str], Dict[str, Any]], items: List[str], qps: float = 0,
+             concurrency: int = 4) -> Dict[str, Any]:
+    """回放 items，返回 {"samples", "wall_seconds"}
+
+    qps > 0 为开环模式：按固定间隔发出请求（不等待前一个完成），延迟包含在线程池中排队的时间；
+    qps = 0 为闭环模式：concurrency 个工作线程一个接一个地执行，测最大吞吐量。
+    """
+    futures = []
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="load-test") as executor:
+        started = time.perf_counter()
+        for i, item in enumerate(items):
+            scheduled = None
+            if qps > 0:
+                scheduled = started + i / qps
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            futures.append(executor.submit(_timed, run, item, scheduled))
+        samples = [future.result() for future in futures]
+    return {"samples": samples, "wall_seconds": time.perf_counter() - started}
+
+
+class MetricDeltas:
+    """运行期间的缓存命中等计数（取 monitoring 计数器在运行前后的差值）"""
+
+    def __init__(self):
+        from monitoring import PLAN_CACHE_LOOKUPS, DB_PREPARED_STATEMENTS, DB_SHARED_RESULTS
+        self._counters = {
+            "plan_cache_hit": lambda: PLAN_CACHE_LOOKUPS.value(result="hit"),
+            "plan_cache_miss": lambda: PLAN_CACHE_LOOKUPS.value(result="miss"),
+            "prepared_hit": lambda: DB_PREPARED_STATEMENTS.value(result="hit"),
+            "prepared_miss": lambda: DB_PREPARED_STATEMENTS.value(result="miss"),
+            "shared_results": lambda: DB_SHARED_RESULTS.value(),
+        }
+        self._start = self._read()
+
+    def _read(self) -> Dict[str, float]:
+        return {name: read() for name, read in self._counters.items()}
+
+    def delta(self) -> Dict[str, Any]:
+        now = self._read()
+        diff = {name: int(now[name] - self._start[name]) for name in now}
+
+        def rate(hit: int, miss: int) -> Optional[float]:
+            return round(hit * 100 / (hit + miss), 1) if hit + miss else None
+
+        return {
+            "plan_cache": {"hits": diff["plan_cache_hit"], "misses": diff["plan_cache_miss"],
+                           "hit_rate_pct": rate(diff["plan_cache_hit"], diff["plan_cache_miss"])},
+            "prepared_statements": {"hits": diff["prepared_hit"], "misses": diff["prepared_miss"],
+                                    "hit_rate_pct": rate(diff["prepared_hit"], diff["prepared_miss"])},
+            "shared_results": diff["shared_results"],
+        }
+
+
+def build_report(run: Dict[str, Any], settings: Dict[str, Any]) -> Dict[str, Any]:
+    samples = run["samples"]
+    total = len(samples)
+    errors: Dict[str, int] = {}
+    for sample in samples:
+        if not sample["success"]:
+            errors[sample["error"]] = errors.get(sample["error"], 0) + 1
+    stages = {}
+    for stage in STAGES:
+        values = [s["stages"][f"{stage}_ms"] for s in samples if f"{stage}_ms" in s["stages"]]
+        if values:
+            stages[stage] = _distribution(values)
+    return {
+        "settings": settings,
+        "requests": total,
+        "wall_seconds": round(run["wall_seconds"], 3),
+        "throughput_qps": round(total / run["wall_seconds"], 2) if run["wall_seconds"] > 0 else 0.0,
+        "latency_ms": _distribution([s["latency_ms"] for s in samples]),
+        "queue_ms": _distribution([s["queue_ms"] for s in samples]),
+        "stages_ms": stages,
+        "error_rate_pct": round(sum(errors.values()) * 100 / total, 2) if total else 0.0,
+        "errors": errors,
+        "partial": sum(1 for s in samples if s["partial"]),
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any],
+            max_regression_pct: float = DEFAULT_MAX_REGRESSION_PCT) -> List[str]:
+    """与基线报告比较，返回退化说明列表（空列表表示没有退化）"""
+    regressions = []
+    limit = 1 + max_regression_pct / 100
+    for key in ("p50", "p95", "p99"):
+        current = report["latency_ms"].get(key, 0)
+        previous = baseline.get("latency_ms", {}).get(key, 0)
+        if previous > 0 and current > previous * limit:
+            regressions.append(f"延迟 {key}: {previous}ms → {current}ms（+{(current / previous - 1) * 100:.0f}%）")
+    for stage, summary in report["stages_ms"].items():
+        previous = baseline.get("stages_ms", {}).get(stage, {}).get("p95", 0)
+        if previous > 0 and summary["p95"] > previous * limit:
+            regressions.append(f"{stage} 阶段 p95: {previous}ms → {summary['p95']}ms")
+    # 开环模式的吞吐量由目标 QPS 决定，只与同样设置的基线比较
+    previous = baseline.get("throughput_qps", 0)
+    same_load = all(baseline.get("settings", {}).get(key) == report["settings"].get(key)
+                    for key in ("qps", "concurrency"))
+    if same_load and previous > 0 and report["throughput_qps"] < previous / limit:
+        regressions.append(f"吞吐量: {previous} → {report['throughput_qps']} 次/秒")
+    previous = baseline.get("error_rate_pct", 0)
+    if report["error_rate_pct"] > previous + ERROR_RATE_TOLERANCE:
+        regressions.append(f"错误率: {previous}% → {report['error_rate_pct']}%")
+    return regressions
+
+
+def print_report(report: Dict[str, Any]):
+    settings = report["settings"]
+    mode = f"开环 {settings['qps']} 次/秒" if settings["qps"] else "闭环"
+    print(f"📈 负载测试：{report['requests']} 次请求，{mode}，并发 {settings['concurrency']}，"
+          f"耗时 {report['wall_seconds']}s，吞吐量 {report['throughput_qps']} 次/秒")
+    latency = report["latency_ms"]
+    print(f"  延迟（毫秒）  p50 {latency['p50']:>8}  p95 {latency['p95']:>8}  p99 {latency['p99']:>8}  最大 {latency['max']:>8}")
+    if settings["qps"]:
+        queue = report["queue_ms"]
+        print(f"  排队（毫秒）  p50 {queue['p50']:>8}  p95 {queue['p95']:>8}  p99 {queue['p99']:>8}  最大 {queue['max']:>8}")
+    for stage, summary in report["stages_ms"].items():
+        print(f"  {stage:<12} p50 {summary['p50']:>8}  p95 {summary['p95']:>8}  p99 {summary['p99']:>8}  最大 {summary['max']:>8}")
+    errors = "，".join(f"{name} {count}" for name, count in report["errors"].items())
+    print(f"  错误率 {report['error_rate_pct']}%" + (f"（{errors}）" if errors else "")
+          + (f"，部分结果 {report['partial']} 次" if report["partial"] else ""))
+    caches = report.get("caches")
+    if caches:
+        plan, prepared = caches["plan_cache"], caches["prepared_statements"]
+        print(f"  计划缓存命中 {plan['hits']}/{plan['hits'] + plan['misses']}"
+              + (f"（{plan['hit_rate_pct']}%）" if plan["hit_rate_pct"] is not None else "")
+              + f"，预处理语句命中 {prepared['hits']}/{prepared['hits'] + prepared['misses']}"
+              + (f"（{prepared['hit_rate_pct']}%）" if prepared["hit_rate_pct"] is not None else "")
+              + f"，共享结果 {caches['shared_results']} 次")
+    stand_in = report.get("stand_in")
+    if stand_in:
+        print(f"  替身数据库（{stand_in['mode']}）: 夹具 {stand_in['fixtures']} 条，回放命中 {stand_in['hits']}，"
+              f"新录制 {stand_in['recorded']}，未录制 {stand_in['unrecorded']}")
+        for key in stand_in["unrecorded_samples"][:5]:
+            print(f"    ⚠️ 未录制: {key[:150]}")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="查询日志回放负载测试")
+    parser.add_argument("log", help="查询日志（每行一条查询，或 JSON Lines / 慢查询日志）")
+    parser.add_argument("--sql", action="store_true", help="日志中是 SQL（JSON 取 sql 字段），直接 execute_query")
+    parser.add_argument("--db-config", default=None, help="数据库配置文件路径（默认 Skill 目录下的 db_config.json）")
+    stand_in = parser.add_mutually_exclusive_group()
+    stand_in.add_argument("--record", metavar="FIXTURES", help="连接真实数据库执行，同时把结果录制到夹具文件")
+    stand_in.add_argument("--replay", metavar="FIXTURES", help="不连接数据库，从夹具文件回放结果")
+    parser.add_argument("--latency-scale", type=float, default=1.0,
+                        help="回放时模拟的数据库耗时系数（1 为录制时的耗时，0 为不等待）")
+    parser.add_argument("--qps", type=float, default=0, help="目标每秒请求数（0 为闭环模式，测最大吞吐量）")
+    parser.add_argument("--concurrency", type=int, default=4, help="并发请求数（工作线程数）")
+    parser.add_argument("--requests", type=int, default=None, help="请求总数（默认日志条数，不足时循环回放）")
+    parser.add_argument("--warmup", type=int, default=0, help="正式测量前顺序执行的预热请求数（不计入报告）")
+    parser.add_argument("--plan-cache", default=None, help="计划缓存文件（SQLite，默认只用内存缓存）")
+    parser.add_argument("--dashboard", action="store_true", help="同时生成看板 HTML（计入 render 阶段）")
+    parser.add_argument("--report", help="把报告写入 JSON 文件（可作为之后的 --baseline）")
+    parser.add_argument("--baseline", help="与之前的报告比较，退化超过阈值时退出码为 1")
+    parser.add_argument("--max-regression-pct", type=float, default=DEFAULT_MAX_REGRESSION_PCT,
+                        help="延迟 / 吞吐量允许的退化幅度（百分比）")
+    parser.add_argument("--verbose", action="store_true", help="显示生成器的输出")
+    args = parser.parse_args()
+
+    # 基线先读入：--report 与 --baseline 可以是同一个文件（与上一次比较后覆盖）
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    items = load_log(args.log, args.sql)
+    if not items:
+        print(f"❌ 日志中没有可回放的{'SQL' if args.sql else '查询'}: {args.log}")
+        sys.exit(2)
+    total = args.requests or len(items)
+    workload = [items[i % len(items)] for i in range(args.warmup + total)]
+
+    driver = None
+    if args.record or args.replay:
+        import smart_db_connector
+        from replay_db import FixtureStore, ReplayDriver
+        if args.replay and not os.path.exists(args.replay):
+            print(f"❌ 夹具文件不存在: {args.replay}")
+            sys.exit(2)
+        try:
+            driver = ReplayDriver(
+                FixtureStore(args.record or args.replay),
+                mode="record" if args.record else "replay",
+                latency_scale=args.latency_scale,
+            )
+        except ImportError:
+            print("❌ 录制需要安装mysql-connector-python: pip install mysql-connector-python")
+            sys.exit(2)
+        smart_db_connector.use_driver(driver)
+
+    from smart_dashboard_generator import SmartDashboardGenerator
+
+    output = sys.stdout if args.verbose else open(os.devnull, "w", encoding="utf-8")
+    with redirect_stdout(output):
+        # 不预取追问：额外的查询会扭曲吞吐量和命中率，回放时也没有录制
+        generator = SmartDashboardGenerator(args.db_config, keep_connection=True, plan_cache_file=args.plan_cache,
+                                            prefetch=False)
+        connected = not args.sql or generator.db.connect()
+    if not connected:
+        print("❌ 数据库连接失败，请检查配置")
+        sys.exit(2)
+    run = sql_runner(generator.db) if args.sql else query_runner(generator, args.dashboard)
+    with redirect_stdout(output):
+        for item in workload[:args.warmup]:
+            _timed(run, item, None)
+        deltas = MetricDeltas()
+        result = run_load(run, workload[args.warmup:], args.qps, args.concurrency)
+    if output is not sys.stdout:
+        output.close()
+
+    report = build_report(result, {
+        "log": os.path.abspath(args.log),
+        "sql": args.sql,
+        "qps": args.qps,
+        "concurrency": args.concurrency,
+        "warmup": args.warmup,
+        "dashboard": args.dashboard,
+        "stand_in": "record" if args.record else "replay" if args.replay else None,
+        "latency_scale": args.latency_scale if args.replay else None,
+    })
+    report["caches"] = deltas.delta()
+    if driver is not None:
+        report["stand_in"] = driver.stats()
+        driver.store.close()
+    print_report(report)
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"📝 报告已保存: {args.report}")
+
+    if baseline is not None:
+        regressions = compare(report, baseline, args.max_regression_pct)
+        if regressions:
+            print(f"❌ 与基线相比退化超过 {args.max_regression_pct}%:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"✅ 与基线相比没有超过 {args.max_regression_pct}% 的退化")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+运行指标与慢查询日志
+进程内的计数器 / 直方图，按 Prometheus 文本格式导出（写文件，或在本机开一个 HTTP 端点供抓取）：
+
+- smart_db_queries_total / smart_db_query_duration_seconds / smart_db_rows_fetched_total /
+  smart_db_prepared_statement_lookups_total：SmartDBConnector.execute_query
+- smart_db_parse_total / smart_db_parse_duration_seconds / smart_db_plan_cache_lookups_total：NLPQueryParser.parse_query
+- smart_db_requests_total / smart_db_request_stage_duration_seconds：SmartDashboardGenerator.process_query
+- smart_db_primary_connected / smart_db_pool_connections / smart_db_endpoint_outstanding / smart_db_prepared_statements：
+  主库连接状态、副本连接池占用和已缓存的预处理语句数（抓取时读取）
+
+慢查询日志为 JSON Lines，每行一次超过阈值的查询：自然语言问题、生成的 SQL、计划摘要、行数和各阶段耗时。
+配置写在 db_config.json 的 monitoring 中（见 CONFIG_GUIDE.md）。
+"""
+
+import json
+import os
+import threading
+import weakref
+from datetime import datetime
+from typing import Dict, List, Any, Callable, Iterable, Optional, Tuple
+
+# 耗时直方图的桶（秒）
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# 单次查询返回行数的桶
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+
+DEFAULT_MONITORING_CONFIG = {
+    # 慢查询阈值（毫秒，按 process_query 总耗时判断）
+    "slow_query_ms": 1000,
+    # 慢查询日志文件（JSON Lines），为空时不记录
+    "slow_query_log": None,
+    # 指标文件（Prometheus 文本格式），每次查询后原子覆盖，可交给 node_exporter textfile collector
+    "metrics_file": None,
+    # 指标 HTTP 端口（GET /metrics），为空时不启动
+    "metrics_port": None,
+    "metrics_host": "127.0.0.1",
+}
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels.get(name, "")) for name in self.label_names), 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(dict(zip(self.label_names, key)))} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = (),
+                 buckets: Iterable[float] = DURATION_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # 标签 -> [各桶计数（非累计）, 总和, 次数]
+        self._values: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        index = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, (list(entry[0]), entry[1], entry[2])) for key, entry in self._values.items())
+        for key, (counts, total, count) in items:
+            labels = dict(zip(self.label_names, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                bucket_labels = dict(labels, le=_format_value(bound) if bound != float("inf") else "+Inf")
+                lines.append(f"{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(round(total, 6))}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: List[Any] = []
+        # 抓取时调用的采集函数（弱引用，对象释放后自动移除）
+        self._collectors: List[weakref.WeakMethod] = []
+        self._lock = threading.Lock()
+        self._server = None
+
+    def counter(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, help_text, label_names)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, label_names: Tuple[str, ...] = (),
+                  buckets: Iterable[float] = DURATION_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, label_names, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, method: Callable[[], Iterable[tuple]]):
+        """注册抓取时调用的绑定方法，返回 [(指标名, 类型, 说明, [(标签, 值)])]，用于连接池占用等即时值"""
+        with self._lock:
+            self._collectors.append(weakref.WeakMethod(method))
+
+    def render(self) -> str:
+        """Prometheus 文本格式（text/plain; version=0.0.4）"""
+        lines: List[str] = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+
+        gauges: Dict[str, tuple] = {}
+        with self._lock:
+            self._collectors = [ref for ref in self._collectors if ref() is not None]
+            collectors = [ref() for ref in self._collectors]
+        for collect in collectors:
+            if collect is None:
+                continue
+            for name, metric_type, help_text, samples in collect():
+                gauges.setdefault(name, (metric_type, help_text, []))[2].extend(samples)
+        for name, (metric_type, help_text, samples) in gauges.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def write_file(self, path: str):
+        """原子写入指标文件（先写临时文件再替换，抓取方不会读到半个文件）"""
+        # tempfile 只在配置了指标文件时导入（导入耗时较长）
+        import tempfile
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=".prom", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(self.render())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            print(f"⚠️ 写入指标文件失败: {e}")
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> bool:
+        """在后台线程启动 HTTP 端点（GET /metrics），同一进程只启动一次"""
+        if self._server is not None:
+            return True
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self._server = ThreadingHTTPServer((host, int(port)), Handler)
+        except OSError as e:
+            print(f"⚠️ 指标端点启动失败（{host}:{port}）: {e}")
+            return False
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+        print(f"📈 指标端点: http://{host}:{self._server.server_address[1]}/metrics")
+        return True
+
+
+REGISTRY = MetricsRegistry()
+
+DB_QUERIES = REGISTRY.counter(
+    "smart_db_queries_total", "execute_query 执行次数（status: success / partial / timeout / error / rejected）", ("status",))
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    "smart_db_query_duration_seconds", "execute_query 耗时（秒，含成本检查和等待共享结果）")
+DB_ROWS_FETCHED = REGISTRY.counter("smart_db_rows_fetched_total", "execute_query 返回的总行数")
+DB_ROWS_PER_QUERY = REGISTRY.histogram(
+    "smart_db_rows_per_query", "单次 execute_query 返回的行数", buckets=ROW_BUCKETS)
+DB_SHARED_RESULTS = REGISTRY.counter(
+    "smart_db_single_flight_shared_total", "与并发的相同查询共享结果、未实际执行的次数")
+DB_GUARD_DECISIONS = REGISTRY.counter(
+    "smart_db_guard_decisions_total", "成本守卫决策次数", ("decision",))
+DB_PREPARED_STATEMENTS = REGISTRY.counter(
+    "smart_db_prepared_statement_lookups_total", "预处理语句缓存查找次数（result: hit / miss）", ("result",))
+PARSE_TOTAL = REGISTRY.counter("smart_db_parse_total", "parse_query 次数（status: success / failed）", ("status",))
+PARSE_SECONDS = REGISTRY.histogram("smart_db_parse_duration_seconds", "parse_query 耗时（秒）")
+PLAN_CACHE_LOOKUPS = REGISTRY.counter(
+    "smart_db_plan_cache_lookups_total", "查询计划缓存查找次数（result: hit / miss）", ("result",))
+REQUESTS = REGISTRY.counter(
+    "smart_db_requests_total", "process_query 次数（status: success 或错误类型）", ("status",))
+REQUEST_STAGE_SECONDS = REGISTRY.histogram(
+    "smart_db_request_stage_duration_seconds", "process_query 各阶段耗时（秒，stage: parse / execute / analyze / total）",
+    ("stage",))
+SLOW_QUERIES = REGISTRY.counter("smart_db_slow_queries_total", "超过慢查询阈值的 process_query 次数")
+PREFETCH_QUERIES = REGISTRY.counter(
+    "smart_db_prefetch_queries_total", "追问预取次数（result: stored / cancelled / failed / skipped）", ("result",))
+PREFETCH_HITS = REGISTRY.counter("smart_db_prefetch_hits_total", "execute_query 直接返回预取结果的次数")
+
+
+def monitoring_config(config: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    merged = dict(DEFAULT_MONITORING_CONFIG)
+    merged.update({k: v for k, v in (config or {}).items() if not str(k).startswith("_")})
+    return merged
+
+
+def validate(config: Any) -> List[str]:
+    """校验 monitoring 配置，返回错误列表"""
+    if not isinstance(config, dict):
+        return ["monitoring 必须是对象"]
+    errors = []
+    for field in ("slow_query_ms", "metrics_port"):
+        if config.get(field) is not None and not isinstance(config[field], (int, float)):
+            errors.append(f"monitoring.{field} 需要数字")
+    for field in ("slow_query_log", "metrics_file", "metrics_host"):
+        if config.get(field) is not None and not isinstance(config[field], str):
+            errors.append(f"monitoring.{field} 需要字符串")
+    return errors
+
+
+def _json_default(obj):
+    if hasattr(obj, "strftime"):
+        return obj.strftime("%Y-%m-%d %H:%M:%S")
+    return str(obj)
+
+
+class SlowQueryLog:
+    def __init__(self, path: str, threshold_ms: float = DEFAULT_MONITORING_CONFIG["slow_query_ms"]):
+        """慢查询日志（JSON Lines，追加写入）
+
+        path: 日志文件路径；threshold_ms: process_query 总耗时达到该值（毫秒）时记录
+        """
+        self.path = path
+        self.threshold_ms = float(threshold_ms)
+        self._lock = threading.Lock()
+
+    def record(self, user_query: str, result: Dict[str, Any]) -> bool:
+        """总耗时达到阈值时写入一行，返回是否记录"""
+        timings = result.get("timings") or {}
+        if timings.get("total_ms", 0) < self.threshold_ms:
+            return False
+        plan = result.get("query_plan") or {}
+        entry = {
+            "time": datetime.now().isoformat(timespec="milliseconds"),
+            "query": user_query,
+            "success": bool(result.get("success")),
+            "error": result.get("error"),
+            "sql": result.get("sql_query") or result.get("sql") or plan.get("sql_query"),
+            "plan": {
+                "primary_table": plan.get("primary_table"),
+                "related_tables": plan.get("related_tables"),
+                "joins": len(plan.get("joins") or []),
+                "pruning": plan.get("pruning"),
+                "from_cache": bool(plan.get("from_cache")),
+                "chart_type": plan.get("chart_type"),
+            },
+            "guard": result.get("guard"),
+            "rows": result.get("row_count"),
+            "timings": timings,
+        }
+        line = json.dumps(entry, ensure_ascii=False, default=_json_default)
+        with self._lock:
+            try:
+                directory = os.path.dirname(os.path.abspath(self.path))
+                os.makedirs(directory, exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+            except OSError as e:
+                print(f"⚠️ 写入慢查询日志失败: {e}")
+                return False
+        SLOW_QUERIES.inc()
+        return True
@@ -7,37 +7,150 @@
 import re
 import json
 import os
+import threading
+import time
+from datetime import date, timedelta
 from typing import Dict, List, Any, Tuple, Optional
-from difflib import SequenceMatcher
 from smart_db_connector import SmartDBConnector
+from plan_cache import PlanCache
+from join_planner import JoinPlanner
+from value_dictionary import ValueDictionary
+from entity_catalog import EntityCatalog, ConfigWatcher
+from monitoring import PARSE_TOTAL, PARSE_SECONDS, PLAN_CACHE_LOOKUPS
+from prepared_statements import parameterize
+from shard_pruner import (
+    time_range_of, prune_shards, prune_partitions, build_union_sql, add_partition_clause
+)
 
-class NLPQueryParser:
-    def __init__(self, db_connector: SmartDBConnector, config_file: str = None):
-        self.db = db_connector
+# 计划缓存文件中记录“表相关实体配置”的元信息名称（跨进程比较配置是否被修改过）
+CATALOG_META_NAME = "entity_catalog"
 
-        # 加载配置文件
-        self.config = self._load_config(config_file)
 
-        # 从配置文件获取映射表
-        self.entity_mappings = self._flatten_entity_mappings(self.config.get('entity_mappings', {}))
-        self.time_field_mappings = self._filter_comment_fields(self.config.get('time_field_mappings', {}))
-        self.table_aliases = self._filter_comment_fields(self.config.get('table_aliases', {}))
-
-        # 合并自定义查询模式
-        custom_patterns = self.config.get('custom_query_patterns', {}).get('examples', {})
-        self.query_patterns = self._get_default_patterns()
-        self.query_patterns.update(custom_patterns)
+class NLPQueryParser:
+    def __init__(self, db_connector: SmartDBConnector, config_file: str = None,
+                 plan_cache: Optional[PlanCache] = None, record_metrics: bool = True,
+                 build_value_dictionary: bool = True):
+        """record_metrics=False 时解析次数、耗时和计划缓存命中不计入运行指标（后台预取等非用户请求）
+
+        build_value_dictionary=False 时不在后台构建取值字典（命令行单次调用：进程退出时字典随之丢弃，
+        后台线程还会与结束时的 disconnect 争用主连接），只使用连接器中已有的字典。
+        """
+        self.db = db_connector
+        self.record_metrics = record_metrics
+        self.build_value_dictionary = build_value_dictionary
+
+        # 加载配置文件，编译为实体匹配、查询模式、时间字段映射等只读结构（文件变化时自动重新加载）
+        self.config_file = self._resolve_config_file(config_file)
+        self.config = self._load_config(self.config_file)
+        self._catalog = EntityCatalog(self.config, self._get_default_patterns())
+        self._config_watcher = ConfigWatcher(self.config_file)
+        self._reload_lock = threading.Lock()
+        # 解析过程中固定使用开始时的配置版本，热加载不影响进行中的解析
+        self._local = threading.local()
+        self.db.set_entity_terms(self._catalog.entity_names, self._catalog.column_aliases)
+
+        # 查询计划缓存（相同问题直接复用计划，跳过表匹配、结构获取和SQL拼装）
+        self.plan_cache = plan_cache if plan_cache is not None else PlanCache()
+        self.join_planner = JoinPlanner(self.db)
+        self._sync_plan_cache_catalog()
+
+        # 低基数列的取值字典（“渠道为华为” → source = 'huawei'）
+        self.value_dictionary = ValueDictionary(
+            self.db,
+            self._filter_comment_fields(self.config.get('value_dictionary', {})),
+            self.config.get('value_aliases', {}),
+        )
+
+    # ---------- 实体配置（可热加载） ----------
+
+    @property
+    def catalog(self) -> EntityCatalog:
+        return getattr(self._local, "catalog", None) or self._catalog
+
+    @property
+    def config_version(self) -> str:
+        return self.catalog.config_version
+
+    @property
+    def entity_mappings(self) -> Dict[str, str]:
+        return self.catalog.entity_mappings
+
+    @property
+    def table_aliases(self) -> Dict[str, str]:
+        return self.catalog.table_aliases
+
+    @property
+    def time_field_mappings(self) -> Dict[str, str]:
+        return self.catalog.time_field_mappings
+
+    @property
+    def column_aliases(self) -> Dict[str, Any]:
+        return self.catalog.column_aliases
+
+    @property
+    def query_patterns(self) -> Dict[str, str]:
+        return self.catalog.query_patterns
+
+    def reload_config_if_changed(self) -> bool:
+        """配置文件变化时重新编译有变化的部分并整体替换，返回是否重新加载
+
+        实体映射、表别名、时间字段变化时，只删除引用了相关表或提到相关实体名的计划；
+        其他配置变化会改变 config_version，计划缓存键随之变化。
+        """
+        config = self._config_watcher.poll()
+        if config is None:
+            return False
+        with self._reload_lock:
+            old = self._catalog
+            catalog = EntityCatalog(config, self._get_default_patterns(), previous=old)
+            if catalog.value_dictionary_changed:
+                self.value_dictionary.reconfigure(
+                    self._filter_comment_fields(config.get('value_dictionary', {})),
+                    config.get('value_aliases', {}),
+                )
+            self.config = config
+            self._catalog = catalog
+            self.db.set_entity_terms(catalog.entity_names, catalog.column_aliases)
+            removed = self._invalidate_plans(old.table_sections(), catalog.table_sections())
+        rebuilt = "、".join(catalog.rebuilt) or "无变化"
+        print(f"🔄 已重新加载 {os.path.basename(self.config_file)}（重建: {rebuilt}，失效计划 {removed} 条）")
+        return True
+
+    def _invalidate_plans(self, old_sections: Dict[str, Any], new_sections: Dict[str, Any]) -> int:
+        tables, terms = EntityCatalog.changes(old_sections, new_sections)
+        removed = self.plan_cache.invalidate(tables, terms) if tables or terms else 0
+        self.plan_cache.put_meta(CATALOG_META_NAME, json.dumps(new_sections, sort_keys=True, ensure_ascii=False))
+        return removed
+
+    def _sync_plan_cache_catalog(self):
+        """与计划缓存文件中记录的表相关配置比较：其他进程运行期间配置被修改过时，删除受影响的计划"""
+        stored = self.plan_cache.get_meta(CATALOG_META_NAME)
+        sections = self._catalog.table_sections()
+        if stored is None:
+            self.plan_cache.put_meta(CATALOG_META_NAME, json.dumps(sections, sort_keys=True, ensure_ascii=False))
+            return
+        try:
+            old_sections = json.loads(stored[0])
+        except ValueError:
+            old_sections = {}
+        if old_sections != sections:
+            self._invalidate_plans(old_sections, sections)
 
     def _filter_comment_fields(self, mappings: Dict) -> Dict[str, str]:
         """过滤掉注释字段（以_开头的字段）"""
         return {k: v for k, v in mappings.items() if not k.startswith('_')}
 
-    def _load_config(self, config_file: str = None) -> Dict:
-        """加载配置文件"""
+    @staticmethod
+    def _resolve_config_file(config_file: str = None) -> str:
         if config_file is None:
             # 默认配置文件路径
             script_dir = os.path.dirname(os.path.abspath(__file__))
             config_file = os.path.join(os.path.dirname(script_dir), 'entity_config.json')
+        return config_file
+
+    def _load_config(self, config_file: str = None) -> Dict:
+        """加载配置文件"""
+        config_file = self._resolve_config_file(config_file)
 
         if os.path.exists(config_file):
             try:
@@ -50,17 +163,6 @@ class NLPQueryParser:
         # 返回空配置（使用内置默认值）
         return {}
 
-    def _flatten_entity_mappings(self, mappings: Dict) -> Dict[str, str]:
-        """将嵌套的实体映射展平为一维字典"""
-        flat_mappings = {}
-        for category, entities in mappings.items():
-            if category.startswith('_'):
-                continue  # 跳过注释字段
-            if isinstance(entities, dict):
-                for entity_name, table_name in entities.items():
-                    flat_mappings[entity_name] = table_name
-        return flat_mappings
-
     def _get_default_patterns(self) -> Dict[str, str]:
         """获取默认的查询模式"""
         return {
@@ -72,7 +174,7 @@ class NLPQueryParser:
             'min': r'(最低|最小|最少)',
 
             # 分组统计模式
-            'group_by': r'(各个|每个|按.*分组|分组.*统计|分别统计|.*的(使用|统计|情况))',
+            'group_by': r'(各|每个|按.*分组|分组.*统计|分别统计|.*的(使用|统计|情况))',
 
             # 灵活时间范围模式
             'last_days': r'(最近|过去|前)(\d+)(天|日)',
@@ -124,13 +226,166 @@ class NLPQueryParser:
         candidates.sort(key=lambda x: x[1], reverse=True)
         return candidates[0][0]
 
+    def _find_entity_mentions(self, query: str) -> List[Tuple[str, int, bool]]:
+        """找出查询中提到的全部业务实体，返回 [(表名, 首次出现位置, 是否为分组维度)]
+
+        除完整实体名外，也识别去掉“表”字的简称（“渠道表” -> “渠道”）；
+        前面紧跟“各/每个/按/不同”的提及视为分组维度（如“各渠道”）。
+        """
+        query_lower = query.lower()
+        names = self.catalog.entity_names
+
+        first_pos: Dict[str, int] = {}
+        dimensions = set()
+        for name, table_name in names.items():
+            for match in re.finditer(re.escape(name), query_lower):
+                pos = match.start()
+                if table_name not in first_pos or pos < first_pos[table_name]:
+                    first_pos[table_name] = pos
+                if re.search(r'(各|每个|每|按|不同)$', query_lower[:pos]):
+                    dimensions.add(table_name)
+
+        return [
+            (table_name, pos, table_name in dimensions)
+            for table_name, pos in sorted(first_pos.items(), key=lambda x: x[1])
+        ]
+
+    def _choose_fact_table(self, query: str, mentions: List[Tuple[str, int, bool]]) -> str:
+        """在多个提及的表中选择被统计的事实表：度量词（次数/数量/多少…）前最近的非维度表"""
+        facts = [m for m in mentions if not m[2]] or mentions
+        measure = re.search(r'(次数|数量|多少|总数|人数|个数)', query)
+        if measure:
+            before = [m for m in facts if m[1] < measure.start()]
+            if before:
+                return before[-1][0]
+        return facts[-1][0]
+
     def parse_query(self, user_query: str) -> Dict[str, Any]:
-        """解析用户查询并生成执行计划"""
+        """解析用户查询并生成执行计划（优先读取计划缓存）
+
+        计划中的时间条件都是 CURDATE()/NOW() 等相对表达式，由 MySQL 在执行时求值；
+        只有分表/分区裁剪依赖当天日期，命中缓存时会重新计算这一部分。
+        entity_config.json 变化时先重新加载；解析过程中始终使用开始时的配置版本。
+        """
+        started = time.perf_counter()
+        self.reload_config_if_changed()
+        self._local.catalog = self._catalog
+        try:
+            plan = self._parse_query(user_query)
+        finally:
+            self._local.catalog = None
+        if self.record_metrics:
+            PARSE_SECONDS.observe(time.perf_counter() - started)
+            PARSE_TOTAL.inc(status="success" if plan.get("success") else "failed")
+        return plan
+
+    def _parse_query(self, user_query: str) -> Dict[str, Any]:
+        schema_version = self._schema_version()
+        if schema_version is None:
+            return self._build_plan(user_query)
+
+        cache_key = PlanCache.make_key(user_query, f"{schema_version}:{self.config_version}")
+        cached = self.plan_cache.get(cache_key)
+        # 计划涉及的表的取值字典在生成计划之后才建好（或已刷新）时重新生成，新识别出的过滤条件才能生效
+        if cached is not None and self._value_dictionary_changed(cached):
+            cached = None
+        if self.record_metrics:
+            PLAN_CACHE_LOOKUPS.inc(result="miss" if cached is None else "hit")
+        if cached is not None:
+            if cached.get("time_relative"):
+                self._refresh_time_relative(cached, user_query)
+            cached["from_cache"] = True
+            plan = cached
+        else:
+            plan = self._build_plan(user_query)
+            self.plan_cache.put(cache_key, plan)
+
+        # 取值字典只在后台构建，解析不等待；本次计划用到的表建好后，下一次同样的问题会重新生成计划
+        if self.build_value_dictionary:
+            tables = set(self.entity_mappings.values())
+            tables.update((plan.get("value_dictionary") or {}).get("tables") or [])
+            self.value_dictionary.start_background(sorted(tables))
+        return plan
+
+    def _value_dictionary_changed(self, plan: Dict[str, Any]) -> bool:
+        """缓存计划生成时这些表的字典版本与当前不同（只比较本进程已构建的字典，其他进程写入的计划照常复用）"""
+        recorded = plan.get("value_dictionary")
+        if not recorded:
+            return False
+        tables = recorded.get("tables") or []
+        return self.value_dictionary.built(tables) and self.value_dictionary.version(tables) != recorded.get("version")
+
+    def _schema_version(self) -> Optional[str]:
+        """表结构版本；计划缓存有持久化文件时，schema_version_ttl 秒内记录过的版本跨进程复用
+
+        命令行每次调用都是新进程，复用记录的版本后，命中计划缓存的查询完全不需要连接数据库。
+        """
+        meta_name = "schema_version:{host}:{port}:{database}".format(
+            host=self.db.config.get("host"), port=self.db.config.get("port"), database=self.db.config.get("database")
+        )
+        stored = self.plan_cache.get_meta(meta_name)
+        if stored is not None and time.time() - stored[1] < self.db.schema_version_ttl:
+            self.db.seed_schema_version(*stored)
+            return self.db.get_schema_version()
+
+        schema_version = self.db.get_schema_version()
+        if schema_version is not None:
+            self.plan_cache.put_meta(meta_name, schema_version)
+        return schema_version
+
+    def _refresh_time_relative(self, plan: Dict[str, Any], user_query: str):
+        """重新计算缓存计划中依赖当前日期的部分：时间范围和分表/分区裁剪"""
+        primary_table = plan["primary_table"]
+        intent = plan["query_intent"]
+        if not plan.get("joins"):
+            intent['time_conditions'] = self._extract_time_conditions(user_query.lower(), primary_table)
+        sql_query = self._generate_sql(
+            primary_table, plan.get("related_tables", []), intent, user_query, joins=plan.get("joins")
+        )
+        plan["sql_query"], plan["pruning"] = self._apply_physical_pruning(primary_table, sql_query, intent)
+        plan["sql_template"], plan["sql_params"] = parameterize(plan["sql_query"])
+
+    def _apply_physical_pruning(self, primary_table: str, sql_query: str,
+                                intent: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        """把针对逻辑表的 SQL 落到物理分表/分区上
+
+        - 分表族：只保留与时间范围重叠的分表，多个分表改写为 UNION ALL 并合并聚合
+        - RANGE 分区表：时间条件带函数（DATE()/YEARWEEK()）时优化器无法自动裁剪，显式指定分区
+        """
+        table_info = self.db.get_table_structure(primary_table)
+        time_conditions = intent.get('time_conditions') or []
+        time_range = time_range_of(time_conditions)
+
+        if table_info.get('shards'):
+            shards = self.db.get_shard_families().get(primary_table, [])
+            selected = prune_shards(shards, time_range) or [shards[-1]["table"]]
+            return build_union_sql(sql_query, primary_table, selected), {
+                "shards": selected,
+                "shards_total": len(shards),
+            }
+
+        if time_range is None:
+            return sql_query, {}
+        partitions = self.db.get_partitions(primary_table)
+        selected = prune_partitions(partitions, time_conditions[0]['field'], time_range)
+        if not selected:
+            return sql_query, {}
+        return add_partition_clause(sql_query, primary_table, selected), {
+            "partitions": selected,
+            "partitions_total": len(partitions),
+        }
+
+    def _build_plan(self, user_query: str) -> Dict[str, Any]:
+        """完整解析流程：实体映射/表匹配、获取表结构、意图识别、生成SQL"""
         # 0. 优先检查业务实体映射
         mapped_table = self._map_entity_to_table(user_query)
+        mentions = self._find_entity_mentions(user_query)
         if mapped_table:
             # 使用映射的表名，直接构造匹配结果
             table_matches = [(mapped_table, 1.0)]
+        elif mentions:
+            # 只提到实体简称（如“各渠道注册用户的启动次数”），选择被统计的事实表作为主表
+            table_matches = [(self._choose_fact_table(user_query, mentions), 1.0)]
         else:
             # 1. 发现并匹配表
             table_matches = self.db.match_tables(user_query)
@@ -151,13 +406,30 @@ class NLPQueryParser:
         # 4. 解析查询意图
         query_intent = self._extract_query_intent(user_query, primary_table)
         
-        # 5. 检查是否需要多表联查
-        related_tables = []
+        # 5. 检查是否需要多表联查：查询中提到的其他实体 + 匹配分数较低时的候选表
+        join_candidates = [table for table, _, _ in mentions if table != primary_table]
         if len(table_matches) > 1 and match_score < 0.8:
-            related_tables = self._plan_joins(table_matches[1:], user_query)
+            join_candidates += [table for table, score in table_matches[1:] if score > 0.3]
+        planned_joins = self._plan_joins(primary_table, join_candidates, user_query)
+        related_tables = [j["table"] for j in planned_joins]
+
+        # 分组维度位于关联表时（“各渠道…”）才真正生成 JOIN，只保留到达维度表所需的连接
+        dimension_tables = [table for table, _, is_dim in mentions if is_dim and table != primary_table]
+        joins = self._select_dimension_joins(user_query, query_intent, planned_joins, dimension_tables)
+
+        # 识别取值过滤条件，过滤列在关联表上时补上到达该表的 JOIN；记录所用字典的版本，字典变化后计划失效
+        dictionary_tables = [primary_table] + [j["table"] for j in planned_joins]
+        dictionary_version = self.value_dictionary.version(dictionary_tables)
+        query_intent['value_filters'] = self.value_dictionary.extract_filters(
+            user_query, dictionary_tables, primary_table, self.column_aliases
+        )
+        joins = self._joins_for_filters(query_intent['value_filters'], primary_table, planned_joins, joins)
         
-        # 6. 生成SQL查询
-        sql_query = self._generate_sql(primary_table, related_tables, query_intent, user_query)
+        # 6. 生成SQL查询，并按时间范围裁剪分表/分区
+        sql_query = self._generate_sql(primary_table, related_tables, query_intent, user_query, joins=joins)
+        sql_query, pruning = self._apply_physical_pruning(primary_table, sql_query, query_intent)
+        # 取值、INTERVAL 数量、LIMIT 换成占位符：执行时走预处理语句，同类问题共用一个模板
+        sql_template, sql_params = parameterize(sql_query)
         
         # 7. 确定展示类型
         chart_type = self._determine_chart_type(query_intent, user_query)
@@ -166,10 +438,17 @@ class NLPQueryParser:
             "success": True,
             "primary_table": primary_table,
             "related_tables": related_tables,
+            "joins": joins,
             "sql_query": sql_query,
+            "sql_template": sql_template,
+            "sql_params": sql_params,
+            "pruning": pruning,
+            # 分表/分区裁剪依赖当天日期，命中计划缓存时需要重新计算
+            "time_relative": bool(pruning),
             "query_intent": query_intent,
             "chart_type": chart_type,
-            "table_matches": table_matches
+            "table_matches": table_matches,
+            "value_dictionary": {"tables": dictionary_tables, "version": dictionary_version},
         }
     
     def _extract_query_intent(self, query: str, table_name: str = None) -> Dict[str, Any]:
@@ -237,7 +516,7 @@ class NLPQueryParser:
 
         # 2. 尝试匹配常见的字段名模式
         # module, type, category, status等常见的分组字段
-        group_keywords = ['module', 'type', 'category', 'status', 'level', 'group', 'class']
+        group_keywords = ['module', 'type', 'category', 'status', 'level', 'group', 'class', 'channel', 'source']
         for col in columns:
             col_lower = col.lower()
             for keyword in group_keywords:
@@ -246,14 +525,19 @@ class NLPQueryParser:
 
         return None
     
-    def _extract_time_conditions(self, query: str, table_name: str = None) -> List[Dict[str, Any]]:
-        """提取时间条件，返回条件列表（包含字段名和条件）"""
+    def _extract_time_conditions(self, query: str, table_name: str = None,
+                                 alias: str = None) -> List[Dict[str, Any]]:
+        """提取时间条件，返回条件列表（包含字段名和条件）
+
+        alias 用于联表查询，条件中的时间字段会带上表别名（如 t0.viewing_time）。
+        """
         conditions = []
         time_field = 'created_at'  # 默认时间字段
 
         # 如果指定了表名，使用对应的时间字段
         if table_name and table_name in self.time_field_mappings:
             time_field = self.time_field_mappings[table_name]
+        time_col = f"{alias}.{time_field}" if alias else time_field
 
         # 1. 灵活时间范围 - 最近X天
         last_days_match = re.search(self.query_patterns['last_days'], query)
@@ -261,8 +545,9 @@ class NLPQueryParser:
             days = int(last_days_match.group(2))
             conditions.append({
                 'field': time_field,
-                'condition': f"DATE({time_field}) >= DATE_SUB(CURDATE(), INTERVAL {days} DAY)",
-                'description': f'最近{days}天'
+                'condition': f"DATE({time_col}) >= DATE_SUB(CURDATE(), INTERVAL {days} DAY)",
+                'description': f'最近{days}天',
+                'range': self._date_range('last_days', days)
             })
             return conditions  # 找到灵活时间范围后直接返回
 
@@ -272,8 +557,9 @@ class NLPQueryParser:
             weeks = int(last_weeks_match.group(2))
             conditions.append({
                 'field': time_field,
-                'condition': f"{time_field} >= DATE_SUB(NOW(), INTERVAL {weeks} WEEK)",
-                'description': f'最近{weeks}周'
+                'condition': f"{time_col} >= DATE_SUB(NOW(), INTERVAL {weeks} WEEK)",
+                'description': f'最近{weeks}周',
+                'range': self._date_range('last_weeks', weeks)
             })
             return conditions
 
@@ -283,8 +569,9 @@ class NLPQueryParser:
             months = int(last_months_match.group(2))
             conditions.append({
                 'field': time_field,
-                'condition': f"{time_field} >= DATE_SUB(NOW(), INTERVAL {months} MONTH)",
-                'description': f'最近{months}个月'
+                'condition': f"{time_col} >= DATE_SUB(NOW(), INTERVAL {months} MONTH)",
+                'description': f'最近{months}个月',
+                'range': self._date_range('last_months', months)
             })
             return conditions
 
@@ -292,74 +579,151 @@ class NLPQueryParser:
         if re.search(self.query_patterns['today'], query):
             conditions.append({
                 'field': time_field,
-                'condition': f"DATE({time_field}) = CURDATE()",
-                'description': '今天'
+                'condition': f"DATE({time_col}) = CURDATE()",
+                'description': '今天',
+                'range': self._date_range('today')
             })
 
         # 5. 固定时间范围 - 昨天
         elif re.search(self.query_patterns['yesterday'], query):
             conditions.append({
                 'field': time_field,
-                'condition': f"DATE({time_field}) = DATE_SUB(CURDATE(), INTERVAL 1 DAY)",
-                'description': '昨天'
+                'condition': f"DATE({time_col}) = DATE_SUB(CURDATE(), INTERVAL 1 DAY)",
+                'description': '昨天',
+                'range': self._date_range('yesterday')
             })
 
         # 6. 固定时间范围 - 本周
         elif re.search(self.query_patterns['this_week'], query):
             conditions.append({
                 'field': time_field,
-                'condition': f"YEARWEEK({time_field}, 1) = YEARWEEK(CURDATE(), 1)",
-                'description': '本周'
+                'condition': f"YEARWEEK({time_col}, 1) = YEARWEEK(CURDATE(), 1)",
+                'description': '本周',
+                'range': self._date_range('this_week')
             })
 
         # 7. 固定时间范围 - 上周
         elif re.search(self.query_patterns.get('last_week', r'(上周|上一周)'), query):
             conditions.append({
                 'field': time_field,
-                'condition': f"YEARWEEK({time_field}, 1) = YEARWEEK(DATE_SUB(CURDATE(), INTERVAL 1 WEEK), 1)",
-                'description': '上周'
+                'condition': f"YEARWEEK({time_col}, 1) = YEARWEEK(DATE_SUB(CURDATE(), INTERVAL 1 WEEK), 1)",
+                'description': '上周',
+                'range': self._date_range('last_week')
             })
 
         # 8. 固定时间范围 - 本月
         elif re.search(self.query_patterns['this_month'], query):
             conditions.append({
                 'field': time_field,
-                'condition': f"MONTH({time_field}) = MONTH(CURDATE()) AND YEAR({time_field}) = YEAR(CURDATE())",
-                'description': '本月'
+                'condition': f"MONTH({time_col}) = MONTH(CURDATE()) AND YEAR({time_col}) = YEAR(CURDATE())",
+                'description': '本月',
+                'range': self._date_range('this_month')
             })
 
         # 9. 固定时间范围 - 上月
         elif re.search(self.query_patterns.get('last_month', r'(上个月|上月)'), query):
             conditions.append({
                 'field': time_field,
-                'condition': f"MONTH({time_field}) = MONTH(DATE_SUB(CURDATE(), INTERVAL 1 MONTH)) AND YEAR({time_field}) = YEAR(DATE_SUB(CURDATE(), INTERVAL 1 MONTH))",
-                'description': '上月'
+                'condition': f"MONTH({time_col}) = MONTH(DATE_SUB(CURDATE(), INTERVAL 1 MONTH)) AND YEAR({time_col}) = YEAR(DATE_SUB(CURDATE(), INTERVAL 1 MONTH))",
+                'description': '上月',
+                'range': self._date_range('last_month')
             })
 
         # 10. 固定时间范围 - 今年
         elif re.search(self.query_patterns['this_year'], query):
             conditions.append({
                 'field': time_field,
-                'condition': f"YEAR({time_field}) = YEAR(CURDATE())",
-                'description': '今年'
+                'condition': f"YEAR({time_col}) = YEAR(CURDATE())",
+                'description': '今年',
+                'range': self._date_range('this_year')
             })
 
         return conditions
     
-    def _plan_joins(self, table_matches: List[Tuple[str, float]], query: str) -> List[str]:
-        """规划表连接（目前采用简单的“相关表列表”，具体JOIN在后续扩展）"""
-        join_tables = []
+    def _date_range(self, kind: str, n: int = 0) -> List[str]:
+        """时间条件对应的日期范围 [起始, 结束)（ISO 日期），用于分表/分区裁剪
+
+        按数据库服务器的当前日期计算，与 SQL 中 CURDATE()/NOW() 的语义一致。
+        """
+        today = self.db.get_server_date()
+        tomorrow = today + timedelta(days=1)
+        monday = today - timedelta(days=today.weekday())
+        month_start = today.replace(day=1)
+
+        def add_months(d: date, months: int) -> date:
+            index = d.year * 12 + d.month - 1 + months
+            return date(index // 12, index % 12 + 1, min(d.day, 28))
+
+        ranges = {
+            'last_days': (today - timedelta(days=n), tomorrow),
+            'last_weeks': (today - timedelta(weeks=n), tomorrow),
+            'last_months': (add_months(today, -n), tomorrow),
+            'today': (today, tomorrow),
+            'yesterday': (today - timedelta(days=1), today),
+            'this_week': (monday, monday + timedelta(days=7)),
+            'last_week': (monday - timedelta(days=7), monday),
+            'this_month': (month_start, add_months(month_start, 1)),
+            'last_month': (add_months(month_start, -1), month_start),
+            'this_year': (date(today.year, 1, 1), date(today.year + 1, 1, 1)),
+        }
+        start, end = ranges[kind]
+        return [start.isoformat(), end.isoformat()]
+
+    def _joins_for_filters(self, value_filters: List[Dict[str, Any]], primary_table: str,
+                           planned_joins: List[Dict[str, Any]], joins: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """合并分组维度和过滤条件各自需要的 JOIN（保持规划的连接顺序）"""
+        needed = {j["table"] for j in joins}
+        for value_filter in value_filters:
+            if value_filter["table"] != primary_table:
+                needed.update(j["table"] for j in JoinPlanner.path_to(planned_joins, value_filter["table"]))
+        return [j for j in planned_joins if j["table"] in needed]
+
+    def _value_conditions(self, intent: Dict[str, Any], primary_table: str,
+                          joins: Optional[List[Dict[str, Any]]] = None) -> List[str]:
+        """取值过滤条件对应的 WHERE 子句；联表时按表别名引用列"""
+        aliases = {primary_table: "t0"}
+        aliases.update({j["table"]: j["alias"] for j in joins or []})
+        conditions = []
+        for value_filter in intent.get('value_filters') or []:
+            if joins:
+                alias = aliases.get(value_filter["table"])
+                if alias is None:
+                    continue
+                column_ref = f"{alias}.{value_filter['column']}"
+            elif value_filter["table"] == primary_table:
+                column_ref = value_filter["column"]
+            else:
+                continue
+            conditions.append(ValueDictionary.condition(column_ref, value_filter["values"]))
+        return conditions
 
-        for table_name, score in table_matches:
-            # 只考虑有一定相关性的表，后续可以在这里引入外键/字段交集分析
-            if score > 0.3:
-                join_tables.append(table_name)
+    def _plan_joins(self, primary_table: str, candidate_tables: List[str], query: str) -> List[Dict[str, Any]]:
+        """规划表连接：只保留能通过外键/索引列与主表（或已连接的表）关联的候选表"""
+        if not candidate_tables:
+            return []
+        return self.join_planner.plan(primary_table, candidate_tables)
+
+    def _select_dimension_joins(self, query: str, intent: Dict[str, Any], joins: List[Dict[str, Any]],
+                                dimension_tables: List[str]) -> List[Dict[str, Any]]:
+        """分组维度在关联表中时，改为按关联表的字段分组，并返回到达该表所需的 JOIN"""
+        joined = {j["table"]: j for j in joins}
+        for table in dimension_tables:
+            if table not in joined:
+                continue
+            group_field = self._extract_group_field(query, table)
+            if not group_field:
+                continue
+            intent['group_field'] = f"{joined[table]['alias']}.{group_field}"
+            intent['group_by'] = True
+            return JoinPlanner.path_to(joins, table)
+        return []
 
-        return join_tables
-    
     def _generate_sql(self, primary_table: str, related_tables: List[str], 
-                    intent: Dict[str, Any], original_query: str) -> str:
+                    intent: Dict[str, Any], original_query: str,
+                    joins: Optional[List[Dict[str, Any]]] = None) -> str:
         """生成SQL查询"""
+        if joins:
+            return self._generate_join_sql(primary_table, joins, intent, original_query)
         
         # 基础SELECT部分
         if intent.get('count'):
@@ -429,7 +793,8 @@ class NLPQueryParser:
             where_clauses = [cond['condition'] for cond in where_conditions]
         else:
             # 兼容旧格式（字符串列表）
-            where_clauses = where_conditions
+            where_clauses = list(where_conditions)
+        where_clauses += self._value_conditions(intent, primary_table)
 
         # 添加额外的文本匹配条件
         if '用户' in original_query.lower():
@@ -528,6 +893,46 @@ class NLPQueryParser:
 
         return " ".join(sql_parts)
     
+    def _generate_join_sql(self, primary_table: str, joins: List[Dict[str, Any]],
+                           intent: Dict[str, Any], original_query: str) -> str:
+        """生成 JOIN 查询：按关联表维度分组统计，或按关联表上的取值过滤后统计/列出主表记录
+
+        时间条件只下推到被统计的主表（t0）：维度表上的时间字段表示实体的创建时间，
+        过滤它会把窗口之前创建的渠道/用户整个丢掉。每个 JOIN 的连接键至少一侧有索引。
+        """
+        time_conditions = self._extract_time_conditions(original_query.lower(), primary_table, alias="t0")
+        intent['time_conditions'] = time_conditions
+
+        primary_keys = self.db.get_table_structure(primary_table).get('primary_keys', [])
+        count_expr = f"COUNT(DISTINCT t0.{primary_keys[0]})" if len(primary_keys) == 1 else "COUNT(*)"
+        group_field = intent.get('group_field') if intent.get('group_by') else None
+        if group_field and '.' not in group_field:
+            group_field = f"t0.{group_field}"
+
+        if group_field:
+            select_clause = f"SELECT {group_field}, {count_expr} AS count_value"
+        elif intent.get('count'):
+            select_clause = f"SELECT {count_expr} AS count_value"
+        else:
+            select_clause = "SELECT t0.*"
+
+        sql_parts = [select_clause, f"FROM {primary_table} t0"]
+        for join in joins:
+            sql_parts.append(f"JOIN {join['table']} {join['alias']} ON {join['on']}")
+        where_clauses = [cond['condition'] for cond in time_conditions]
+        where_clauses += self._value_conditions(intent, primary_table, joins)
+        if where_clauses:
+            sql_parts.append("WHERE " + " AND ".join(where_clauses))
+        if group_field:
+            sql_parts.append(f"GROUP BY {group_field}")
+            sql_parts.append("ORDER BY count_value DESC")
+        elif not intent.get('count'):
+            time_field = self.time_field_mappings.get(primary_table)
+            if time_field:
+                sql_parts.append(f"ORDER BY t0.{time_field} DESC")
+            sql_parts.append("LIMIT 100")
+        return " ".join(sql_parts)
+
     def _determine_chart_type(self, intent: Dict[str, Any], query: str) -> str:
         """确定图表类型"""
         # 分组统计查询使用表格或柱状图
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+查询计划缓存
+按“规范化查询文本 + 表结构版本”缓存 NLPQueryParser.parse_query() 生成的执行计划，
+内存 LRU + 可选的 SQLite 持久化存储（跨进程 / 多次命令行调用复用）
+"""
+
+import copy
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Any, Iterable, Optional, Tuple
+
+
+def normalize_query(user_query: str) -> str:
+    """规范化自然语言查询：全角转半角、统一小写、去掉空白和句末标点
+
+    数字必须保留（“最近7天”和“最近3天”是不同的计划）。
+    """
+    text = unicodedata.normalize("NFKC", user_query or "").lower()
+    text = re.sub(r"\s+", "", text)
+    return text.rstrip("?？!！。.，,;；")
+
+
+class PlanCache:
+    def __init__(self, max_entries: int = 256, store_file: Optional[str] = None):
+        """初始化计划缓存
+
+        max_entries: 内存 LRU 容量
+        store_file: SQLite 持久化文件路径，为 None 时只使用内存缓存
+        """
+        self.max_entries = max_entries
+        self.store_file = store_file
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._store: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.misses = 0
+
+        if store_file:
+            try:
+                self._store = sqlite3.connect(store_file, check_same_thread=False)
+                self._store.execute(
+                    "CREATE TABLE IF NOT EXISTS plan_cache ("
+                    "cache_key TEXT PRIMARY KEY, plan_json TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+                self._store.execute(
+                    "CREATE TABLE IF NOT EXISTS plan_cache_meta ("
+                    "name TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at REAL NOT NULL)"
+                )
+                self._store.commit()
+            except sqlite3.Error as e:
+                print(f"警告: 无法打开计划缓存文件 {store_file}: {e}，仅使用内存缓存")
+                self._store = None
+
+    @staticmethod
+    def make_key(user_query: str, schema_version: str) -> str:
+        return f"{schema_version}:{normalize_query(user_query)}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取缓存的计划（返回副本，调用方可以随意修改）"""
+        with self._lock:
+            plan = self._entries.get(key)
+            if plan is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(plan)
+
+            if self._store is not None:
+                row = self._store.execute(
+                    "SELECT plan_json FROM plan_cache WHERE cache_key = ?", (key,)
+                ).fetchone()
+                if row:
+                    plan = json.loads(row[0])
+                    self._remember(key, plan)
+                    self.hits += 1
+                    return copy.deepcopy(plan)
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, plan: Dict[str, Any]):
+        """写入计划；只缓存成功的计划"""
+        if not plan.get("success"):
+            return
+        plan = copy.deepcopy(plan)
+        with self._lock:
+            self._remember(key, plan)
+            if self._store is not None:
+                try:
+                    self._store.execute(
+                        "INSERT OR REPLACE INTO plan_cache (cache_key, plan_json, created_at) VALUES (?, ?, ?)",
+                        (key, json.dumps(plan, ensure_ascii=False), time.time()),
+                    )
+                    self._store.commit()
+                except (sqlite3.Error, TypeError, ValueError) as e:
+                    print(f"警告: 写入计划缓存失败: {e}")
+
+    def get_meta(self, name: str) -> Optional[Tuple[str, float]]:
+        """读取持久化的辅助信息（如表结构版本），返回 (值, 写入时间)；没有持久化存储时返回 None"""
+        if self._store is None:
+            return None
+        with self._lock:
+            row = self._store.execute(
+                "SELECT value, updated_at FROM plan_cache_meta WHERE name = ?", (name,)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def put_meta(self, name: str, value: str):
+        if self._store is None:
+            return
+        with self._lock:
+            try:
+                self._store.execute(
+                    "INSERT OR REPLACE INTO plan_cache_meta (name, value, updated_at) VALUES (?, ?, ?)",
+                    (name, value, time.time()),
+                )
+                self._store.commit()
+            except sqlite3.Error as e:
+                print(f"警告: 写入计划缓存失败: {e}")
+
+    def _remember(self, key: str, plan: Dict[str, Any]):
+        self._entries[key] = plan
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    @staticmethod
+    def _plan_tables(plan: Dict[str, Any]) -> set:
+        tables = {plan.get("primary_table")}
+        tables.update(plan.get("related_tables") or [])
+        tables.update(match[0] for match in plan.get("table_matches") or [])
+        return tables
+
+    def invalidate(self, tables: Iterable[str], terms: Iterable[str] = ()) -> int:
+        """删除引用了这些表、或查询文本中包含这些词的计划（实体配置部分变化时使用），返回删除的条数"""
+        tables = set(tables)
+        terms = [normalize_query(term) for term in terms if term]
+
+        def affected(key: str, plan: Dict[str, Any]) -> bool:
+            # 缓存键以规范化后的查询文本结尾，词的误命中只会多删除几条计划
+            return bool(self._plan_tables(plan) & tables) or any(term in key for term in terms)
+
+        with self._lock:
+            stale = [key for key, plan in self._entries.items() if affected(key, plan)]
+            for key in stale:
+                del self._entries[key]
+            removed = set(stale)
+            if self._store is not None:
+                try:
+                    for key, plan_json in self._store.execute("SELECT cache_key, plan_json FROM plan_cache").fetchall():
+                        if key not in removed and affected(key, json.loads(plan_json)):
+                            removed.add(key)
+                    self._store.executemany("DELETE FROM plan_cache WHERE cache_key = ?", [(key,) for key in removed])
+                    self._store.commit()
+                except (sqlite3.Error, ValueError) as e:
+                    print(f"警告: 清理计划缓存失败: {e}")
+            return len(removed)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._store is not None:
+                self._store.execute("DELETE FROM plan_cache")
+                self._store.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+"""
+追问预取
+常驻进程（交互模式、定时刷新、库方式调用）中，一个问题执行完后，在后台以低优先级预先执行最可能的追问，
+结果放入连接器的结果缓存，用户接着问时直接返回：
+
+- 趋势：同一实体“最近7天趋势”
+- 上一周期：今天 → 昨天、本周 → 上周、本月 → 上月
+- 下钻：分组结果中排名靠前的分组（“各渠道用户数” → “huawei渠道用户数”），
+  或按主表有索引的低基数列分组（取值字典中的列）
+
+追问由原问题改写成自然语言后交给同样配置的解析器生成计划，SQL 与用户真正这样问时完全一致；
+主表不同、改写没有生效的计划直接丢弃。解析器和连接都是预取线程自己的（不改动前台解析器的状态、
+计划缓存和运行指标，也不使用主连接），受每个问题的条数、每分钟的条数、单条超时和结果行数限制；
+主连接上有前台查询时不开始新的预取，前台查询开始时取消正在执行的预取（KILL QUERY）。
+前台查询恰好是正在预取的语句时等待其结果，不重复执行。
+
+默认关闭：只适合有人连续追问的交互模式，定时刷新、负载测试等无人值守的常驻进程不应产生额外查询。
+"""
+
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, List, Any, Callable, Optional, Tuple
+
+from single_flight import normalize_sql
+from prepared_statements import plan_statement
+from monitoring import PREFETCH_QUERIES
+
+DEFAULT_PREFETCH_CONFIG = {
+    # 只在常驻的生成器（keep_connection=True）上生效；交互模式也可以用 --prefetch 开启
+    "enabled": False,
+    # 每个问题最多预取的追问数
+    "max_queries": 3,
+    # 每分钟最多预取的查询数（限制额外的数据库负载）
+    "max_queries_per_minute": 30,
+    # 单条预取查询的截止时间（秒）
+    "timeout_seconds": 10,
+    # 结果超过该行数时不缓存
+    "max_rows": 10000,
+    # 预取结果的有效期（秒）和最多保存的条数
+    "ttl_seconds": 120,
+    "max_entries": 64,
+    # 趋势追问的天数
+    "trend_days": 7,
+    # 分组结果下钻的分组数、按索引列分组的列数
+    "drill_values": 2,
+    "group_columns": 2,
+}
+
+# 主连接忙时最多等待多久再开始预取（秒），仍然忙则放弃本轮预取
+IDLE_WAIT_SECONDS = 0.5
+
+# 当前周期 → 上一周期（查询模式名, 替换文本）
+_PREVIOUS_PERIODS = {
+    "today": "昨天",
+    "this_week": "上周",
+    "this_month": "上月",
+}
+
+_GROUP_MARKER = re.compile(r"(各|每个|每|按|不同)")
+
+
+def prefetch_config(config: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    merged = dict(DEFAULT_PREFETCH_CONFIG)
+    merged.update({k: v for k, v in (config or {}).items() if not str(k).startswith("_")})
+    return merged
+
+
+def validate(config: Any) -> List[str]:
+    """校验 prefetch 配置，返回错误列表"""
+    if not isinstance(config, dict):
+        return ["prefetch 必须是对象"]
+    errors = []
+    if "enabled" in config and not isinstance(config["enabled"], bool):
+        errors.append("prefetch.enabled 需要 true/false")
+    for field in ("max_queries", "max_queries_per_minute", "max_rows", "max_entries", "trend_days",
+                  "drill_values", "group_columns"):
+        if field in config and (not isinstance(config[field], int) or config[field] < 0):
+            errors.append(f"prefetch.{field} 需要非负整数")
+    for field in ("timeout_seconds", "ttl_seconds"):
+        if field in config and (not isinstance(config[field], (int, float)) or config[field] <= 0):
+            errors.append(f"prefetch.{field} 需要正数")
+    return errors
+
+
+class ResultCache:
+    def __init__(self, max_entries: int = DEFAULT_PREFETCH_CONFIG["max_entries"],
+                 ttl_seconds: float = DEFAULT_PREFETCH_CONFIG["ttl_seconds"]):
+        """预取结果缓存：规范化 SQL（含参数）→ execute_query 结果，按有效期和最近使用淘汰
+
+        正在预取的语句登记为 pending，前台查询到同一语句时等待其完成；
+        前台查询未命中时通知监听者（预取器借此让出数据库）。
+        """
+        self.max_entries = max(int(max_entries), 1)
+        self.ttl_seconds = float(ttl_seconds)
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._pending: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[], None]] = []
+
+    def add_listener(self, callback: Callable[[], None]):
+        """前台查询需要访问数据库（未命中缓存）时调用 callback"""
+        self._listeners.append(callback)
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, result = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return result
+
+    def lookup(self, key: str, wait: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """前台查询：命中时返回缓存的结果；该语句正在预取时最多等待 wait 秒；未命中时通知监听者"""
+        if not self._entries and not self._pending:
+            self._notify()
+            return None
+        result = self._get(key)
+        if result is None:
+            pending = self._pending.get(key)
+            if pending is not None and pending.wait(wait):
+                result = self._get(key)
+        if result is None:
+            self._notify()
+        return result
+
+    def _notify(self):
+        for callback in self._listeners:
+            callback()
+
+    def contains(self, key: str) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and time.monotonic() - entry[0] <= self.ttl_seconds
+
+    def claim(self, key: str) -> bool:
+        """登记为正在预取（已缓存或已在预取时返回 False）"""
+        with self._lock:
+            if key in self._pending:
+                return False
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl_seconds:
+                return False
+            self._pending[key] = threading.Event()
+            return True
+
+    def release(self, key: str, result: Optional[Dict[str, Any]] = None):
+        """结束预取：result 不为 None 时写入缓存，唤醒等待该语句的前台查询"""
+        with self._lock:
+            if result is not None:
+                self._entries[key] = (time.monotonic(), result)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            pending = self._pending.pop(key, None)
+        if pending is not None:
+            pending.set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class Prefetcher:
+    def __init__(self, db, parser, config: Optional[Dict[str, Any]] = None):
+        """db: 前台使用的 SmartDBConnector（结果写入其 result_cache）；parser: 前台的 NLPQueryParser
+
+        预取查询在一个后台线程中逐条执行，使用单独的连接和绑定在该连接上的解析器（第一次预取时建立）；
+        前台解析器只用来读取实体配置、生成追问。
+        """
+        self.db = db
+        self.parser = parser
+        self.config = prefetch_config(config)
+        self.cache: ResultCache = db.enable_result_cache()
+        self.cache.add_listener(self.preempt)
+        self._jobs: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=1)
+        self._generation = 0
+        self._cancel: Optional[threading.Event] = None
+        self._lock = threading.Lock()
+        self._started: "deque[float]" = deque()
+        self._connector = None
+        self._parser = None
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    # ---------- 前台接口 ----------
+
+    def schedule(self, user_query: str, result: Dict[str, Any]):
+        """问题执行成功后调用：丢弃尚未开始的上一轮预取，把这一轮交给后台线程（不阻塞）"""
+        if self._closed or self.config["max_queries"] <= 0:
+            return
+        with self._lock:
+            self._generation += 1
+            job = (self._generation, user_query, result)
+        try:
+            self._jobs.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            self._jobs.put_nowait(job)
+        except queue.Full:
+            return
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="query-prefetch", daemon=True)
+            self._thread.start()
+
+    def preempt(self):
+        """前台查询要访问数据库：取消正在执行的预取，放弃这一轮剩余的追问"""
+        with self._lock:
+            self._generation += 1
+            cancel = self._cancel
+        if cancel is not None:
+            cancel.set()
+
+    def close(self):
+        self._closed = True
+        self.preempt()
+        try:
+            self._jobs.put_nowait(None)
+        except queue.Full:
+            pass
+        if self._connector is not None:
+            self._connector.disconnect()
+
+    # ---------- 追问 ----------
+
+    def _subject(self, user_query: str, primary_table: str) -> Optional[str]:
+        """问题中指代主表的实体名（最长的一个）"""
+        query_lower = user_query.lower()
+        names = [name for name, table in self.parser.catalog.entity_names.items()
+                 if table == primary_table and name in query_lower]
+        return max(names, key=len) if names else None
+
+    def follow_ups(self, user_query: str, result: Dict[str, Any]) -> List[Tuple[str, str]]:
+        """按可能性排列的追问 [(类型, 问题)]：趋势、上一周期、分组下钻、按索引列分组"""
+        plan = result.get("query_plan") or {}
+        primary_table = plan.get("primary_table")
+        if not primary_table:
+            return []
+        intent = plan.get("query_intent") or {}
+        subject = self._subject(user_query, primary_table)
+        candidates: List[Tuple[str, str]] = []
+
+        if subject and primary_table in self.parser.time_field_mappings:
+            candidates.append(("trend", f"{subject}最近{self.config['trend_days']}天趋势"))
+
+        for kind, previous in _PREVIOUS_PERIODS.items():
+            pattern = self.parser.query_patterns.get(kind)
+            if pattern and re.search(pattern, user_query):
+                candidates.append(("previous_period", re.sub(pattern, previous, user_query, count=1)))
+                break
+
+        grouped = intent.get("group_by") and intent.get("group_field")
+        if grouped and _GROUP_MARKER.search(user_query):
+            columns = result.get("columns") or []
+            data = result.get("data") or []
+            for row in list(data[:self.config["drill_values"]]):
+                value = row.get(columns[0]) if columns else None
+                if isinstance(value, str) and value:
+                    candidates.append(("drill_down", _GROUP_MARKER.sub(
+                        # 英文取值与后面的英文单词之间留空格，取值字典按完整单词识别
+                        lambda m: value + (" " if re.match(r"[A-Za-z0-9_]", user_query[m.end():m.end() + 1]) else ""),
+                        user_query, count=1,
+                    )))
+        elif subject:
+            dictionary = (self.db.column_values.get(primary_table) or {}).get("columns", {})
+            indexed = [column for column, info in dictionary.items() if info.get("indexed")]
+            for column in indexed[:self.config["group_columns"]]:
+                # 优先用列的中文叫法（column_aliases），与用户的说法一致
+                label = (self.parser.column_aliases.get(column) or [column])[0]
+                candidates.append(("group_by", f"各{label}的{subject}数量"))
+        return candidates
+
+    def _accept(self, kind: str, plan: Dict[str, Any], original: Dict[str, Any]) -> bool:
+        """改写后的问题确实得到了预期的计划：主表不变，且趋势/上一周期/下钻/分组的改写生效"""
+        if not plan.get("success") or plan.get("primary_table") != original.get("primary_table"):
+            return False
+        intent = plan.get("query_intent") or {}
+        if kind in ("trend", "previous_period"):
+            return bool(intent.get("time_conditions"))
+        if kind == "drill_down":
+            return bool(intent.get("value_filters")) and not intent.get("group_by")
+        return bool(intent.get("group_by") and intent.get("group_field"))
+
+    # ---------- 后台执行 ----------
+
+    def _current(self, generation: int) -> bool:
+        return not self._closed and generation == self._generation
+
+    def _wait_idle(self, generation: int) -> bool:
+        """等主连接上没有前台查询；超过 IDLE_WAIT_SECONDS 仍然忙时放弃"""
+        waited_until = time.monotonic() + IDLE_WAIT_SECONDS
+        while self.db.active_queries > 0:
+            if time.monotonic() >= waited_until or not self._current(generation):
+                return False
+            time.sleep(0.02)
+        return self._current(generation)
+
+    def _within_budget(self) -> bool:
+        now = time.monotonic()
+        while self._started and now - self._started[0] > 60:
+            self._started.popleft()
+        return len(self._started) < self.config["max_queries_per_minute"]
+
+    def _ensure_connector(self):
+        if self._connector is None:
+            database = self.db.config.get("name") or self.db.config.get("database") or ""
+            # 单独的实例和连接；name 区分运行指标中的主连接
+            self._connector = type(self.db)(self.db.config_file, config=dict(self.db.config, name=f"{database}:prefetch"))
+        connection = self._connector.connection
+        if connection is None or not connection.is_connected():
+            if not self._connector.connect(verbose=False):
+                return None
+        return self._connector
+
+    def _ensure_parser(self):
+        """预取线程自己的解析器（同一份 entity_config.json），表结构、计划缓存都在预取连接上"""
+        connector = self._ensure_connector()
+        if connector is None:
+            return None
+        if self._parser is None:
+            self._parser = type(self.parser)(connector, config_file=self.parser.config_file, record_metrics=False,
+                                             build_value_dictionary=False)
+        # 复用前台已构建的取值字典（浅拷贝：预取一侧构建的字典不改变前台的字典版本和计划缓存）
+        connector.column_values = {**connector.column_values, **self.db.column_values}
+        return self._parser
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            try:
+                self._prefetch(*job)
+            except Exception as e:
+                PREFETCH_QUERIES.inc(result="failed")
+                print(f"⚠️ 预取追问失败: {e}")
+
+    def _prefetch(self, generation: int, user_query: str, result: Dict[str, Any]):
+        original = result.get("query_plan") or {}
+        seen = {normalize_sql(*plan_statement(original))} if original.get("sql_query") else set()
+        executed = 0
+        for kind, question in self.follow_ups(user_query, result):
+            if executed >= self.config["max_queries"] or not self._current(generation):
+                return
+            # 解析追问（可能读取表结构、构建取值字典）前同样等前台空闲
+            if not self._wait_idle(generation):
+                PREFETCH_QUERIES.inc(result="skipped")
+                return
+            parser = self._ensure_parser()
+            if parser is None:
+                return
+            plan = parser.parse_query(question)
+            if not self._accept(kind, plan, original):
+                continue
+            sql, params = plan_statement(plan)
+            key = normalize_sql(sql, params)
+            if key in seen or self.cache.contains(key):
+                continue
+            seen.add(key)
+            if not self._within_budget() or not self._wait_idle(generation):
+                PREFETCH_QUERIES.inc(result="skipped")
+                return
+            if not self.cache.claim(key):
+                return
+            connector = self._connector
+            cancel = threading.Event()
+            with self._lock:
+                if not self._current(generation):
+                    self.cache.release(key)
+                    return
+                self._cancel = cancel
+            self._started.append(time.monotonic())
+            executed += 1
+            stored = None
+            try:
+                sql_result = connector.execute_query(
+                    sql, params, timeout=self.config["timeout_seconds"], cancel_event=cancel
+                )
+                if sql_result.get("timeout") or not sql_result.get("success"):
+                    PREFETCH_QUERIES.inc(result="cancelled" if cancel.is_set() else "failed")
+                elif sql_result.get("row_count", 0) > self.config["max_rows"]:
+                    PREFETCH_QUERIES.inc(result="skipped")
+                else:
+                    stored = dict(sql_result, prefetch={"kind": kind, "question": question})
+                    PREFETCH_QUERIES.inc(result="stored")
+            finally:
+                with self._lock:
+                    self._cancel = None
+                self.cache.release(key, stored)
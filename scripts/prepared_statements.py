@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+SQL 参数化与服务器端预处理语句缓存
+生成的 SQL 中会变化的只有字符串取值、INTERVAL 的数量和 LIMIT/OFFSET，把它们换成 %s 占位符后，
+同一类问题（“最近7天/最近30天”“渠道为华为/小米”）得到同一个 SQL 模板：
+
+- 模板在每个连接上只 PREPARE 一次，之后只发送参数（二进制协议），MySQL 不再重复解析 SQL
+- 单飞去重、计划缓存等以“模板 + 参数”为键，同一模板的变体不再各自占一份
+
+每个连接一个 StatementCache，按模板 LRU 淘汰（淘汰时关闭游标，释放服务器端语句）。
+参数化在分表 UNION / 分区改写之后对最终 SQL 进行，改写逻辑无需关心占位符。
+
+其余数字字面量保留在模板中：取值过滤总是生成字符串字面量（value_dictionary.sql_literal），
+生成的 SQL 里剩下的整数都是结构性的（YEARWEEK(col, 1) 的模式、固定阈值），不随问题变化；
+其中 ORDER BY / GROUP BY 的列序号换成占位符后会变成常量表达式，语义也会改变。
+没有可提取的字面量时不使用预处理语句（省去一次 PREPARE 往返和缓存位置）。
+"""
+
+import re
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple
+
+DEFAULT_PREPARED_CONFIG = {
+    "enabled": True,
+    # 每个连接最多保留的预处理语句数（MySQL 全局上限 max_prepared_stmt_count 默认 16382）
+    "cache_size": 64,
+}
+
+# 预处理语句失效（连接重连后服务器端语句已不存在）
+UNKNOWN_STATEMENT_ERRNOS = {1243}
+# 语句不支持预处理协议
+UNSUPPORTED_ERRNOS = {1295}
+
+_TOKEN = re.compile(
+    r"""
+    (?P<string>'(?:[^'\\]|\\.|'')*')
+    | (?P<comment>/\*.*?\*/|--[^\n]*|\#[^\n]*)
+    | (?P<quoted>`(?:[^`]|``)*`|"(?:[^"\\]|\\.)*")
+    | (?P<word>[A-Za-z_][\w$]*)
+    | (?P<number>\d+(?:\.\d+)?)
+    | (?P<percent>%)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+# 其后紧跟的整数作为参数
+_COUNT_KEYWORDS = {"INTERVAL", "LIMIT", "OFFSET"}
+_ESCAPES = {"0": "\0", "b": "\b", "n": "\n", "r": "\r", "t": "\t", "Z": "\x1a"}
+
+
+def _unquote(literal: str) -> str:
+    body = literal[1:-1].replace("''", "'")
+    return re.sub(
+        r"\\(.)",
+        lambda m: "\\" + m.group(1) if m.group(1) in "%_" else _ESCAPES.get(m.group(1), m.group(1)),
+        body,
+        flags=re.DOTALL,
+    )
+
+
+def parameterize(sql: str) -> Tuple[str, Optional[List[Any]]]:
+    """把 SQL 中的字符串字面量和 INTERVAL/LIMIT/OFFSET 后的整数换成 %s，返回 (模板, 参数列表)
+
+    SQL 中有字面量以外的 %（无法安全地用作 %s 模板）或没有可提取的字面量时返回 (原 SQL, None)。
+    """
+    template: List[str] = []
+    params: List[Any] = []
+    position = 0
+    # 下一个整数是否为 INTERVAL / LIMIT / OFFSET 的数量
+    count_expected = in_limit = False
+    for match in _TOKEN.finditer(sql):
+        kind = match.lastgroup
+        text = match.group()
+        if kind == "percent":
+            return sql, None
+        template.append(sql[position:match.start()])
+        position = match.end()
+        if kind == "string":
+            template.append("%s")
+            params.append(_unquote(text))
+        elif kind == "number" and count_expected and "." not in text:
+            template.append("%s")
+            params.append(int(text))
+        else:
+            template.append(text)
+
+        if kind == "word":
+            count_expected = text.upper() in _COUNT_KEYWORDS
+            in_limit = text.upper() == "LIMIT"
+        elif kind == "number" and in_limit and sql[position:].lstrip().startswith(","):
+            # LIMIT offset, count
+            count_expected, in_limit = True, False
+        else:
+            count_expected = in_limit = False
+    if not params:
+        return sql, None
+    template.append(sql[position:])
+    return "".join(template), params
+
+
+def plan_statement(plan: Dict[str, Any]) -> Tuple[str, Optional[tuple]]:
+    """查询计划中要执行的 (SQL 模板, 参数)；旧版本缓存的计划没有模板时返回原 SQL"""
+    if plan.get("sql_template") is not None and plan.get("sql_params") is not None:
+        return plan["sql_template"], tuple(plan["sql_params"])
+    return plan["sql_query"], None
+
+
+def validate(config: Any) -> List[str]:
+    """校验 prepared_statements 配置，返回错误列表"""
+    if not isinstance(config, dict):
+        return ["prepared_statements 必须是对象"]
+    errors = []
+    if "enabled" in config and not isinstance(config["enabled"], bool):
+        errors.append("prepared_statements.enabled 需要 true/false")
+    if "cache_size" in config and (not isinstance(config["cache_size"], int) or config["cache_size"] < 1):
+        errors.append("prepared_statements.cache_size 需要正整数")
+    return errors
+
+
+class StatementCache:
+    def __init__(self, max_size: int = DEFAULT_PREPARED_CONFIG["cache_size"]):
+        """单个连接上的预处理语句：模板 → 预处理游标（按最近使用淘汰）
+
+        不持有连接本身（缓存按连接弱引用保存，连接释放后随之丢弃）。
+        """
+        self.max_size = max(int(max_size), 1)
+        # 模板 → (首次出现的模板字符串对象, 游标)：驱动按对象身份判断语句是否已 PREPARE
+        self._statements: "OrderedDict[str, Tuple[str, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, connection, template: str) -> Tuple[str, Any, bool]:
+        """返回 (要传给 execute 的模板对象, 预处理游标, 是否已缓存)"""
+        entry = self._statements.get(template)
+        if entry is not None:
+            self._statements.move_to_end(template)
+            self.hits += 1
+            return entry[0], entry[1], True
+
+        self.misses += 1
+        cursor = connection.cursor(prepared=True)
+        self._statements[template] = (template, cursor)
+        if len(self._statements) > self.max_size:
+            _, (_, evicted) = self._statements.popitem(last=False)
+            self.evictions += 1
+            self._close_cursor(evicted)
+        return template, cursor, False
+
+    def discard(self, template: str):
+        """语句执行出错时丢弃（下次重新 PREPARE）"""
+        entry = self._statements.pop(template, None)
+        if entry is not None:
+            self._close_cursor(entry[1])
+
+    def clear(self):
+        for _, cursor in self._statements.values():
+            self._close_cursor(cursor)
+        self._statements.clear()
+
+    def __len__(self) -> int:
+        return len(self._statements)
+
+    @staticmethod
+    def _close_cursor(cursor):
+        try:
+            cursor.close()
+        except Exception:
+            pass
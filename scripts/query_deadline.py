@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+查询截止时间与取消
+每次 execute_query 都带一个截止时间（db_config.json 的 query_timeout.seconds，或调用时给出的 timeout）：
+
+- SELECT 注入 MAX_EXECUTION_TIME 优化器提示，由 MySQL 在截止时间自行中止查询
+- 客户端看门狗线程在截止时间加 kill_grace_seconds 后仍未返回（提示不生效的语句、读取结果过慢）、
+  调用方设置了取消事件（如 HTTP 客户端断开）时，另开一条连接执行 KILL QUERY，
+  执行线程随即收到“查询被中断”错误，返回超时结果而不是一直挂起
+- Ctrl-C 中断正在执行的查询时同样 KILL QUERY，不会留下仍在服务器上运行的查询
+
+已经读到一部分结果时返回部分结果（partial），没有结果时返回超时错误。
+"""
+
+import re
+import threading
+import time
+from typing import Dict, Any, Callable, List, Optional
+
+DEFAULT_TIMEOUT_CONFIG = {
+    # 单个查询的截止时间（秒），0 表示不限制
+    "seconds": 60,
+    # 截止时间过后再等这么久仍未返回时，客户端主动 KILL QUERY
+    "kill_grace_seconds": 1.0,
+    # 读取结果时每批的行数（两批之间检查截止时间，超时时保留已读取的行）
+    "fetch_batch_rows": 5000,
+}
+
+# MySQL 错误码：3024 超过 MAX_EXECUTION_TIME，1317 查询被 KILL QUERY 中断
+TIMEOUT_ERRNOS = {3024, 1317}
+
+# 看门狗检查取消事件的间隔（秒）
+_CANCEL_POLL_SECONDS = 0.05
+
+
+def timeout_config(config: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    merged = dict(DEFAULT_TIMEOUT_CONFIG)
+    merged.update({k: v for k, v in (config or {}).items() if not str(k).startswith("_")})
+    return merged
+
+
+def validate(config: Any) -> List[str]:
+    """校验 query_timeout 配置，返回错误列表"""
+    if not isinstance(config, dict):
+        return ["query_timeout 必须是对象"]
+    errors = []
+    for field in ("seconds", "kill_grace_seconds"):
+        value = config.get(field)
+        if value is not None and (not isinstance(value, (int, float)) or value < 0):
+            errors.append(f"query_timeout.{field} 需要非负数字")
+    if "fetch_batch_rows" in config and (not isinstance(config["fetch_batch_rows"], int)
+                                         or config["fetch_batch_rows"] < 1):
+        errors.append("query_timeout.fetch_batch_rows 需要正整数")
+    return errors
+
+
+def add_max_execution_time(query: str, milliseconds: int) -> str:
+    """在 SELECT 后注入 MAX_EXECUTION_TIME 优化器提示（已有提示则不重复添加）"""
+    if "MAX_EXECUTION_TIME" in query.upper():
+        return query
+    return re.sub(
+        r"^\s*SELECT\b",
+        f"SELECT /*+ MAX_EXECUTION_TIME({max(int(milliseconds), 1)}) */",
+        query,
+        count=1,
+        flags=re.IGNORECASE,
+    )
+
+
+class Deadline:
+    def __init__(self, seconds: Optional[float] = None, cancel_event: Optional[threading.Event] = None):
+        """seconds: 从现在起的时限（None 或 0 表示不限时）；cancel_event: 调用方设置后立即取消查询"""
+        self.seconds = seconds or None
+        self.expires_at = time.monotonic() + seconds if seconds else None
+        self.cancel_event = cancel_event
+
+    @property
+    def active(self) -> bool:
+        return self.expires_at is not None or self.cancel_event is not None
+
+    def remaining(self) -> Optional[float]:
+        """剩余秒数（不限时返回 None，已过期返回 0）"""
+        if self.expires_at is None:
+            return None
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def expired(self) -> bool:
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            return True
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def hint_ms(self) -> Optional[int]:
+        """MAX_EXECUTION_TIME 提示的毫秒数（不限时返回 None）
+
+        使用完整时限而不是剩余时间：同一条 SQL 的文本保持不变，预处理语句可以复用；
+        执行前已消耗的时间（等待共享结果、EXPLAIN）由看门狗兜底。
+        """
+        return None if self.seconds is None else max(int(self.seconds * 1000), 1)
+
+
+class QueryWatchdog:
+    def __init__(self, deadline: Deadline, kill: Callable[[], bool], grace_seconds: float = 1.0):
+        """deadline 到期（加 grace_seconds）或取消事件被设置时调用 kill（在旁路连接上 KILL QUERY）
+
+        reason 记录触发原因："timeout" / "cancelled" / "interrupted"，未触发时为 None。
+        """
+        self.deadline = deadline
+        self.grace_seconds = grace_seconds
+        self._kill = kill
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self.reason: Optional[str] = None
+        self.killed = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "QueryWatchdog":
+        if self.deadline.active:
+            self._thread = threading.Thread(target=self._watch, name="query-watchdog", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def trigger(self, reason: str):
+        """取消查询（只执行一次）"""
+        with self._lock:
+            if self.reason is not None:
+                return
+            self.reason = reason
+        self.killed = self._kill()
+
+    def _watch(self):
+        kill_at = None
+        if self.deadline.expires_at is not None:
+            kill_at = self.deadline.expires_at + self.grace_seconds
+        while True:
+            wait = None if kill_at is None else max(kill_at - time.monotonic(), 0.0)
+            if self.deadline.cancel_event is not None:
+                wait = _CANCEL_POLL_SECONDS if wait is None else min(wait, _CANCEL_POLL_SECONDS)
+            if self._stopped.wait(wait):
+                return
+            if self.deadline.cancel_event is not None and self.deadline.cancel_event.is_set():
+                self.trigger("cancelled")
+                return
+            if kill_at is not None and time.monotonic() >= kill_at:
+                self.trigger("timeout")
+                return
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+查询成本守卫
+执行前运行 EXPLAIN FORMAT=JSON，估算扫描行数并检查索引使用情况，
+按 db_config.json 中 query_guard 的阈值决定：放行 / 加 MAX_EXECUTION_TIME 提示 / 拒绝 / 转只读副本 / 降级为采样查询
+"""
+
+import json
+import re
+from typing import Dict, Any, List, Optional
+from query_deadline import add_max_execution_time
+
+
+DEFAULT_GUARD_CONFIG = {
+    "enabled": False,
+    # 估算扫描行数超过该值时加 MAX_EXECUTION_TIME 提示
+    "hint_rows": 200000,
+    # 估算扫描行数超过该值时执行 on_exceed 动作
+    "max_rows": 5000000,
+    # 超过 max_rows 时的动作: reject / replica / sample
+    "on_exceed": "reject",
+    # 全表扫描（access_type=ALL）且行数超过该值时，至少加执行时间提示
+    "full_scan_rows": 100000,
+    "max_execution_time_ms": 30000,
+    # 采样降级时读取的最新行数（按主键倒序）
+    "sample_rows": 100000,
+}
+
+GUARD_ACTIONS = {"reject", "replica", "sample"}
+
+_FROM_PATTERN = re.compile(r"\bFROM\s+(`?)(\w+)\1", re.IGNORECASE)
+
+
+class QueryGuard:
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = dict(DEFAULT_GUARD_CONFIG)
+        self.config.update(config or {})
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.config.get("enabled"))
+
+    @staticmethod
+    def validate(config: Any) -> List[str]:
+        """校验 query_guard 配置，返回错误列表"""
+        if not isinstance(config, dict):
+            return ["query_guard 必须是对象"]
+        errors = []
+        for field in ("hint_rows", "max_rows", "full_scan_rows", "max_execution_time_ms", "sample_rows"):
+            if field in config and not isinstance(config[field], int):
+                errors.append(f"query_guard.{field} 需要整数")
+        if config.get("on_exceed", "reject") not in GUARD_ACTIONS:
+            errors.append(f"query_guard.on_exceed 只能是: {', '.join(sorted(GUARD_ACTIONS))}")
+        return errors
+
+    def analyze_explain(self, explain_json: Any) -> Dict[str, Any]:
+        """解析 EXPLAIN FORMAT=JSON 的输出，估算扫描行数和索引使用"""
+        if isinstance(explain_json, (bytes, bytearray)):
+            explain_json = explain_json.decode("utf-8")
+        if isinstance(explain_json, str):
+            explain_json = json.loads(explain_json)
+
+        tables: List[Dict[str, Any]] = []
+        self._collect_tables(explain_json, tables)
+
+        # 嵌套循环：每个表的扫描次数 = 前面所有表产出行数的乘积
+        estimated_rows = 0
+        prefix_rows = 1
+        for table in tables:
+            examined = table["rows_examined"]
+            estimated_rows += prefix_rows * examined
+            prefix_rows *= max(table["rows_produced"], 1)
+
+        query_cost = None
+        cost_info = (explain_json.get("query_block") or {}).get("cost_info") if isinstance(explain_json, dict) else None
+        if cost_info and cost_info.get("query_cost") is not None:
+            query_cost = float(cost_info["query_cost"])
+
+        return {
+            "estimated_rows": int(estimated_rows),
+            "query_cost": query_cost,
+            "full_scan_tables": [t["table_name"] for t in tables if t["access_type"] == "ALL"],
+            "indexes_used": [f"{t['table_name']}.{t['key']}" for t in tables if t["key"]],
+            "tables": tables,
+        }
+
+    def _collect_tables(self, node: Any, tables: List[Dict[str, Any]]):
+        if isinstance(node, list):
+            for item in node:
+                self._collect_tables(item, tables)
+            return
+        if not isinstance(node, dict):
+            return
+
+        table = node.get("table")
+        if isinstance(table, dict) and "table_name" in table:
+            examined = table.get("rows_examined_per_scan", table.get("rows", 0)) or 0
+            produced = table.get("rows_produced_per_join", examined) or 0
+            tables.append({
+                "table_name": table["table_name"],
+                "access_type": table.get("access_type"),
+                "key": table.get("key"),
+                "possible_keys": table.get("possible_keys") or [],
+                "rows_examined": int(examined),
+                "rows_produced": int(produced),
+            })
+            # 派生表/子查询仍需继续向下遍历
+            self._collect_tables(table.get("materialized_from_subquery"), tables)
+            return
+
+        for key, value in node.items():
+            if isinstance(value, (dict, list)):
+                self._collect_tables(value, tables)
+
+    def decide(self, analysis: Dict[str, Any], has_replica: bool = False) -> Dict[str, Any]:
+        """根据估算结果和阈值给出决策"""
+        rows = analysis["estimated_rows"]
+        full_scans = analysis["full_scan_tables"]
+
+        if rows >= self.config["max_rows"]:
+            action = self.config.get("on_exceed", "reject")
+            reason = f"估算扫描 {rows} 行，超过上限 {self.config['max_rows']}"
+            if action == "replica" and not has_replica:
+                # 未配置只读副本时退化为带执行时间上限的查询
+                return {"decision": "hint", "reason": reason + "，未配置只读副本，改为限制执行时间"}
+            return {"decision": action, "reason": reason}
+
+        if rows >= self.config["hint_rows"]:
+            return {"decision": "hint", "reason": f"估算扫描 {rows} 行，超过 {self.config['hint_rows']}"}
+
+        if full_scans and rows >= self.config["full_scan_rows"]:
+            return {"decision": "hint", "reason": f"全表扫描: {', '.join(full_scans)}"}
+
+        return {"decision": "allow", "reason": ""}
+
+    def add_execution_time_hint(self, query: str) -> str:
+        """在 SELECT 后注入 MAX_EXECUTION_TIME 优化器提示（已有提示则不重复添加）"""
+        return add_max_execution_time(query, self.config["max_execution_time_ms"])
+
+    def rewrite_sampled(self, query: str, table_name: str, primary_keys: List[str],
+                        database: Optional[str] = None) -> Optional[str]:
+        """把查询降级为近似/采样查询，无法降级时返回 None
+
+        - 无条件 COUNT(*)：改读 information_schema.TABLES.TABLE_ROWS 估算值
+        - 其他查询：只扫描按主键倒序的最新 sample_rows 行（走主键索引，扫描量有上界）
+        """
+        simple_count = re.match(
+            r"^\s*SELECT\s+COUNT\(\*\)\s+(?:AS\s+)?(\w+)\s+FROM\s+`?(\w+)`?\s*$", query, re.IGNORECASE
+        )
+        if simple_count and database:
+            alias = simple_count.group(1)
+            return (
+                f"SELECT TABLE_ROWS AS {alias} FROM information_schema.TABLES "
+                f"WHERE TABLE_SCHEMA = '{database}' AND TABLE_NAME = '{simple_count.group(2)}'"
+            )
+
+        if not primary_keys:
+            return None
+
+        order_by = ", ".join(f"{pk} DESC" for pk in primary_keys)
+        sample_source = (
+            f"FROM (SELECT * FROM {table_name} ORDER BY {order_by} "
+            f"LIMIT {int(self.config['sample_rows'])}) AS {table_name}"
+        )
+        rewritten, count = _FROM_PATTERN.subn(
+            lambda m: sample_source if m.group(2) == table_name else m.group(0), query, count=1
+        )
+        return rewritten if count else None
+
+    @staticmethod
+    def primary_table(query: str) -> Optional[str]:
+        match = _FROM_PATTERN.search(query)
+        return match.group(2) if match else None
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+单次查询剖析（--profile cpu|mem）
+对一次 process_query / create_dashboard 运行做 CPU 或内存剖析，报告写在输出文件旁边：
+
+- cpu：cProfile，写出 <输出>.cpu.pstats（可用 python -m pstats / snakeviz 查看），
+  并按自身耗时汇总热点函数和耗时去向（数据库驱动、SequenceMatcher、JSON 编码、字符串替换、正则等）
+- mem：tracemalloc，写出 <输出>.mem.json：峰值内存、运行结束时仍占用的内存和分配最多的代码行
+
+cProfile 只统计调用线程，多库并行查询的工作线程、看门狗线程中的耗时不计入 CPU 报告。
+"""
+
+import cProfile
+import json
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+PROFILE_MODES = ("cpu", "mem")
+# 摘要中列出的热点函数 / 分配位置数量
+TOP_ENTRIES = 15
+# tracemalloc 为每次分配记录的调用栈深度
+MEMORY_FRAMES = 5
+
+# 耗时去向分类：按 “文件名:函数名” 中出现的片段归类（按顺序匹配第一个）
+_CPU_CATEGORIES = (
+    ("数据库驱动", ("mysql", "_socket", "/socket.py", "/ssl.py")),
+    ("SequenceMatcher", ("difflib",)),
+    ("JSON 编码", ("/json/", "_json.")),
+    ("字符串替换", ("'replace' of 'str'", "'sub' of 're.pattern'", "/re/__init__.py:sub")),
+    ("正则表达式（编译 / 匹配）", ("/re/", "re.pattern' objects", "_sre")),
+    ("SQLite（计划缓存 / 快照库）", ("sqlite3",)),
+)
+
+
+def default_report_base(label: str = "") -> str:
+    """没有输出文件时的报告路径前缀（当前目录，带时间戳）"""
+    summary = "".join(c for c in label[:20] if c.isalnum() or c in ('-', '_'))
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"profile_{summary}_{timestamp}" if summary else f"profile_{timestamp}"
+
+
+def _function_label(func: tuple) -> str:
+    filename, line, name = func
+    if filename == "~":
+        return name
+    return f"{os.path.basename(filename)}:{line}({name})"
+
+
+def _cpu_category(func: tuple) -> str:
+    text = f"{func[0]}:{func[2]}".replace("\\", "/").lower()
+    for category, fragments in _CPU_CATEGORIES:
+        if any(fragment in text for fragment in fragments):
+            return category
+    return "其他"
+
+
+def summarize_cpu(stats: pstats.Stats, top: int = TOP_ENTRIES) -> Dict[str, Any]:
+    """cProfile 统计 → 总耗时、耗时去向分类和自身耗时最多的函数"""
+    entries = stats.stats  # {(文件, 行号, 函数): (原始调用次数, 调用次数, 自身耗时, 累计耗时, 调用者)}
+    total = sum(entry[2] for entry in entries.values()) or 1e-9
+    categories: Dict[str, float] = {}
+    for func, entry in entries.items():
+        category = _cpu_category(func)
+        categories[category] = categories.get(category, 0.0) + entry[2]
+    hot = sorted(entries.items(), key=lambda item: item[1][2], reverse=True)[:top]
+    return {
+        "total_seconds": round(total, 4),
+        "categories": [
+            {"name": name, "seconds": round(seconds, 4), "percent": round(seconds * 100 / total, 1)}
+            for name, seconds in sorted(categories.items(), key=lambda item: item[1], reverse=True)
+        ],
+        "functions": [
+            {
+                "function": _function_label(func),
+                "calls": entry[1],
+                "self_seconds": round(entry[2], 4),
+                "cumulative_seconds": round(entry[3], 4),
+                "percent": round(entry[2] * 100 / total, 1),
+            }
+            for func, entry in hot
+        ],
+    }
+
+
+def summarize_memory(snapshot: tracemalloc.Snapshot, peak: int, current: int,
+                     top: int = TOP_ENTRIES) -> Dict[str, Any]:
+    """tracemalloc 快照 → 峰值、结束时占用、按代码行和按文件的分配排名"""
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ))
+    by_line = snapshot.statistics("lineno")[:top]
+    by_file = snapshot.statistics("filename")[:top]
+    return {
+        "peak_bytes": peak,
+        "current_bytes": current,
+        "lines": [
+            {
+                "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                "size_bytes": stat.size,
+                "count": stat.count,
+            }
+            for stat in by_line
+        ],
+        "files": [
+            {"file": stat.traceback[0].filename, "size_bytes": stat.size, "count": stat.count}
+            for stat in by_file
+        ],
+    }
+
+
+def _format_bytes(size: float) -> str:
+    for unit in ("B", "KB", "MB"):
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+class QueryProfiler:
+    def __init__(self, mode: str, report_base: Optional[str] = None):
+        """mode: "cpu" / "mem"；report_base: 报告路径前缀（不含扩展名），运行结束前可以修改"""
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"不支持的剖析模式: {mode}（可选 {' / '.join(PROFILE_MODES)}）")
+        self.mode = mode
+        self.report_base = report_base
+        self.elapsed = 0.0
+        self.summary: Optional[Dict[str, Any]] = None
+        self.files: List[str] = []
+        self._profile: Optional[cProfile.Profile] = None
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        self._peak = self._current = 0
+        # 调用方已经在跟踪内存时不在结束时停止
+        self._stop_tracing = False
+        self._started = 0.0
+
+    def start(self) -> "QueryProfiler":
+        self._started = time.perf_counter()
+        if self.mode == "cpu":
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            if tracemalloc.is_tracing():
+                tracemalloc.reset_peak()
+            else:
+                tracemalloc.start(MEMORY_FRAMES)
+                self._stop_tracing = True
+        return self
+
+    def stop(self):
+        if self.mode == "cpu":
+            if self._profile is not None:
+                self._profile.disable()
+        elif tracemalloc.is_tracing():
+            self._current, self._peak = tracemalloc.get_traced_memory()
+            self._snapshot = tracemalloc.take_snapshot()
+            if self._stop_tracing:
+                tracemalloc.stop()
+        self.elapsed = time.perf_counter() - self._started
+
+    @contextmanager
+    def paused(self):
+        """暂停 CPU 剖析（等待用户输入等不应计入的时间）"""
+        if self._profile is not None:
+            self._profile.disable()
+        try:
+            yield
+        finally:
+            if self._profile is not None:
+                self._profile.enable()
+
+    def write_reports(self) -> Dict[str, Any]:
+        """写出报告文件并计算摘要，返回 {"mode", "files", "summary"}"""
+        base = self.report_base or default_report_base()
+        directory = os.path.dirname(os.path.abspath(base))
+        os.makedirs(directory, exist_ok=True)
+        if self.mode == "cpu":
+            path = f"{base}.cpu.pstats"
+            stats = pstats.Stats(self._profile)
+            stats.dump_stats(path)
+            self.summary = summarize_cpu(stats)
+        else:
+            path = f"{base}.mem.json"
+            self.summary = summarize_memory(self._snapshot, self._peak, self._current)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(dict(self.summary, elapsed_seconds=round(self.elapsed, 4)), f,
+                          ensure_ascii=False, indent=2)
+        self.files = [path]
+        return {"mode": self.mode, "files": self.files, "summary": self.summary}
+
+    def print_summary(self, top: int = 8):
+        """打印热点摘要"""
+        if self.summary is None:
+            return
+        if self.mode == "cpu":
+            print(f"🔥 CPU 剖析：耗时 {self.elapsed:.3f}s（调用线程自身耗时合计 {self.summary['total_seconds']}s）")
+            print("   耗时去向: " + "，".join(
+                f"{c['name']} {c['percent']}%" for c in self.summary["categories"] if c["seconds"] > 0
+            ))
+            for item in self.summary["functions"][:top]:
+                print(f"   {item['percent']:5.1f}%  {item['self_seconds']:.4f}s  ×{item['calls']:<6} {item['function']}")
+        else:
+            print(f"🧠 内存剖析：峰值 {_format_bytes(self.summary['peak_bytes'])}，"
+                  f"结束时仍占用 {_format_bytes(self.summary['current_bytes'])}")
+            for item in self.summary["lines"][:top]:
+                print(f"   {_format_bytes(item['size_bytes']):>10}  ×{item['count']:<6} {item['location']}")
+        print(f"📝 剖析报告: {', '.join(self.files)}")
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+录制 / 回放的本地替身数据库（负载测试使用）
+把 SmartDBConnector 发出的每条语句（含 SHOW TABLES、information_schema 元数据、EXPLAIN）的结果和执行耗时
+录制到 SQLite 夹具文件，之后不连接 MySQL 也能按原样回放：
+
+- record：包装真实的 mysql.connector，语句照常执行，同时保存列名、行、错误码和耗时
+- replay：按“库名 + 规范化 SQL + 参数”查找录制结果，按录制的耗时（乘以 latency_scale）等待后返回；
+  没有录制的语句抛出驱动错误并计入 unrecorded（计划或 SQL 生成逻辑变化的信号）
+
+通过 smart_db_connector.use_driver() 替换驱动，解析、计划缓存、统计、图表等其余流程都是真实执行的。
+相对时间（今天、最近7天）的查询参数和按日期裁剪的分表随日期变化，隔天回放时这类语句会成为未录制语句，
+需要重新录制。
+"""
+
+import base64
+import json
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from itertools import count
+from typing import Dict, List, Any, Optional
+
+from single_flight import normalize_sql
+
+# 回放时报告的未录制语句最多保留条数
+MAX_UNRECORDED_SAMPLES = 20
+
+
+class Error(Exception):
+    """替身驱动的错误（与 mysql.connector.Error 一样带 errno）"""
+
+    def __init__(self, msg: str = "", errno: Optional[int] = None):
+        super().__init__(msg)
+        self.msg = msg
+        self.errno = errno
+
+
+def _encode_value(value: Any) -> Any:
+    """JSON 无法直接表示的 MySQL 返回类型：带类型标记保存，回放时还原为原类型"""
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, date):
+        return {"$date": value.isoformat()}
+    if isinstance(value, timedelta):
+        return {"$timedelta": value.total_seconds()}
+    if isinstance(value, Decimal):
+        return {"$decimal": str(value)}
+    if isinstance(value, (bytes, bytearray)):
+        return {"$bytes": base64.b64encode(bytes(value)).decode("ascii")}
+    if isinstance(value, set):
+        return {"$set": sorted(value)}
+    return str(value)
+
+
+def _decode_value(obj: Dict[str, Any]) -> Any:
+    if len(obj) == 1:
+        tag, value = next(iter(obj.items()))
+        if tag == "$datetime":
+            return datetime.fromisoformat(value)
+        if tag == "$date":
+            return date.fromisoformat(value)
+        if tag == "$timedelta":
+            return timedelta(seconds=value)
+        if tag == "$decimal":
+            return Decimal(value)
+        if tag == "$bytes":
+            return base64.b64decode(value)
+        if tag == "$set":
+            return set(value)
+    return obj
+
+
+class FixtureStore:
+    def __init__(self, path: str):
+        """打开（必要时创建）夹具文件，已有的录制全部读入内存"""
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS statements ("
+            " statement_key TEXT PRIMARY KEY, columns_json TEXT, rows_json TEXT, rowcount INTEGER,"
+            " errno INTEGER, error TEXT, elapsed_ms REAL NOT NULL, recorded_at REAL NOT NULL)"
+        )
+        self._db.commit()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        for key, columns, rows, rowcount, errno, error, elapsed in self._db.execute(
+            "SELECT statement_key, columns_json, rows_json, rowcount, errno, error, elapsed_ms FROM statements"
+        ):
+            self._entries[key] = {
+                "columns": json.loads(columns) if columns else None,
+                "rows": json.loads(rows, object_hook=_decode_value) if rows else [],
+                "rowcount": rowcount,
+                "errno": errno,
+                "error": error,
+                "elapsed_ms": elapsed,
+            }
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._entries.get(key)
+
+    def put(self, key: str, entry: Dict[str, Any]):
+        rows = [tuple(row) for row in entry.get("rows") or []]
+        with self._lock:
+            self._entries[key] = dict(entry, rows=rows)
+            self._db.execute(
+                "INSERT OR REPLACE INTO statements VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    json.dumps(entry["columns"], ensure_ascii=False) if entry.get("columns") is not None else None,
+                    json.dumps(rows, ensure_ascii=False, default=_encode_value) if rows else None,
+                    entry.get("rowcount"),
+                    entry.get("errno"),
+                    entry.get("error"),
+                    entry["elapsed_ms"],
+                    time.time(),
+                ),
+            )
+            self._db.commit()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def _is_kill(sql: str) -> bool:
+    return sql.lstrip().upper().startswith("KILL")
+
+
+class _Cursor:
+    """回放（以及录制时对外）的游标：结果整体缓存在内存中，按 fetch* 逐步返回"""
+
+    def __init__(self, driver: "ReplayDriver", connection: "_Connection", dictionary: bool = False,
+                 real_cursor=None):
+        self._driver = driver
+        self._connection = connection
+        self._dictionary = dictionary
+        self._real = real_cursor
+        self._rows: List[tuple] = []
+        self._position = 0
+        self.description = None
+        self.rowcount = -1
+
+    def execute(self, operation, params=None):
+        key = self._driver.statement_key(self._connection.database, operation, params)
+        if self._real is not None:
+            self._driver.record(key, self._real, operation, params)
+            entry = self._driver.store.get(key) if not _is_kill(operation) else None
+        else:
+            entry = self._driver.replay(key, operation)
+        if entry is None:
+            self._set_result(None, [], 0)
+            return
+        if entry.get("errno") is not None or entry.get("error"):
+            raise Error(entry.get("error") or "", entry.get("errno"))
+        self._set_result(entry.get("columns"), entry.get("rows") or [], entry.get("rowcount"))
+
+    def _set_result(self, columns: Optional[List[str]], rows: List[tuple], rowcount: Optional[int]):
+        self.description = [(name, None, None, None, None, None, True) for name in columns] if columns else None
+        self._columns = columns or []
+        self._rows = rows
+        self._position = 0
+        self.rowcount = rowcount if rowcount is not None else len(rows)
+
+    def _take(self, size: Optional[int]) -> List[Any]:
+        end = len(self._rows) if size is None else min(self._position + size, len(self._rows))
+        rows = self._rows[self._position:end]
+        self._position = end
+        if self._dictionary:
+            return [dict(zip(self._columns, row)) for row in rows]
+        return rows
+
+    def fetchall(self):
+        return self._take(None)
+
+    def fetchmany(self, size: int = 1):
+        return self._take(size)
+
+    def fetchone(self):
+        rows = self._take(1)
+        return rows[0] if rows else None
+
+    def close(self):
+        if self._real is not None:
+            try:
+                self._real.close()
+            except Exception:
+                pass
+
+
+class _Connection:
+    def __init__(self, driver: "ReplayDriver", params: Dict[str, Any], real=None):
+        self._driver = driver
+        self._real = real
+        self.database = params.get("database")
+        self.connection_id = getattr(real, "connection_id", None) if real is not None else next(driver._ids)
+        self._open = True
+
+    def cursor(self, dictionary: bool = False, prepared: bool = False, **kwargs):
+        if not self.is_connected():
+            raise Error("连接已关闭", 2006)
+        real_cursor = None
+        if self._real is not None:
+            real_cursor = self._real.cursor(prepared=True) if prepared else self._real.cursor(**kwargs)
+        return _Cursor(self._driver, self, dictionary, real_cursor)
+
+    def is_connected(self) -> bool:
+        if self._real is not None:
+            return self._real.is_connected()
+        return self._open
+
+    def ping(self, reconnect: bool = False, attempts: int = 1, delay: int = 0):
+        if self._real is not None:
+            return self._real.ping(reconnect=reconnect, attempts=attempts, delay=delay)
+        if not self._open and not reconnect:
+            raise Error("连接已关闭", 2006)
+        self._open = True
+
+    def commit(self):
+        if self._real is not None:
+            self._real.commit()
+
+    def close(self):
+        self._open = False
+        if self._real is not None:
+            self._real.close()
+
+
+class ReplayDriver:
+    def __init__(self, store: FixtureStore, mode: str = "replay", latency_scale: float = 1.0):
+        """mode: "record"（包装真实驱动并保存结果）/ "replay"（只读夹具，不连接 MySQL）
+
+        latency_scale: 回放时等待的时间为录制耗时乘以该系数（0 表示不等待，只测本地处理开销）。
+        对外提供 connect() 和 Error，可以作为 smart_db_connector.use_driver() 的驱动。
+        """
+        if mode not in ("record", "replay"):
+            raise ValueError(f"不支持的替身数据库模式: {mode}")
+        self.store = store
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.Error = Error
+        self._ids = count(1)
+        self._lock = threading.Lock()
+        self._real_driver = None
+        if mode == "record":
+            import mysql.connector
+            self._real_driver = mysql.connector
+            # 录制时连接错误等按真实驱动的异常类型处理
+            self.Error = mysql.connector.Error
+        self.hits = 0
+        self.recorded = 0
+        self.unrecorded = 0
+        self.unrecorded_samples: List[str] = []
+
+    @staticmethod
+    def statement_key(database: Optional[str], operation: str, params) -> str:
+        return f"{database or ''}|{normalize_sql(operation, tuple(params) if params else None)}"
+
+    def connect(self, **params) -> _Connection:
+        if self._real_driver is not None:
+            return _Connection(self, params, self._real_driver.connect(**params))
+        return _Connection(self, params)
+
+    def record(self, key: str, real_cursor, operation: str, params):
+        """在真实连接上执行并保存结果（KILL 等控制语句只执行不保存）"""
+        started = time.perf_counter()
+        error = None
+        try:
+            real_cursor.execute(operation, params or ())
+            columns = [desc[0] for desc in real_cursor.description] if real_cursor.description else None
+            rows = real_cursor.fetchall() if columns is not None else []
+            entry = {"columns": columns, "rows": rows, "rowcount": real_cursor.rowcount}
+        except self._real_driver.Error as e:
+            error = e
+            entry = {"columns": None, "rows": [], "errno": getattr(e, "errno", None), "error": str(e)}
+        entry["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        if not _is_kill(operation):
+            self.store.put(key, entry)
+            with self._lock:
+                self.recorded += 1
+        if error is not None:
+            raise error
+
+    def replay(self, key: str, operation: str) -> Optional[Dict[str, Any]]:
+        """取录制结果并模拟执行耗时；KILL 直接成功，未录制的语句抛出错误"""
+        if _is_kill(operation):
+            return None
+        entry = self.store.get(key)
+        if entry is None:
+            with self._lock:
+                self.unrecorded += 1
+                if len(self.unrecorded_samples) < MAX_UNRECORDED_SAMPLES:
+                    self.unrecorded_samples.append(key)
+            raise Error(f"替身数据库中没有录制该语句: {operation[:120]}")
+        with self._lock:
+            self.hits += 1
+        if self.latency_scale > 0 and entry.get("elapsed_ms"):
+            time.sleep(entry["elapsed_ms"] * self.latency_scale / 1000)
+        return entry
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "fixtures": len(self.store),
+            "hits": self.hits,
+            "recorded": self.recorded,
+            "unrecorded": self.unrecorded,
+            "unrecorded_samples": list(self.unrecorded_samples),
+        }
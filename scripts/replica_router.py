@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+只读副本路由
+db_config.json 中配置一个主库 + N 个带权重的只读副本，每个端点维护独立连接池；
+只读查询按“最少在途请求/权重”选择副本，复制延迟超限或连接失败的副本自动摘除，全部不可用时回退主库
+"""
+
+import queue
+import threading
+import time
+from typing import Dict, Any, List, Optional, Callable
+
+# 连接类错误码（可以换一个端点重试），其余为SQL本身的错误
+CONNECTION_ERRNOS = {2002, 2003, 2005, 2006, 2013, 2055}
+
+DEFAULT_ROUTING_CONFIG = {
+    "pool_size": 5,
+    "pool_timeout": 10,
+    # 复制延迟超过该秒数的副本不再接收查询
+    "replica_max_lag_seconds": 30,
+    # 复制延迟检查间隔（秒）
+    "lag_check_interval": 10,
+    # 连接失败后摘除副本的冷却时间（秒）
+    "failure_cooldown": 30,
+}
+
+
+class ConnectionPool:
+    def __init__(self, connect: Callable[[], Any], size: int = 5, timeout: float = 10):
+        """简单的连接池：空闲连接后进先出复用，最多创建 size 个连接"""
+        self._connect = connect
+        self.size = max(int(size), 1)
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            try:
+                conn = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                raise TimeoutError(f"连接池已满（{self.size}），等待空闲连接超时")
+
+        if not conn.is_connected():
+            try:
+                conn.ping(reconnect=True, attempts=1, delay=0)
+            except Exception:
+                self.release(conn, broken=True)
+                raise
+        return conn
+
+    def release(self, conn, broken: bool = False):
+        if broken:
+            try:
+                conn.close()
+            except Exception:
+                pass
+            with self._lock:
+                self._created -= 1
+            return
+        self._idle.put(conn)
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                conn.close()
+            except Exception:
+                pass
+            with self._lock:
+                self._created -= 1
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": self.size, "created": self._created, "idle": self._idle.qsize()}
+
+
+class Endpoint:
+    def __init__(self, name: str, params: Dict[str, Any], weight: float, pool: ConnectionPool):
+        self.name = name
+        self.params = params
+        self.weight = max(float(weight), 0.01)
+        self.pool = pool
+        self.outstanding = 0
+        self.lag_seconds: Optional[float] = None
+        self.lag_checked_at = 0.0
+        self.down_until = 0.0
+        self.served = 0
+        self.failures = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "host": self.params.get("host"),
+            "weight": self.weight,
+            "outstanding": self.outstanding,
+            "lag_seconds": self.lag_seconds,
+            "down": self.down_until > time.time(),
+            "served": self.served,
+            "failures": self.failures,
+            "pool": self.pool.stats(),
+        }
+
+
+class ReplicaRouter:
+    def __init__(self, primary_params: Dict[str, Any], replicas: List[Dict[str, Any]],
+                 connect: Callable[..., Any], config: Optional[Dict[str, Any]] = None):
+        """初始化路由器
+
+        primary_params: 主库连接参数；副本未填写的字段（user/password/database/charset 等）继承主库
+        replicas: [{"host": ..., "port": ..., "weight": 2}, ...]
+        connect: 建立连接的函数（mysql.connector.connect）
+        """
+        self.config = dict(DEFAULT_ROUTING_CONFIG)
+        self.config.update(config or {})
+        self._lock = threading.Lock()
+        self.replicas: List[Endpoint] = []
+
+        for i, replica in enumerate(replicas):
+            params = dict(primary_params)
+            params.update({k: v for k, v in replica.items() if k not in ("weight", "name")})
+            name = replica.get("name") or f"replica{i + 1}:{params.get('host')}"
+            pool = ConnectionPool(
+                lambda p=params: connect(**p),
+                size=replica.get("pool_size", self.config["pool_size"]),
+                timeout=self.config["pool_timeout"],
+            )
+            self.replicas.append(Endpoint(name, params, replica.get("weight", 1), pool))
+
+    @staticmethod
+    def validate(replicas: Any) -> List[str]:
+        """校验 replicas 配置，返回错误列表"""
+        if not isinstance(replicas, list):
+            return ["replicas 必须是数组"]
+        errors = []
+        for i, replica in enumerate(replicas):
+            if not isinstance(replica, dict) or not replica.get("host"):
+                errors.append(f"replicas[{i}] 缺少 host")
+            elif "weight" in replica and not isinstance(replica["weight"], (int, float)):
+                errors.append(f"replicas[{i}].weight 需要数字")
+        return errors
+
+    @property
+    def has_replicas(self) -> bool:
+        return bool(self.replicas)
+
+    def pick(self, exclude: Optional[set] = None) -> Optional[Endpoint]:
+        """按 (在途请求+1)/权重 选择最空闲的可用副本，没有可用副本时返回 None"""
+        now = time.time()
+        candidates = []
+        for endpoint in self.replicas:
+            if exclude and endpoint.name in exclude:
+                continue
+            if endpoint.down_until > now:
+                continue
+            if now - endpoint.lag_checked_at >= self.config["lag_check_interval"]:
+                self._check_lag(endpoint)
+            if endpoint.down_until > now:
+                continue
+            max_lag = self.config["replica_max_lag_seconds"]
+            if endpoint.lag_seconds is None or endpoint.lag_seconds > max_lag:
+                continue
+            candidates.append(endpoint)
+
+        if not candidates:
+            return None
+        with self._lock:
+            chosen = min(candidates, key=lambda ep: (ep.outstanding + 1) / ep.weight)
+            chosen.outstanding += 1
+        return chosen
+
+    def done(self, endpoint: Endpoint, failed: bool = False):
+        with self._lock:
+            endpoint.outstanding -= 1
+            if failed:
+                endpoint.failures += 1
+                endpoint.down_until = time.time() + self.config["failure_cooldown"]
+            else:
+                endpoint.served += 1
+
+    def _check_lag(self, endpoint: Endpoint):
+        """读取副本复制延迟（Seconds_Behind_Source / Seconds_Behind_Master）
+
+        复制线程停止（延迟为 NULL）或无法连接时视为不可用。
+        """
+        endpoint.lag_checked_at = time.time()
+        conn = None
+        broken = False
+        try:
+            conn = endpoint.pool.acquire()
+            cursor = conn.cursor(dictionary=True)
+            try:
+                try:
+                    cursor.execute("SHOW REPLICA STATUS")
+                except Exception:
+                    cursor.execute("SHOW SLAVE STATUS")
+                status = cursor.fetchone()
+            finally:
+                cursor.close()
+        except Exception as e:
+            broken = conn is not None
+            print(f"⚠️ 副本 {endpoint.name} 不可用: {e}")
+            endpoint.lag_seconds = None
+            endpoint.down_until = time.time() + self.config["failure_cooldown"]
+            return
+        finally:
+            if conn is not None:
+                endpoint.pool.release(conn, broken=broken)
+
+        if not status:
+            # 不是复制从库（例如直接指向另一个主库），按无延迟处理
+            endpoint.lag_seconds = 0.0
+            return
+        lag = status.get("Seconds_Behind_Source", status.get("Seconds_Behind_Master"))
+        endpoint.lag_seconds = float(lag) if lag is not None else None
+
+    def close_all(self):
+        for endpoint in self.replicas:
+            endpoint.pool.close_all()
+
+    def stats(self) -> Dict[str, Any]:
+        return {endpoint.name: endpoint.stats() for endpoint in self.replicas}
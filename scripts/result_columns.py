@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+列式结果与统计引擎
+查询结果只转置一次为按列存储（数值列为 NumPy 数组 + 空值掩码），类型识别、均值、最值、分位数、
+去重计数和 top-k 分布都按列一次性计算并缓存，统计卡片和图表共用，不再逐行、逐列重复扫描。
+NumPy 在第一次计算数值列统计时才导入（只生成 SQL 的命令行路径不加载），未安装时退化为纯 Python 实现，结果一致。
+"""
+
+import math
+from collections import Counter
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, List, Any, Optional
+
+from lazy_import import optional_module
+from result_rows import ResultRows
+
+PERCENTILES = (50, 90, 99)
+
+_NUMERIC_TYPES = (int, float, Decimal)
+
+
+def _column_kind(values: List[Any]) -> str:
+    """按整列（而不是第一行）识别类型：numeric / datetime / text / empty"""
+    kinds = set(map(type, values))
+    kinds.discard(type(None))
+    if not kinds:
+        return "empty"
+    if all(issubclass(k, _NUMERIC_TYPES) and not issubclass(k, bool) for k in kinds):
+        return "numeric"
+    if all(issubclass(k, (date, datetime)) for k in kinds):
+        return "datetime"
+    return "text"
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    """线性插值分位数（与 numpy.percentile 默认算法一致）"""
+    pos = (len(sorted_values) - 1) * q / 100.0
+    lower = math.floor(pos)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (pos - lower)
+
+
+class Column:
+    __slots__ = ("name", "values", "kind", "_array", "_mask", "_summary", "_counts", "_day_counts", "_distinct")
+
+    def __init__(self, name: str, values: List[Any]):
+        self.name = name
+        self.values = values
+        self.kind = _column_kind(values)
+        self._array = None
+        self._mask = None
+        self._summary: Optional[Dict[str, Any]] = None
+        self._counts: Optional[Counter] = None
+        self._day_counts: Optional[Counter] = None
+        self._distinct: Optional[int] = None
+
+    def numeric_array(self):
+        """数值列的 float 数组和非空掩码（NumPy 可用时为 ndarray，否则为去掉空值的 list）"""
+        if self._array is None:
+            np = optional_module("numpy")
+            if np is not None:
+                # object 数组上的比较和 astype 都在 C 层循环完成（Decimal 同样可以转换）
+                objects = np.array(self.values, dtype=object)
+                self._mask = objects != None  # 逐元素比较（不能写成 is not None）
+                array = np.full(len(objects), np.nan, dtype=np.float64)
+                array[self._mask] = objects[self._mask].astype(np.float64)
+                self._array = array
+            else:
+                self._array = list(map(float, [v for v in self.values if v is not None]))
+        return self._array, self._mask
+
+    def summary(self) -> Dict[str, Any]:
+        """数值列的 count / nulls / mean / min / max / p50 / p90 / p99 / distinct"""
+        if self._summary is not None:
+            return self._summary
+        summary: Dict[str, Any] = {"count": len(self.values), "nulls": 0, "distinct": 0}
+        if self.kind != "numeric":
+            self._summary = summary
+            return summary
+
+        array, mask = self.numeric_array()
+        np = optional_module("numpy")
+        if np is not None:
+            present = array[mask]
+            summary["nulls"] = int(len(array) - len(present))
+            if len(present):
+                percentiles = np.percentile(present, PERCENTILES)
+                summary.update({
+                    "mean": float(present.mean()),
+                    "min": float(present.min()),
+                    "max": float(present.max()),
+                    "distinct": int(len(np.unique(present))),
+                })
+                summary.update({f"p{q}": float(v) for q, v in zip(PERCENTILES, percentiles)})
+        else:
+            summary["nulls"] = len(self.values) - len(array)
+            if array:
+                ordered = sorted(array)
+                summary.update({
+                    "mean": math.fsum(ordered) / len(ordered),
+                    "min": ordered[0],
+                    "max": ordered[-1],
+                    "distinct": len(set(ordered)),
+                })
+                summary.update({f"p{q}": _percentile(ordered, q) for q in PERCENTILES})
+        self._summary = summary
+        return summary
+
+    def value_counts(self) -> Counter:
+        """非空取值（转为字符串）的出现次数，保持首次出现的顺序"""
+        if self._counts is None:
+            # 先按原始值计数（C 实现），再只对去重后的取值转字符串
+            raw = Counter(self.values)
+            raw.pop(None, None)
+            if all(type(v) is str for v in raw):
+                self._counts = raw
+            else:
+                counts: Counter = Counter()
+                for value, count in raw.items():
+                    counts[str(value)] += count
+                self._counts = counts
+        return self._counts
+
+    def distinct_count(self) -> int:
+        """非空取值的去重数量（只做一次集合运算；高基数列不必生成字符串计数）"""
+        if self._distinct is None:
+            if self._counts is not None:
+                self._distinct = len(self._counts)
+            else:
+                distinct = set(self.values)
+                distinct.discard(None)
+                self._distinct = len(distinct)
+        return self._distinct
+
+    def top_k(self, k: int) -> List[tuple]:
+        """出现次数最多的 k 个取值 [(取值, 次数)]"""
+        return self.value_counts().most_common(k)
+
+    def day_counts(self) -> Counter:
+        """按日期（YYYY-MM-DD）计数，适用于 datetime/date 值和 'YYYY-MM-DD ...' 格式的字符串"""
+        if self._day_counts is None:
+            counter: Counter = Counter()
+            if self.kind == "datetime":
+                # 先按 date 对象计数，再只对去重后的日期做格式化
+                days = Counter(v.date() if isinstance(v, datetime) else v for v in self.values if v is not None)
+                for day, count in days.items():
+                    counter[day.isoformat()] += count
+            else:
+                counter.update(v.split(' ')[0][:10] for v in self.values if isinstance(v, str) and v)
+            self._day_counts = counter
+        return self._day_counts
+
+
+class ResultColumns:
+    def __init__(self, data: List[Any], columns: List[str]):
+        """把行数据（ResultRows、dict 行或 tuple 行）转置为按列存储，只遍历一次"""
+        self.columns = list(columns)
+        self.row_count = len(data)
+        if isinstance(data, ResultRows):
+            # 直接转置底层元组，不经过 Row 视图
+            data = data.rows
+        if data and isinstance(data[0], dict):
+            try:
+                column_values = [[row[col] for row in data] for col in self.columns]
+            except KeyError:
+                column_values = [[row.get(col) for row in data] for col in self.columns]
+        elif data:
+            column_values = [list(values) for values in zip(*data)]
+        else:
+            column_values = [[] for _ in self.columns]
+        self._columns = {name: Column(name, values) for name, values in zip(self.columns, column_values)}
+
+    def __getitem__(self, name: str) -> Column:
+        return self._columns[name]
+
+    def __iter__(self):
+        return (self._columns[name] for name in self.columns)
+
+    def numeric_columns(self) -> List[Column]:
+        return [col for col in self if col.kind == "numeric"]
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+查询结果导出（Parquet / Arrow / CSV）
+从游标按批读取元组行，逐批写入文件：不把整个结果读入内存，也不构造 dict 行。
+Parquet / Arrow 的列类型按表结构缓存（table_cache）中的 MySQL 类型映射，
+表结构中没有的列（聚合、别名等）由第一批数据推断。导出的文件可直接交给 pandas / DuckDB 读取。
+
+Parquet / Arrow 需要安装 pyarrow（pip install pyarrow），CSV 只依赖标准库。
+"""
+
+import os
+import re
+import time
+from typing import Dict, List, Any, Optional
+
+from lazy_import import optional_module
+
+EXPORT_MODES = ("parquet", "arrow", "csv")
+FILE_EXTENSIONS = {"parquet": ".parquet", "arrow": ".arrow", "csv": ".csv"}
+# 每批从游标读取并写出的行数
+EXPORT_BATCH_ROWS = 5000
+
+_TYPE_PATTERN = re.compile(r"^\s*(\w+)(?:\((\d+)(?:\s*,\s*(\d+))?\))?(.*)$")
+
+_INTEGER_TYPES = {
+    "tinyint": ("int8", "uint8"),
+    "smallint": ("int16", "uint16"),
+    "mediumint": ("int32", "uint32"),
+    "int": ("int32", "uint32"),
+    "integer": ("int32", "uint32"),
+    "bigint": ("int64", "uint64"),
+}
+_STRING_TYPES = ("char", "varchar", "tinytext", "text", "mediumtext", "longtext", "enum", "set", "json")
+_BINARY_TYPES = ("binary", "varbinary", "tinyblob", "blob", "mediumblob", "longblob")
+
+
+def arrow_type_for(mysql_type: str):
+    """MySQL 列类型（SHOW COLUMNS 的 Type，如 int(10) unsigned、decimal(12,2)）→ pyarrow 类型；无法映射时返回 None"""
+    match = _TYPE_PATTERN.match(str(mysql_type or "").lower())
+    if not match:
+        return None
+    pa = optional_module("pyarrow")
+    base, precision, scale, rest = match.groups()
+    if base in _INTEGER_TYPES:
+        signed, unsigned = _INTEGER_TYPES[base]
+        return getattr(pa, unsigned if "unsigned" in rest else signed)()
+    if base in ("float",):
+        return pa.float32()
+    if base in ("double", "real"):
+        return pa.float64()
+    if base in ("decimal", "numeric"):
+        precision = int(precision or 10)
+        if precision > 38:
+            return pa.string()
+        return pa.decimal128(precision, int(scale or 0))
+    if base in _STRING_TYPES:
+        return pa.string()
+    if base in _BINARY_TYPES:
+        return pa.binary()
+    if base == "date":
+        return pa.date32()
+    if base in ("datetime", "timestamp"):
+        return pa.timestamp("us")
+    if base == "time":
+        # mysql-connector 把 TIME 返回为 timedelta
+        return pa.duration("us")
+    if base == "year":
+        return pa.int16()
+    if base == "bit":
+        return pa.int64()
+    return None
+
+
+def column_types_from_cache(db_connector, table_name: Optional[str]) -> Dict[str, str]:
+    """从连接器的表结构缓存取 {列名: MySQL 类型}（分表族使用其最新物理表的结构）"""
+    if not table_name:
+        return {}
+    info = db_connector.table_cache.get(table_name) or db_connector.get_table_structure(table_name)
+    types = {}
+    for column in (info or {}).get("columns", []):
+        try:
+            types[column["Field"]] = column["Type"]
+        except (KeyError, TypeError):
+            types[column[0]] = column[1]
+    return types
+
+
+def default_export_path(user_query: str, mode: str) -> str:
+    """与看板文件同样的命名方式：export_<查询摘要>_<时间戳>.<扩展名>"""
+    timestamp = time.strftime("%Y%m%d_%H%M%S")
+    query_summary = "".join(c for c in user_query[:20] if c.isalnum() or c in ('-', '_'))
+    return f"export_{query_summary}_{timestamp}{FILE_EXTENSIONS[mode]}"
+
+
+class _CSVWriter:
+    def __init__(self, path: str, columns: List[str]):
+        # csv 只在导出 CSV 时导入
+        import csv
+
+        # utf-8-sig：Excel 打开中文不乱码
+        self._file = open(path, "w", encoding="utf-8-sig", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(columns)
+
+    def write(self, rows: List[tuple]):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+
+class _ArrowWriter:
+    """Parquet（每批一个 row group）或 Arrow IPC 文件，schema 在第一批时确定"""
+
+    def __init__(self, path: str, columns: List[str], column_types: Dict[str, str], mode: str):
+        self.path = path
+        self.columns = columns
+        self.column_types = column_types
+        self.mode = mode
+        self.schema = None
+        self._writer = None
+
+    def _build_schema(self, column_values: List[tuple]):
+        pa = optional_module("pyarrow")
+        fields = []
+        for name, values in zip(self.columns, column_values):
+            arrow_type = arrow_type_for(self.column_types[name]) if name in self.column_types else None
+            if arrow_type is not None and values:
+                try:
+                    pa.array(values, type=arrow_type)
+                except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, ValueError):
+                    # 驱动返回的值与声明类型不符（如零日期以字符串返回），改为按数据推断
+                    arrow_type = None
+            if arrow_type is None:
+                # 表结构中没有的列：由第一批数据推断，全为空时按字符串处理
+                arrow_type = pa.array(values).type if values else pa.null()
+                if pa.types.is_null(arrow_type):
+                    arrow_type = pa.string()
+            fields.append(pa.field(name, arrow_type))
+        self.schema = pa.schema(fields)
+        if self.mode == "parquet":
+            pq = optional_module("pyarrow.parquet")
+            self._writer = pq.ParquetWriter(self.path, self.schema, compression="snappy")
+        else:
+            self._writer = pa.ipc.new_file(self.path, self.schema)
+
+    def write(self, rows: List[tuple]):
+        pa = optional_module("pyarrow")
+        column_values = list(zip(*rows)) if rows else [() for _ in self.columns]
+        if self.schema is None:
+            self._build_schema(column_values)
+        arrays = [self._to_array(values, field.type) for values, field in zip(column_values, self.schema)]
+        batch = pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+        if self.mode == "parquet":
+            self._writer.write_table(pa.Table.from_batches([batch]))
+        else:
+            self._writer.write_batch(batch)
+
+    @staticmethod
+    def _to_array(values: tuple, arrow_type):
+        pa = optional_module("pyarrow")
+        try:
+            return pa.array(values, type=arrow_type)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, ValueError):
+            if not pa.types.is_string(arrow_type):
+                raise
+            return pa.array([None if v is None else str(v) for v in values], type=arrow_type)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+class ResultExporter:
+    def __init__(self, db_connector, batch_rows: int = EXPORT_BATCH_ROWS):
+        self.db = db_connector
+        self.batch_rows = batch_rows
+
+    @staticmethod
+    def check_mode(mode: str) -> Optional[str]:
+        """返回该导出模式缺少依赖时的错误信息，可用时返回 None"""
+        if mode not in EXPORT_MODES:
+            return f"不支持的导出格式: {mode}"
+        # pyarrow 只在导出 parquet / arrow 时导入（导入耗时较长）
+        if mode in ("parquet", "arrow") and optional_module("pyarrow.parquet") is None:
+            return f"导出 {mode} 需要安装 pyarrow: pip install pyarrow"
+        return None
+
+    def export(self, sql: str, output_file: str, mode: str, table_name: Optional[str] = None,
+               params: Optional[tuple] = None) -> Dict[str, Any]:
+        """执行 SQL（params 为 %s 占位符的参数）并把结果流式写入 output_file
+
+        返回 {"success", "path", "mode", "columns", "row_count", "batches", "elapsed"}；失败时 success 为 False，
+        已写出一部分的文件会被删除。
+        """
+        error = self.check_mode(mode)
+        if error:
+            return {"success": False, "error": error}
+
+        column_types = column_types_from_cache(self.db, table_name) if mode != "csv" else {}
+        start = time.time()
+        writer = None
+        row_count = batches = 0
+        columns: List[str] = []
+        try:
+            for columns, rows in self.db.iter_query_batches(sql, params, batch_rows=self.batch_rows):
+                if writer is None:
+                    if mode == "csv":
+                        writer = _CSVWriter(output_file, columns)
+                    else:
+                        writer = _ArrowWriter(output_file, columns, column_types, mode)
+                writer.write(rows)
+                row_count += len(rows)
+                batches += 1
+            if writer is not None:
+                writer.close()
+                writer = None
+        except Exception as e:
+            if writer is not None:
+                try:
+                    writer.close()
+                except Exception:
+                    pass
+            if os.path.exists(output_file):
+                os.remove(output_file)
+            return {"success": False, "error": f"导出失败: {e}", "sql": sql}
+
+        return {
+            "success": True,
+            "path": output_file,
+            "mode": mode,
+            "columns": columns,
+            "row_count": row_count,
+            "batches": batches,
+            "elapsed": round(time.time() - start, 3),
+        }
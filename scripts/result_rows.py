@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+紧凑的查询结果行
+execute_query 用元组游标读取结果，行保存为元组，列名 → 位置的索引整个结果只有一份：
+
+- ResultRows：按行号访问得到 Row 视图（__slots__，只引用元组和共享索引，不复制数据），
+  切片仍是 ResultRows；rows 属性是原始元组列表，列式统计、JSON/HTML 输出直接使用
+- Row：只读映射，row["列名"]、row.get("列名")、dict(row) 与原来的 dict 行用法一致
+
+相比每行一个 dict（每行重复保存所有列名引用和哈希表），宽表上万行的结果内存占用小得多。
+"""
+
+from collections.abc import Mapping, Sequence
+from typing import Dict, List, Any, Iterable, Optional
+
+
+class Row(Mapping):
+    """结果中一行的只读视图"""
+
+    __slots__ = ("_values", "_index")
+
+    def __init__(self, values: tuple, index: Dict[str, int]):
+        self._values = values
+        self._index = index
+
+    def __getitem__(self, column: str) -> Any:
+        return self._values[self._index[column]]
+
+    def get(self, column: str, default: Any = None) -> Any:
+        position = self._index.get(column)
+        return default if position is None else self._values[position]
+
+    def __contains__(self, column) -> bool:
+        return column in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __repr__(self) -> str:
+        return f"Row({dict(self)!r})"
+
+
+class ResultRows(Sequence):
+    """元组行 + 共享列索引"""
+
+    __slots__ = ("columns", "positions", "rows")
+
+    def __init__(self, columns: List[str], rows: Optional[List[tuple]] = None):
+        self.columns = list(columns)
+        # 列名重复时（联表的同名列）与 dict 行一致，取最后一个
+        self.positions: Dict[str, int] = {name: i for i, name in enumerate(self.columns)}
+        self.rows: List[tuple] = rows if rows is not None else []
+
+    @classmethod
+    def from_records(cls, columns: List[str], records: Iterable[Any]) -> "ResultRows":
+        """由 dict 行、Row 或序列行构建（旧版本快照、库方式调用方自行构造的结果）"""
+        if isinstance(records, ResultRows):
+            return records
+        rows = []
+        for record in records:
+            if isinstance(record, Mapping):
+                rows.append(tuple(record.get(name) for name in columns))
+            else:
+                rows.append(tuple(record))
+        return cls(columns, rows)
+
+    def extend(self, rows: Iterable[tuple]):
+        self.rows.extend(rows)
+
+    def column(self, name: str) -> List[Any]:
+        """整列取值"""
+        position = self.positions[name]
+        return [values[position] for values in self.rows]
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return ResultRows(self.columns, self.rows[item])
+        return Row(self.rows[item], self.positions)
+
+    def __iter__(self):
+        positions = self.positions
+        return (Row(values, positions) for values in self.rows)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __repr__(self) -> str:
+        return f"ResultRows(columns={self.columns!r}, rows={len(self.rows)})"
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+分表/分区裁剪
+识别按月/按日拆分的分表族（如 yt_burial_point_tb_202609、yt_burial_point_tb_202610），
+以及 information_schema.PARTITIONS 中的 RANGE 分区；按解析出的时间范围只保留有重叠的分表/分区，
+多个分表用 UNION ALL 执行并在外层合并聚合结果
+"""
+
+import re
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Any, Optional, Tuple
+
+# 表名_YYYYMM（按月）/ 表名_YYYYMMDD（按日）
+_SHARD_PATTERN = re.compile(r'^(?P<base>.+?)_(?P<period>\d{4}(?:0[1-9]|1[0-2])(?:[0-3]\d)?)$')
+
+# 裁剪时对时间范围额外放宽的余量（时间范围已按数据库服务器日期计算，默认不放宽）
+RANGE_MARGIN = timedelta(days=0)
+
+
+def _add_months(d: date, months: int) -> date:
+    month_index = d.year * 12 + (d.month - 1) + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def parse_shard_name(table_name: str) -> Optional[Tuple[str, date, date]]:
+    """解析分表名，返回 (分表族名, 覆盖起始日期, 覆盖结束日期(不含))；不是分表返回 None"""
+    match = _SHARD_PATTERN.match(table_name)
+    if not match:
+        return None
+    period = match.group("period")
+    try:
+        if len(period) == 6:
+            start = date(int(period[:4]), int(period[4:6]), 1)
+            return match.group("base"), start, _add_months(start, 1)
+        start = date(int(period[:4]), int(period[4:6]), int(period[6:8]))
+        return match.group("base"), start, start + timedelta(days=1)
+    except ValueError:
+        return None
+
+
+def detect_shard_families(table_names: List[str], min_shards: int = 2) -> Dict[str, List[Dict[str, Any]]]:
+    """按表名模式识别分表族：{族名: [{"table", "start", "end"}, ...]}（按时间排序）
+
+    至少 min_shards 个同名前缀的表才视为分表族，避免把恰好以日期结尾的单表误判。
+    """
+    families: Dict[str, List[Dict[str, Any]]] = {}
+    for table_name in table_names:
+        parsed = parse_shard_name(table_name)
+        if parsed:
+            base, start, end = parsed
+            families.setdefault(base, []).append({"table": table_name, "start": start, "end": end})
+    return {
+        base: sorted(shards, key=lambda s: s["start"])
+        for base, shards in families.items()
+        if len(shards) >= min_shards
+    }
+
+
+def _overlaps(start: date, end: date, time_range: Optional[Tuple[date, date]]) -> bool:
+    if time_range is None:
+        return True
+    range_start, range_end = time_range
+    return start < range_end + RANGE_MARGIN and end > range_start - RANGE_MARGIN
+
+
+def time_range_of(time_conditions: List[Dict[str, Any]]) -> Optional[Tuple[date, date]]:
+    """从时间条件中取出 [起始, 结束) 日期范围（多个条件取交集），没有范围返回 None"""
+    result = None
+    for cond in time_conditions or []:
+        bounds = cond.get("range") if isinstance(cond, dict) else None
+        if not bounds:
+            continue
+        start, end = date.fromisoformat(bounds[0]), date.fromisoformat(bounds[1])
+        result = (start, end) if result is None else (max(result[0], start), min(result[1], end))
+    return result
+
+
+def prune_shards(shards: List[Dict[str, Any]], time_range: Optional[Tuple[date, date]]) -> List[str]:
+    """保留与时间范围有重叠的分表"""
+    return [s["table"] for s in shards if _overlaps(s["start"], s["end"], time_range)]
+
+
+def _partition_bound(description: str, expression: str) -> Optional[date]:
+    """把 RANGE 分区的上界（PARTITION_DESCRIPTION）换算为日期，无法识别返回 None"""
+    if description is None:
+        return None
+    value = str(description).strip().strip("'\"")
+    if value.upper() == "MAXVALUE":
+        return date.max
+    expr = (expression or "").lower()
+    try:
+        if "to_days" in expr:
+            # MySQL TO_DAYS(d) = Python d.toordinal() + 365
+            return date.fromordinal(int(value) - 365)
+        if "unix_timestamp" in expr:
+            return datetime.fromtimestamp(int(value)).date()
+        if expr.startswith("year("):
+            return date(int(value), 1, 1)
+        if re.match(r'^\d{4}-\d{2}-\d{2}', value):
+            return date.fromisoformat(value[:10])
+    except (ValueError, OverflowError):
+        return None
+    return None
+
+
+def prune_partitions(partitions: List[Dict[str, Any]], time_field: str,
+                     time_range: Optional[Tuple[date, date]]) -> Optional[List[str]]:
+    """按时间范围裁剪 RANGE 分区
+
+    只处理分区表达式引用了 time_field 的 RANGE / RANGE COLUMNS 分区；
+    无法裁剪（非时间分区、边界无法识别、没有时间范围）时返回 None，交给优化器处理。
+    """
+    if not partitions or time_range is None:
+        return None
+    ranged = [p for p in partitions if (p.get("method") or "").startswith("RANGE")]
+    if len(ranged) != len(partitions):
+        return None
+    if not all(time_field.lower() in (p.get("expression") or "").lower().replace("`", "") for p in ranged):
+        return None
+
+    selected = []
+    lower = date.min
+    for partition in sorted(ranged, key=lambda p: p.get("ordinal") or 0):
+        upper = _partition_bound(partition.get("description"), partition.get("expression"))
+        if upper is None:
+            return None
+        if _overlaps(lower, upper, time_range):
+            selected.append(partition["name"])
+        lower = upper
+    return selected if len(selected) < len(ranged) else None
+
+
+def split_sql(sql: str) -> Dict[str, str]:
+    """把生成器产出的 SQL 拆成 select/from_where/group/order/limit 几段"""
+    parts = {"group": "", "order": "", "limit": ""}
+    rest = sql
+    limit = re.search(r'\sLIMIT\s+\d+\s*$', rest)
+    if limit:
+        parts["limit"] = limit.group(0).strip()
+        rest = rest[:limit.start()]
+    order = re.search(r'\sORDER BY\s+[^()]+$', rest)
+    if order:
+        parts["order"] = order.group(0).strip()
+        rest = rest[:order.start()]
+    group = re.search(r'\sGROUP BY\s+[^()]+$', rest)
+    if group:
+        parts["group"] = group.group(0).strip()
+        rest = rest[:group.start()]
+    from_pos = re.search(r'\sFROM\s', rest)
+    parts["select"] = rest[:from_pos.start()].strip()
+    parts["body"] = rest[from_pos.start():].strip()
+    return parts
+
+
+def _output_name(expr: str) -> str:
+    alias = re.search(r'\bAS\s+(\w+)\s*$', expr, re.IGNORECASE)
+    if alias:
+        return alias.group(1)
+    return expr.strip().split(".")[-1]
+
+
+def _split_select(select_clause: str) -> List[str]:
+    """按顶层逗号拆分 SELECT 列表（函数参数里的逗号不拆）"""
+    items, depth, current = [], 0, ""
+    for ch in re.sub(r'^SELECT\s+', '', select_clause, flags=re.IGNORECASE):
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        if ch == "," and depth == 0:
+            items.append(current.strip())
+            current = ""
+        else:
+            current += ch
+    if current.strip():
+        items.append(current.strip())
+    return items
+
+
+_AGGREGATE = re.compile(r'^(COUNT|SUM|AVG|MAX|MIN)\(([^()]*)\)\s+AS\s+(\w+)$', re.IGNORECASE)
+# build_union_sql 生成的 AVG 合并表达式，再次拆分时仍按 AVG 处理
+_MERGED_AVG = re.compile(r'^SUM\((\w+)\)\s*/\s*NULLIF\(SUM\((\w+)\),\s*0\)\s+AS\s+(\w+)$', re.IGNORECASE)
+
+
+def split_aggregates(sql: str) -> Optional[Dict[str, Any]]:
+    """把聚合查询拆成可在多个分表/数据库上分别执行的部分聚合 + 合并方式
+
+    返回 {"inner_sql", "group_names", "merges": [{"name", "func"}], "order", "limit"}，
+    merges 中 func 为 SUM/MAX/MIN/AVG（AVG 对应内层的 <name>_sum 和 <name>_count）；
+    不含聚合或含无法拆分的表达式时返回 None。
+    """
+    parts = split_sql(sql)
+    inner_select, group_names, merges = [], [], []
+    for column in _split_select(parts["select"]):
+        merged_avg = _MERGED_AVG.match(column)
+        match = _AGGREGATE.match(column)
+        if merged_avg:
+            alias = merged_avg.group(3)
+            inner_select.append(f"SUM({merged_avg.group(1)}) AS {alias}_sum")
+            inner_select.append(f"SUM({merged_avg.group(2)}) AS {alias}_count")
+            merges.append({"name": alias, "func": "AVG"})
+        elif match:
+            func, arg, alias = match.group(1).upper(), match.group(2), match.group(3)
+            if func == "AVG":
+                inner_select.append(f"SUM({arg}) AS {alias}_sum")
+                inner_select.append(f"COUNT({arg}) AS {alias}_count")
+            else:
+                inner_select.append(f"{func}({arg}) AS {alias}")
+            merges.append({"name": alias, "func": "SUM" if func in ("COUNT", "SUM") else func})
+        elif "(" in column:
+            return None
+        else:
+            inner_select.append(column)
+            group_names.append(_output_name(column))
+
+    if not merges or (group_names and not parts["group"]):
+        return None
+
+    inner_sql = f"SELECT {', '.join(inner_select)} {parts['body']}"
+    if parts["group"]:
+        inner_sql += f" {parts['group']}"
+    return {
+        "inner_sql": inner_sql,
+        "group_names": group_names,
+        "merges": merges,
+        "order": parts["order"],
+        "limit": parts["limit"],
+    }
+
+
+def build_union_sql(sql: str, logical_table: str, shards: List[str]) -> str:
+    """把针对逻辑表的 SQL 改写为各分表 UNION ALL，并在外层合并聚合
+
+    - COUNT/SUM → 外层 SUM；MAX/MIN → 外层 MAX/MIN；AVG → 内层 SUM+COUNT，外层相除
+    - GROUP BY → 内层各分表分组，外层再按同一字段分组求和
+    - 明细查询 → 各分表各自 ORDER BY/LIMIT，外层再 ORDER BY/LIMIT
+    """
+    if len(shards) == 1:
+        return _replace_table(sql, logical_table, shards[0])
+
+    plan = split_aggregates(sql)
+    if plan is None:
+        parts = split_sql(sql)
+        branches = [f"({_replace_table(sql, logical_table, shard)})" for shard in shards]
+        outer_order = re.sub(r'\b\w+\.', '', parts["order"])
+        tail = " ".join(p for p in (outer_order, parts["limit"]) if p)
+        return " UNION ALL ".join(branches) + (f" {tail}" if tail else "")
+
+    outer_select = list(plan["group_names"])
+    for merge in plan["merges"]:
+        name = merge["name"]
+        if merge["func"] == "AVG":
+            outer_select.append(f"SUM({name}_sum) / NULLIF(SUM({name}_count), 0) AS {name}")
+        else:
+            outer_select.append(f"{merge['func']}({name}) AS {name}")
+    branches = [_replace_table(plan["inner_sql"], logical_table, shard) for shard in shards]
+
+    outer = f"SELECT {', '.join(outer_select)} FROM ({' UNION ALL '.join(branches)}) AS shard_union"
+    if plan["group_names"]:
+        outer += f" GROUP BY {', '.join(plan['group_names'])}"
+    outer_order = _outer_order(plan["order"], [_output_name(c) for c in outer_select])
+    if outer_order:
+        outer += " " + outer_order
+    if plan["limit"]:
+        outer += " " + plan["limit"]
+    return outer
+
+
+def _outer_order(order_clause: str, output_names: List[str]) -> str:
+    """外层 ORDER BY：去掉表别名前缀；引用了外层不存在的列时整体丢弃（聚合后只剩一行或该列已不可见）"""
+    if not order_clause:
+        return ""
+    order_clause = re.sub(r'\b\w+\.', '', order_clause)
+    items = re.sub(r'^ORDER BY\s+', '', order_clause, flags=re.IGNORECASE).split(",")
+    columns = [item.strip().split()[0] for item in items if item.strip()]
+    if all(col in output_names for col in columns):
+        return order_clause
+    return ""
+
+
+def _replace_table(sql: str, logical_table: str, physical_table: str) -> str:
+    return re.sub(rf'\b(FROM|JOIN)\s+{re.escape(logical_table)}\b', rf'\1 {physical_table}', sql)
+
+
+def add_partition_clause(sql: str, table: str, partitions: List[str]) -> str:
+    """在 FROM 表名后加 PARTITION (...) 显式指定分区"""
+    clause = f"PARTITION ({', '.join(partitions)})"
+    return re.sub(rf'\bFROM\s+{re.escape(table)}\b', f"FROM {table} {clause}", sql, count=1)
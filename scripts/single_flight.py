@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+单飞（single-flight）去重
+同一时刻针对同一个键的多个调用只真正执行一次，其余调用等待并共享该次执行的结果
+"""
+
+import re
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+def normalize_sql(query: str, params: Optional[tuple] = None) -> str:
+    """规范化SQL作为去重键：压缩空白、去掉末尾分号，并带上参数"""
+    text = re.sub(r"\s+", " ", (query or "").strip()).rstrip(";").strip()
+    if params:
+        text += " -- " + repr(tuple(params))
+    return text
+
+
+class SingleFlightTimeout(Exception):
+    """等待其他调用的执行结果超时"""
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self.executions = 0
+        self.shared = 0
+        self.timeouts = 0
+
+    def do(self, key: str, fn: Callable[[], Any], timeout: Optional[float] = None) -> Tuple[Any, bool]:
+        """执行 fn 或等待同键的在途执行
+
+        返回 (结果, 是否共享了他人的执行)。等待超过 timeout 秒抛出 SingleFlightTimeout；
+        在途执行抛出的异常会原样传递给所有等待者。
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executions += 1
+                leader = True
+
+        if not leader:
+            if not call.done.wait(timeout):
+                with self._lock:
+                    call.waiters -= 1
+                    self.timeouts += 1
+                raise SingleFlightTimeout(key)
+            with self._lock:
+                self.shared += 1
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self) -> Dict[str, int]:
+        """当前在途的键及其等待者数量"""
+        with self._lock:
+            return {key: call.waiters for key, call in self._calls.items()}
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "executions": self.executions,
+            "saved_executions": self.shared,
+            "timeouts": self.timeouts,
+            "in_flight": len(self._calls),
+        }
@@ -6,11 +6,31 @@
 
 import json
 import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
-from typing import Dict, Any, List, Tuple
-from collections import Counter
+from decimal import Decimal
+from typing import TYPE_CHECKING, Dict, Any, List, Tuple
 from smart_db_connector import SmartDBConnector
 from nlp_query_parser import NLPQueryParser
+from plan_cache import PlanCache
+from result_columns import ResultColumns
+from result_rows import ResultRows, Row
+from chart_reducer import reduce_trend, top_k_with_other
+from result_export import EXPORT_MODES
+from prepared_statements import plan_statement
+from lazy_import import MissingDependencyError
+from monitoring import (
+    REGISTRY, REQUESTS, REQUEST_STAGE_SECONDS, SlowQueryLog, monitoring_config
+)
+
+if TYPE_CHECKING:
+    from query_profiler import QueryProfiler
+
+# --profile 的可选模式（与 query_profiler.PROFILE_MODES 相同）：剖析器依赖 cProfile / pstats / tracemalloc，
+# 只在 --profile 时导入
+PROFILE_MODES = ("cpu", "mem")
 
 
 def _get_skill_root() -> str:
@@ -18,11 +38,42 @@ def _get_skill_root() -> str:
     script_dir = os.path.dirname(os.path.abspath(__file__))
     return os.path.dirname(script_dir)
 
+class ResultJSONEncoder(json.JSONEncoder):
+    """查询结果 JSON 编码器：处理 datetime / Decimal / bytes 等 MySQL 返回类型
+
+    ResultRows 直接输出底层元组（每行一个数组，列名见同一结果的 columns），不逐行构造 dict。
+    """
+
+    def default(self, obj):
+        if isinstance(obj, ResultRows):
+            return obj.rows
+        if isinstance(obj, Row):
+            return dict(obj)
+        if hasattr(obj, "strftime"):
+            return obj.strftime("%Y-%m-%d %H:%M:%S")
+        if isinstance(obj, Decimal):
+            return float(obj)
+        if isinstance(obj, bytes):
+            return obj.decode("utf-8", errors="ignore")
+        return super().default(obj)
+
+
 class SmartDashboardGenerator:
-    def __init__(self, config_file: str | None = None):
+    def __init__(self, config_file: str | None = None, keep_connection: bool = False,
+                 plan_cache_file: str | None = None, fan_out: bool | None = None,
+                 snapshot_file: str | None = None, monitoring: Dict[str, Any] | None = None,
+                 prefetch: bool | None = None):
         """初始化智能看板生成器
 
         约定：配置文件必须使用 Skill 目录下的 db_config.json 和 entity_config.json。
+        keep_connection=True 时 process_query 结束后不关闭连接，供常驻进程（定时刷新等）复用。
+        plan_cache_file 指定后，查询计划缓存会持久化到该 SQLite 文件，跨进程复用。
+        fan_out=True 时把 SQL 并发发往 db_config.json 中 fan_out.databases 的所有实例并合并结果；
+        None 表示按配置中的 fan_out.enabled 决定。
+        snapshot_file 指定后，每次查询结果都追加保存到该 SQLite 快照库，可离线重新生成看板、比较和查看历史趋势。
+        monitoring 覆盖 db_config.json 中的 monitoring 配置（慢查询日志、指标文件、指标 HTTP 端口）。
+        prefetch=True 时在后台预取最可能的追问（只在 keep_connection=True 且未使用多库并行查询时生效）；
+        None 表示按配置中的 prefetch.enabled 决定（默认关闭），定时刷新、负载测试等无人值守的调用方传 False。
         """
         skill_root = _get_skill_root()
 
@@ -37,15 +88,78 @@ class SmartDashboardGenerator:
         entity_config_path = os.path.join(skill_root, "entity_config.json")
 
         self.db = SmartDBConnector(db_config_path)
-        self.parser = NLPQueryParser(self.db, config_file=entity_config_path)
+        self.parser = NLPQueryParser(
+            self.db, config_file=entity_config_path, plan_cache=PlanCache(store_file=plan_cache_file),
+            build_value_dictionary=keep_connection,
+        )
         self.template_path = "assets/enhanced_dashboard_template.html"
+        self.keep_connection = keep_connection
+        # 多库并行查询、快照库和预取只在对应的参数或配置启用时才导入，只生成 SQL 的命令行调用不加载
+        self.fan_out = None
+        if fan_out is not False and isinstance(self.db.config, dict) and self.db.config.get("fan_out"):
+            from fan_out import FanOutExecutor
+
+            self.fan_out = FanOutExecutor.from_connector(self.db)
+            if self.fan_out is not None and not (self.fan_out.enabled if fan_out is None else fan_out):
+                self.fan_out = None
+        self.snapshots = None
+        if snapshot_file:
+            from snapshot_store import SnapshotStore
+
+            self.snapshots = SnapshotStore(snapshot_file)
+        # 常驻进程中预取最可能的追问（趋势、上一周期、下钻），结果放入连接器的结果缓存
+        self.prefetcher = None
+        if keep_connection and self.fan_out is None and prefetch is not False:
+            from prefetch import Prefetcher, prefetch_config
+
+            prefetch_settings = prefetch_config(self.db.config.get("prefetch"))
+            if prefetch or prefetch_settings["enabled"]:
+                self.prefetcher = Prefetcher(self.db, self.parser, prefetch_settings)
+
+        # 运行指标和慢查询日志
+        monitoring_settings = monitoring_config(self.db.config.get("monitoring"))
+        monitoring_settings.update({k: v for k, v in (monitoring or {}).items() if v is not None})
+        self.slow_log = (
+            SlowQueryLog(monitoring_settings["slow_query_log"], monitoring_settings["slow_query_ms"])
+            if monitoring_settings["slow_query_log"] else None
+        )
+        self.metrics_file = monitoring_settings["metrics_file"]
+        if monitoring_settings["metrics_port"]:
+            REGISTRY.serve(monitoring_settings["metrics_port"], monitoring_settings["metrics_host"])
     
-    def process_query(self, user_query: str) -> Dict[str, Any]:
-        """处理用户查询的完整流程"""
+    def process_query(self, user_query: str, cancel_event: threading.Event | None = None) -> Dict[str, Any]:
+        """处理用户查询的完整流程
+
+        结果中的 timings 记录各阶段耗时（毫秒）：parse（解析/计划）、execute（执行SQL）、analyze（统计、图表和快照）
+        和 total；失败的结果只包含已完成的阶段。耗时同时计入运行指标，超过阈值时写入慢查询日志。
+        SQL 超过截止时间（db_config.json 的 query_timeout）时返回部分结果（partial）或 type 为 timeout 的失败结果；
+        调用方（如 HTTP 客户端断开时）设置 cancel_event 可立即取消服务器上正在执行的查询。
+        """
+        started = time.perf_counter()
+        timings: Dict[str, float] = {}
+        result = self._process_query(user_query, timings, cancel_event)
+        timings["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        result["timings"] = timings
+
+        REQUESTS.inc(status="success" if result.get("success") else result.get("type", "parse_error"))
+        for stage in ("parse", "execute", "analyze", "total"):
+            if f"{stage}_ms" in timings:
+                REQUEST_STAGE_SECONDS.observe(timings[f"{stage}_ms"] / 1000, stage=stage)
+        if self.slow_log is not None and self.slow_log.record(user_query, result):
+            print(f"🐢 慢查询（{timings['total_ms']}ms）已记录: {self.slow_log.path}")
+        if self.metrics_file:
+            REGISTRY.write_file(self.metrics_file)
+        if self.prefetcher is not None and result.get("success") and not result.get("partial"):
+            self.prefetcher.schedule(user_query, result)
+        return result
+
+    def _process_query(self, user_query: str, timings: Dict[str, float],
+                       cancel_event: threading.Event | None = None) -> Dict[str, Any]:
         print(f"🔍 处理查询: {user_query}")
         
-        # 1. 尝试建立数据库连接（不主动发现表，表匹配时按需调用 SHOW TABLES）
-        if not self.db.connect():
+        # 1. 尝试建立数据库连接（不主动发现表，表匹配时按需调用 SHOW TABLES；已有连接时直接复用）
+        connected = self.db.connection is not None and self.db.connection.is_connected()
+        if not connected and not self.db.connect():
             return {
                 "success": False,
                 "error": "数据库连接失败，请检查配置",
@@ -53,7 +167,10 @@ class SmartDashboardGenerator:
             }
 
         # 2. 解析查询并生成执行计划（优先使用 entity_config 映射，失败时再通过 SHOW TABLES 匹配）
+        parse_started = time.perf_counter()
         query_plan = self.parser.parse_query(user_query)
+        parsed = time.perf_counter()
+        timings["parse_ms"] = round((parsed - parse_started) * 1000, 1)
         
         if not query_plan["success"]:
             return query_plan
@@ -61,10 +178,23 @@ class SmartDashboardGenerator:
         print(f"📋 匹配到表: {query_plan['primary_table']}")
         print(f"🎯 查询意图: {query_plan['query_intent']}")
         
-        # 4. 执行SQL查询
-        sql_result = self.db.execute_query(query_plan["sql_query"])
+        # 4. 执行SQL查询（多库模式下并发发往所有实例并合并）
+        if self.fan_out is not None:
+            sql_result = self.fan_out.execute(query_plan["sql_query"], cancel_event=cancel_event)
+        else:
+            sql, params = plan_statement(query_plan)
+            sql_result = self.db.execute_query(sql, params, cancel_event=cancel_event)
+        executed = time.perf_counter()
+        timings["execute_ms"] = round((executed - parsed) * 1000, 1)
         
         if not sql_result["success"]:
+            if sql_result.get("timeout"):
+                return {
+                    "success": False,
+                    "error": f"{sql_result['error']}（可以缩小时间范围或增加筛选条件后重试）",
+                    "sql": query_plan["sql_query"],
+                    "type": "timeout"
+                }
             return {
                 "success": False,
                 "error": f"SQL执行失败: {sql_result['error']}",
@@ -73,9 +203,12 @@ class SmartDashboardGenerator:
             }
         
         print(f"📊 查询结果: {sql_result['row_count']} 行")
+        if sql_result.get("result_cache"):
+            print("⚡ 使用预取的追问结果")
+        if sql_result.get("timeout"):
+            print(f"⚠️ {sql_result['warning']}")
         
         # 5. 组装完整结果
-        start_time = datetime.now()
         result = {
             "success": True,
             "data": sql_result["data"],
@@ -88,18 +221,138 @@ class SmartDashboardGenerator:
             "timestamp": datetime.now().isoformat(),
             "original_query": user_query,
             "matched_tables": query_plan["table_matches"],
-            "query_time": f"{(datetime.now() - start_time).total_seconds():.2f}s"
+            "query_time": f"{executed - parsed:.2f}s"
         }
+        if sql_result.get("guard"):
+            result["guard"] = sql_result["guard"]
+        if sql_result.get("result_cache"):
+            result["result_cache"] = sql_result["result_cache"]
+        if sql_result.get("sources"):
+            result["sources"] = sql_result["sources"]
+            result["partial"] = sql_result["partial"]
+        if sql_result.get("timeout"):
+            result["partial"] = True
+            result["timeout"] = sql_result["timeout"]
+
+        # 6. 生成统计和图表数据（结果只转置一次为列式存储，统计和图表共用）
+        table = ResultColumns(result["data"], result["columns"])
+        result["stats"] = self._generate_stats(result, table)
+        result["charts"] = self._generate_charts(result, table)
+
+        # 保存结果快照，并用历次快照的指标生成历史趋势图（不扫描原始表）
+        if self.snapshots is not None:
+            result["snapshot_id"] = self.snapshots.save(result, self.db.config.get("database"))
+            history = self._history_chart(result)
+            if history:
+                result["charts"].append(history)
+
+        timings["analyze_ms"] = round((time.perf_counter() - executed) * 1000, 1)
+
+        # 7. 关闭数据库连接（常驻模式下保留连接）
+        if not self.keep_connection:
+            if self.fan_out is not None:
+                self.fan_out.disconnect()
+            else:
+                self.db.disconnect()
 
-        # 6. 生成统计和图表数据
-        result["stats"] = self._generate_stats(result)
-        result["charts"] = self._generate_charts(result)
+        return result
 
-        # 7. 关闭数据库连接
-        self.db.disconnect()
+    def export_query(self, user_query: str, mode: str, output_file: str | None = None) -> Dict[str, Any]:
+        """解析查询并把结果流式导出为 parquet / arrow / csv 文件
+
+        结果按批从游标写入文件，不生成统计、图表和看板；多库并行查询不参与导出，只查询主库。
+        """
+        from result_export import ResultExporter, default_export_path
+
+        error = ResultExporter.check_mode(mode)
+        if error:
+            return {"success": False, "error": error}
+
+        print(f"🔍 处理查询: {user_query}")
+        connected = self.db.connection is not None and self.db.connection.is_connected()
+        if not connected and not self.db.connect():
+            return {
+                "success": False,
+                "error": "数据库连接失败，请检查配置",
+                "type": "connection_error"
+            }
 
+        query_plan = self.parser.parse_query(user_query)
+        if not query_plan["success"]:
+            return query_plan
+        print(f"📋 匹配到表: {query_plan['primary_table']}")
+        if self.fan_out is not None:
+            print("⚠️ 导出模式只查询主库，未使用多库并行查询")
+
+        output_file = output_file or default_export_path(user_query, mode)
+        sql, params = plan_statement(query_plan)
+        result = ResultExporter(self.db).export(
+            sql, output_file, mode, table_name=query_plan["primary_table"], params=params
+        )
+        result["sql_query"] = query_plan["sql_query"]
+
+        if not self.keep_connection:
+            self.db.disconnect()
         return result
     
+    @contextmanager
+    def profiled(self, mode: str, report_base: str | None = None):
+        """对 with 块内的一次 process_query / create_dashboard 运行做剖析（mode: "cpu" / "mem"）
+
+        退出时把报告（.cpu.pstats / .mem.json）写到 report_base 旁边并打印热点摘要；
+        块内可以修改 profiler.report_base（例如看板生成后改为看板文件名）。
+        """
+        from query_profiler import QueryProfiler
+
+        profiler = QueryProfiler(mode, report_base).start()
+        try:
+            yield profiler
+        finally:
+            profiler.stop()
+            profiler.write_reports()
+            profiler.print_summary()
+
+    def render_snapshot(self, snapshot_id: int, output_file: str | None = None) -> str | None:
+        """用快照中保存的结果重新生成看板（不连接数据库）"""
+        if self.snapshots is None:
+            print("❌ 未指定快照库")
+            return None
+        result = self.snapshots.load(snapshot_id)
+        if result is None:
+            print(f"❌ 快照不存在: {snapshot_id}")
+            return None
+        print(f"🗂️ 使用快照 #{snapshot_id}（{result['snapshot']['created_at']}）")
+        return self.create_dashboard(result.get("original_query", ""), output_file=output_file, query_result=result)
+
+    def _history_chart(self, result: Dict[str, Any]) -> Dict[str, Any] | None:
+        """同一查询历次快照的主指标趋势（单行聚合取第一个数值列，其余取结果行数），至少两次快照时生成"""
+        metric = "row_count"
+        if result.get("row_count") == 1:
+            from snapshot_store import extract_metrics
+
+            metrics = extract_metrics(result)
+            metric = next((col for col in result.get("columns", []) if col in metrics), metric)
+        series = self.snapshots.trend(
+            result.get("original_query", ""), self.db.config.get("database"), names=[metric]
+        ).get(metric, [])
+        if len(series) < 2:
+            return None
+        return {
+            "type": "line",
+            "title": f"历史趋势（{'结果行数' if metric == 'row_count' else metric}，共 {len(series)} 次查询）",
+            "data": {
+                "labels": [label for label, _ in series],
+                "datasets": [{
+                    "label": metric,
+                    "data": [value for _, value in series],
+                    "borderColor": "#764ba2",
+                    "backgroundColor": "rgba(118, 75, 162, 0.1)",
+                    "fill": True,
+                    "tension": 0.4
+                }]
+            }
+        }
+
     def _generate_description(self, query: str, plan: Dict[str, Any], 
                           sql_result: Dict[str, Any]) -> str:
         """生成查询结果描述"""
@@ -110,7 +363,14 @@ class SmartDashboardGenerator:
 
         def _with_time_suffix(text: str) -> str:
             if time_desc:
-                return f"{text}（时间范围：{time_desc}）"
+                text = f"{text}（时间范围：{time_desc}）"
+            if (sql_result.get("guard") or {}).get("approximate"):
+                text = f"{text}（数据量过大，已降级为近似/采样结果）"
+            if sql_result.get("partial") and sql_result.get("sources"):
+                failed = [s["name"] for s in sql_result.get("sources", []) if not s["success"]]
+                text = f"{text}（部分数据库未返回结果：{', '.join(failed)}）"
+            if sql_result.get("timeout"):
+                text = f"{text}（查询超时，只包含前 {sql_result['row_count']} 行，结果不完整）"
             return text
         
         # 根据查询类型生成描述
@@ -126,13 +386,15 @@ class SmartDashboardGenerator:
         else:
             return _with_time_suffix(f"查询结果: {sql_result['row_count']} 条记录")
 
-    def _generate_stats(self, result: Dict[str, Any]) -> Dict[str, Any]:
-        """生成统计数据"""
+    def _generate_stats(self, result: Dict[str, Any], table: ResultColumns | None = None) -> Dict[str, Any]:
+        """生成统计数据（基于列式结果，类型按整列识别）"""
         stats = {"list": []}
         data = result.get("data", [])
 
         if not data:
             return stats
+        if table is None:
+            table = ResultColumns(data, result.get("columns", []))
 
         # 总记录数
         stats["list"].append({
@@ -140,84 +402,64 @@ class SmartDashboardGenerator:
             "value": result.get("row_count", 0)
         })
 
-        # 分析数据列，生成统计
-        columns = result.get("columns", [])
-
-        # 查找数值列进行统计
-        numeric_columns = []
-        for i, col in enumerate(columns):
-            if data and len(data) > 0:
-                val = data[0].get(i) if isinstance(data[0], dict) else data[0][i]
-                if isinstance(val, (int, float)) and 'id' not in col.lower():
-                    numeric_columns.append(col)
-
-        # 为数值列生成统计
-        for col in numeric_columns[:5]:  # 最多5个数值列
-            values = []
-            for row in data:
-                val = row.get(col) if isinstance(row, dict) else row[columns.index(col)]
-                if isinstance(val, (int, float)):
-                    values.append(val)
-
-            if values:
-                avg_val = sum(values) / len(values)
+        # 为数值列生成统计（最多5个数值列），完整的分布指标放在 stats["columns"] 中
+        stats["columns"] = {}
+        numeric_columns = [col for col in table.numeric_columns() if 'id' not in col.name.lower()]
+        for col in numeric_columns[:5]:
+            summary = col.summary()
+            if "mean" in summary:
                 stats["list"].append({
-                    "label": f"{col} (平均)",
-                    "value": f"{avg_val:.2f}"
+                    "label": f"{col.name} (平均)",
+                    "value": f"{summary['mean']:.2f}"
                 })
+                stats["columns"][col.name] = summary
 
         # 统计唯一值数量（适用于分类字段）
-        for col in columns[:5]:  # 最多5个列
-            if col in ['id', 'uuid', 'UUID']:
+        for col in list(table)[:5]:  # 最多5个列
+            if col.name in ['id', 'uuid', 'UUID']:
                 continue
 
-            unique_values = set()
-            for row in data:
-                val = row.get(col) if isinstance(row, dict) else row[columns.index(col)]
-                if val is not None:
-                    unique_values.add(str(val))
-
-            if 1 < len(unique_values) <= 20:  # 只显示有意义的分类
+            distinct = col.distinct_count()
+            if 1 < distinct <= 20:  # 只显示有意义的分类
                 stats["list"].append({
-                    "label": f"{col} (分类数)",
-                    "value": len(unique_values)
+                    "label": f"{col.name} (分类数)",
+                    "value": distinct
                 })
 
         return stats
 
-    def _generate_charts(self, result: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """生成图表配置"""
+    def _generate_charts(self, result: Dict[str, Any], table: ResultColumns | None = None) -> List[Dict[str, Any]]:
+        """生成图表配置（取值分布和按天计数来自列式结果的缓存）"""
         charts = []
         data = result.get("data", [])
         columns = result.get("columns", [])
 
         if not data:
             return charts
+        if table is None:
+            table = ResultColumns(data, columns)
 
         # 1. 生成分类数据的柱状图/饼图
         for col in columns[:8]:  # 最多8个列
-            # 统计该列的值分布
-            counter = Counter()
-            for row in data:
-                val = row.get(col) if isinstance(row, dict) else row.get(columns.index(col))
-                if val is not None:
-                    counter[str(val)] += 1
-
-            # 只显示有分类意义的列（2-15个类别）
-            if 2 <= len(counter) <= 15 and col not in ['id', 'uuid', 'UUID']:
+            # 只显示有分类意义的列（2-50个类别，超过10个时合并为“其他”）
+            if col in ['id', 'uuid', 'UUID'] or not 2 <= table[col].distinct_count() <= 50:
+                continue
+            counter = table[col].value_counts()
+            if counter:
+                labels, values = top_k_with_other(counter)
                 # 生成饼图
                 chart_data = {
                     "type": "doughnut",
                     "title": f"{col} 分布",
                     "data": {
-                        "labels": list(counter.keys())[:10],
+                        "labels": labels,
                         "datasets": [{
-                            "data": list(counter.values())[:10],
+                            "data": values,
                             "backgroundColor": [
                                 '#667eea', '#764ba2', '#f093fb', '#4facfe',
                                 '#43e97b', '#fa709a', '#fee140', '#30cfd0',
                                 '#a8edea', '#fed6e3'
-                            ][:len(counter)]
+                            ][:len(labels)]
                         }]
                     }
                 }
@@ -230,26 +472,20 @@ class SmartDashboardGenerator:
         time_columns = ['time', 'date', 'created_at', 'register_time', 'usage_time', 'viewing_time']
         for col in columns:
             if any(tc in col.lower() for tc in time_columns):
-                # 按时间分组统计
-                time_counter = Counter()
-                for row in data:
-                    val = row.get(col) if isinstance(row, dict) else row.get(columns.index(col))
-                    if val:
-                        # 提取日期部分
-                        if isinstance(val, str):
-                            date_part = val.split(' ')[0][:10]
-                            time_counter[date_part] += 1
+                # 按日期分组统计
+                time_counter = table[col].day_counts()
 
                 if len(time_counter) > 1:
-                    sorted_times = sorted(time_counter.items())
+                    # 覆盖完整时间范围（缺数据的日期补 0），点数过多时用 LTTB 降采样
+                    labels, values = reduce_trend(time_counter)
                     chart_data = {
                         "type": "line",
                         "title": f"{col} 趋势",
                         "data": {
-                            "labels": [t[0] for t in sorted_times[-30:]],  # 最近30个时间点
+                            "labels": labels,
                             "datasets": [{
                                 "label": "数量",
-                                "data": [t[1] for t in sorted_times[-30:]],
+                                "data": values,
                                 "borderColor": "#667eea",
                                 "backgroundColor": "rgba(102, 126, 234, 0.1)",
                                 "fill": True,
@@ -281,38 +517,10 @@ class SmartDashboardGenerator:
 
             # 准备数据
             columns = query_result.get("columns", [])
+            # ResultRows 的行直接以数组写入（表格脚本按列序号读取），不再逐行复制为 dict；
+            # 时间、Decimal 等类型由 ResultJSONEncoder 在编码时转换
             data = query_result.get("data", [])
 
-            # 转换数据格式（从 tuple 转为 dict）
-            formatted_data = []
-            for row in data:
-                if isinstance(row, (tuple, list)):
-                    row_dict = {}
-                    for i, col in enumerate(columns):
-                        if i < len(row):
-                            val = row[i]
-                            # 格式化时间
-                            if hasattr(val, 'strftime'):
-                                val = val.strftime('%Y-%m-%d %H:%M:%S')
-                            row_dict[col] = val
-                    formatted_data.append(row_dict)
-                else:
-                    formatted_data.append(row)
-
-            # 自定义JSON编码器处理特殊数据类型
-            class DateTimeEncoder(json.JSONEncoder):
-                def default(self, obj):
-                    # 处理datetime对象
-                    if hasattr(obj, 'strftime'):
-                        return obj.strftime('%Y-%m-%d %H:%M:%S')
-                    # 处理Decimal对象（MySQL数值类型）
-                    if hasattr(obj, 'float'):
-                        return float(obj)
-                    # 处理bytes对象
-                    if isinstance(obj, bytes):
-                        return obj.decode('utf-8', errors='ignore')
-                    return super().default(obj)
-
             # 替换模板占位符
             replacements = {
                 "{{TITLE}}": f"数据看板 - {query_result.get('original_query', '')}",
@@ -323,7 +531,7 @@ class SmartDashboardGenerator:
                 "{{ROW_COUNT}}": str(query_result.get("row_count", 0)),
                 "{{DATA_JSON}}": json.dumps({
                     "success": True,
-                    "data": formatted_data,
+                    "data": data,
                     "columns": columns,
                     "row_count": query_result.get("row_count", 0),
                     "stats": query_result.get("stats", {"list": []}),
@@ -333,8 +541,10 @@ class SmartDashboardGenerator:
                         "sql": query_result.get("sql_query", ""),
                         "primary_table": query_result.get("query_plan", {}).get("primary_table"),
                         "time_conditions": query_result.get("query_plan", {}).get("query_intent", {}).get("time_conditions", []),
+                        "guard": query_result.get("guard"),
+                        "sources": query_result.get("sources"),
                     },
-                }, ensure_ascii=False, indent=2, cls=DateTimeEncoder)
+                }, ensure_ascii=False, cls=ResultJSONEncoder)
             }
 
             html_content = html_template
@@ -348,7 +558,7 @@ class SmartDashboardGenerator:
     
     def _generate_data_injection(self, query_result: Dict[str, Any]) -> str:
         """生成数据注入脚本"""
-        data_json = json.dumps(query_result, ensure_ascii=False, indent=2)
+        data_json = json.dumps(query_result, ensure_ascii=False, indent=2, cls=ResultJSONEncoder)
         
         return f"""
         <script>
@@ -546,8 +756,107 @@ def _check_entity_config(entity_config_path: str) -> Tuple[bool, List[str], List
     return (not errors), errors, warnings
 
 
+def _print_result_summary(result: Dict[str, Any], max_rows: int = 50):
+    """打印匹配的表、SQL、结果行数和数据预览（控制台最多展示前 max_rows 行）"""
+    plan = result.get("query_plan") or {}
+    print("📋 匹配到表:", plan.get("primary_table"))
+    print("📌 生成的SQL:")
+    print(result.get("sql_query", ""))
+    row_count = result.get("row_count", 0)
+    print("📊 结果行数:", row_count)
+
+    # 直接输出用户所需的内容（数据预览）
+    data = result.get("data") or []
+    columns = result.get("columns") or []
+    if data and columns:
+        print(f"📄 数据预览（最多显示前 {max_rows} 行）：")
+        header = " | ".join(columns)
+        print(header)
+        print("-" * len(header))
+
+        for idx, row in enumerate(data):
+            if idx >= max_rows:
+                if row_count > max_rows:
+                    print(f"...（其余 {row_count - max_rows} 行已省略）")
+                break
+
+            # row 为 Row 视图（或库方式调用方传入的 dict 行）
+            values = []
+            for col in columns:
+                val = row.get(col)
+                if hasattr(val, "strftime"):
+                    val = val.strftime("%Y-%m-%d %H:%M:%S")
+                values.append("" if val is None else str(val))
+            print(" | ".join(values))
+
+
+def _run_snapshot_command(args):
+    """快照库相关的命令：列出、从快照生成看板、比较、历史趋势（都不查询 MySQL）"""
+    if not args.snapshot_store:
+        print("❌ 请用 --snapshot-store 指定快照库文件")
+        return
+    generator = SmartDashboardGenerator(args.db_config, snapshot_file=args.snapshot_store)
+    store = generator.snapshots
+    database = generator.db.config.get("database")
+    user_query = " ".join(args.query) or None
+
+    if args.from_snapshot is not None:
+        generator.render_snapshot(args.from_snapshot, output_file=args.output)
+        return
+
+    if args.compare_snapshots:
+        comparison = store.compare(*args.compare_snapshots)
+        if not comparison["success"]:
+            print(f"❌ {comparison['error']}")
+            return
+        old, new = comparison["old"], comparison["new"]
+        print(f"🗂️ #{old['id']}（{old['created_at']}）→ #{new['id']}（{new['created_at']}）")
+        if not comparison["same_query"]:
+            print(f"⚠️ 两个快照来自不同的查询: {old['query']} / {new['query']}")
+        for item in comparison["metrics"]:
+            old_value = "-" if item["old"] is None else f"{item['old']:g}"
+            new_value = "-" if item["new"] is None else f"{item['new']:g}"
+            change = ""
+            if item["change"] is not None:
+                change = f"  {item['change']:+g}"
+                if item["change_pct"] is not None:
+                    change += f"（{item['change_pct']:+.2f}%）"
+            print(f"  {item['name']}: {old_value} → {new_value}{change}")
+        return
+
+    if args.history:
+        if not user_query:
+            print("❌ 请给出要查看历史趋势的查询")
+            return
+        series = store.trend(user_query, database)
+        if not series:
+            print("📭 快照库中没有该查询的记录")
+            return
+        for name, points in series.items():
+            print(f"📈 {name}")
+            for label, value in points:
+                print(f"  {label}  {value:g}")
+        return
+
+    snapshots = store.recent(user_query, database)
+    if not snapshots:
+        print("📭 快照库为空" if not user_query else "📭 快照库中没有该查询的记录")
+        return
+    for item in snapshots:
+        print(f"#{item['id']}  {item['created_at']}  {item['row_count']} 行  {item['query']}")
+
+
 def main():
     """主函数 - 命令行使用"""
+    try:
+        _main()
+    except MissingDependencyError as e:
+        # 按需导入的依赖（MySQL 驱动等）未安装
+        print(f"❌ {e}")
+        raise SystemExit(1)
+
+
+def _main():
     import argparse
     import sys
 
@@ -559,10 +868,35 @@ def main():
     default_entity_config = os.path.join(_get_skill_root(), "entity_config.json")
     parser.add_argument("--db-config", default=default_db_config, help="数据库配置文件路径（默认使用 skill 目录下的 db_config.json）")
     parser.add_argument("--entity-config", default=default_entity_config, help="实体配置文件路径（默认使用 skill 目录下的 entity_config.json）")
-    parser.add_argument("--mode", choices=["dashboard", "sql", "json"], default="dashboard", help="输出模式: 仪表盘HTML / 仅SQL / 原始JSON结果")
-    parser.add_argument("--output", help="输出HTML文件路径(仅 dashboard 模式有效)")
+    parser.add_argument("--mode", choices=["dashboard", "sql", "json", *EXPORT_MODES], default="dashboard",
+                        help="输出模式: 仪表盘HTML / 仅SQL / 原始JSON结果 / 导出为 Parquet、Arrow、CSV 文件")
+    parser.add_argument("--output", help="输出文件路径（dashboard 模式为 HTML，导出模式为对应格式的文件）")
+    parser.add_argument("--plan-cache", help="查询计划缓存文件（SQLite），重复的问题直接复用已生成的计划")
+    parser.add_argument("--fan-out", action="store_true", default=None,
+                        help="在 db_config.json 的 fan_out.databases 所有实例上并发执行并合并结果")
+    parser.add_argument("--snapshot-store", help="结果快照库文件（SQLite），每次查询结果都会追加保存")
+    parser.add_argument("--list-snapshots", action="store_true", help="列出快照库中最近的快照（给出查询时只列出该查询的快照）")
+    parser.add_argument("--from-snapshot", type=int, metavar="ID", help="用指定快照重新生成看板，不连接数据库")
+    parser.add_argument("--compare-snapshots", type=int, nargs=2, metavar=("OLD_ID", "NEW_ID"), help="比较两个快照的指标")
+    parser.add_argument("--history", action="store_true", help="输出该查询历次快照的指标趋势（只读快照库）")
+    parser.add_argument("--interactive", action="store_true",
+                        help="交互模式：复用同一个连接、表结构和计划缓存连续提问（支持 :sql / :explain / :export / :timings）")
+    parser.add_argument("--prefetch", action="store_true", default=None,
+                        help="交互模式中在后台预取最可能的追问（趋势、上一周期、下钻），默认按 db_config.json 的 prefetch.enabled")
+    parser.add_argument("--metrics-file", help="运行指标文件（Prometheus 文本格式），每次查询后覆盖写入")
+    parser.add_argument("--metrics-port", type=int, help="在本机该端口提供 /metrics 指标端点（交互模式下常驻）")
+    parser.add_argument("--slow-query-log", help="慢查询日志文件（JSON Lines）")
+    parser.add_argument("--slow-query-ms", type=float, help="慢查询阈值（毫秒，默认 1000）")
+    parser.add_argument("--profile", choices=PROFILE_MODES,
+                        help="剖析本次查询：cpu（cProfile，写出 .cpu.pstats）/ mem（tracemalloc，写出 .mem.json），报告在输出文件旁边")
 
     args = parser.parse_args()
+    monitoring = {
+        "metrics_file": args.metrics_file,
+        "metrics_port": args.metrics_port,
+        "slow_query_log": args.slow_query_log,
+        "slow_query_ms": args.slow_query_ms,
+    }
 
     if args.check_config:
         print("🧪 开始检查数据库配置与实体配置")
@@ -597,12 +931,53 @@ def main():
 
         return
 
+    if args.list_snapshots or args.from_snapshot is not None or args.compare_snapshots or args.history:
+        _run_snapshot_command(args)
+        return
+
+    if args.interactive:
+        from interactive_session import InteractiveSession
+
+        generator = SmartDashboardGenerator(args.db_config, keep_connection=True, plan_cache_file=args.plan_cache,
+                                            fan_out=args.fan_out, snapshot_file=args.snapshot_store,
+                                            monitoring=monitoring, prefetch=args.prefetch)
+        InteractiveSession(generator).run()
+        return
+
     if not args.query:
         parser.print_help()
         return
 
     user_query = " ".join(args.query)
-    generator = SmartDashboardGenerator(args.db_config)
+    generator = SmartDashboardGenerator(args.db_config, plan_cache_file=args.plan_cache, fan_out=args.fan_out,
+                                        snapshot_file=args.snapshot_store, monitoring=monitoring)
+
+    if args.profile:
+        from query_profiler import default_report_base
+
+        report_base = os.path.splitext(args.output)[0] if args.output else default_report_base(user_query)
+        with generator.profiled(args.profile, report_base) as profiler:
+            _run_query_command(generator, args, user_query, profiler)
+    else:
+        _run_query_command(generator, args, user_query)
+
+
+def _run_query_command(generator: SmartDashboardGenerator, args, user_query: str,
+                       profiler: "QueryProfiler | None" = None):
+    """按 --mode 执行一次查询（sql / 导出 / json / dashboard）"""
+    def _ask_yes_no(prompt: str) -> bool:
+        # 等待用户输入的时间不计入 CPU 剖析
+        with profiler.paused() if profiler is not None else nullcontext():
+            try:
+                answer = input(prompt).strip().lower()
+            except EOFError:
+                return False
+        return answer in ("y", "yes", "是", "好", "ok")
+
+    def _create_dashboard(result: Dict[str, Any]):
+        output_file = generator.create_dashboard(user_query, output_file=args.output, query_result=result)
+        if profiler is not None and output_file and not args.output:
+            profiler.report_base = os.path.splitext(output_file)[0]
 
     if args.mode == "sql":
         plan = generator.parser.parse_query(user_query)
@@ -610,82 +985,41 @@ def main():
             print(f"❌ 解析失败: {plan.get('error', '未知错误')}")
             return
         print("📋 匹配到表:", plan.get("primary_table"))
+        if plan.get("from_cache"):
+            print("⚡ 命中查询计划缓存")
         print("📌 生成的SQL:")
         print(plan.get("sql_query"))
         return
 
+    if args.mode in EXPORT_MODES:
+        result = generator.export_query(user_query, args.mode, output_file=args.output)
+        if not result.get("success"):
+            print(f"❌ {result.get('error', '导出失败')}")
+            return
+        print("📌 生成的SQL:")
+        print(result["sql_query"])
+        print(f"✅ 已导出 {result['row_count']} 行（{result['batches']} 批，耗时 {result['elapsed']}s）: {result['path']}")
+        return
+
     if args.mode == "json":
         result = generator.process_query(user_query)
         # JSON 模式：处理 datetime 等不可直接序列化的类型
-        class _ResultEncoder(json.JSONEncoder):
-            def default(self, obj):
-                if hasattr(obj, "strftime"):
-                    return obj.strftime("%Y-%m-%d %H:%M:%S")
-                if hasattr(obj, "float"):
-                    return float(obj)
-                return super().default(obj)
-
-        print(json.dumps(result, ensure_ascii=False, indent=2, cls=_ResultEncoder))
+        print(json.dumps(result, ensure_ascii=False, indent=2, cls=ResultJSONEncoder))
         return
 
     # dashboard 模式：先查询出结果，再询问是否生成 HTML 看板
     result = generator.process_query(user_query)
     if not result.get("success"):
         print(f"❌ 查询失败: {result.get('error', '未知错误')}")
-
-        def _ask_yes_no(prompt: str) -> bool:
-            try:
-                answer = input(prompt).strip().lower()
-            except EOFError:
-                return False
-            return answer in ("y", "yes", "是", "好", "ok")
-
         if _ask_yes_no("是否生成错误HTML看板用于排查？(y/n): "):
-            generator.create_dashboard(user_query, output_file=args.output, query_result=result)
+            _create_dashboard(result)
         return
 
     # 查询成功时，先给出简要信息和SQL，再征询是否导出HTML
-    plan = result.get("query_plan") or {}
-    print("📋 匹配到表:", plan.get("primary_table"))
-    print("📌 生成的SQL:")
-    print(result.get("sql_query", ""))
-    row_count = result.get("row_count", 0)
-    print("📊 结果行数:", row_count)
-
-    # 直接输出用户所需的内容（数据预览），控制台最多展示前 50 行
-    data = result.get("data") or []
-    columns = result.get("columns") or []
-    if data and columns:
-        max_rows = 50
-        print(f"📄 数据预览（最多显示前 {max_rows} 行）：")
-        header = " | ".join(columns)
-        print(header)
-        print("-" * len(header))
-
-        for idx, row in enumerate(data):
-            if idx >= max_rows:
-                if row_count > max_rows:
-                    print(f"...（其余 {row_count - max_rows} 行已省略）")
-                break
-
-            # row 为 dict（cursor(dictionary=True) 返回）
-            values = []
-            for col in columns:
-                val = row.get(col)
-                if hasattr(val, "strftime"):
-                    val = val.strftime("%Y-%m-%d %H:%M:%S")
-                values.append("" if val is None else str(val))
-            print(" | ".join(values))
-
-    def _ask_yes_no(prompt: str) -> bool:
-        try:
-            answer = input(prompt).strip().lower()
-        except EOFError:
-            return False
-        return answer in ("y", "yes", "是", "好", "ok")
+    _print_result_summary(result)
 
     if _ask_yes_no("是否生成 HTML 数据看板？(y/n): "):
-        generator.create_dashboard(user_query, output_file=args.output, query_result=result)
+        _create_dashboard(result)
     else:
         print("已跳过 HTML 看板生成。")
 
@@ -4,27 +4,133 @@
 支持自动发现表结构、智能匹配用户查询、生成SQL并执行
 """
 
-try:
-    import mysql.connector
-except ImportError:
-    print("❌ 需要安装mysql-connector-python: pip install mysql-connector-python")
-    exit(1)
-
 import json
 import os
 import re
-from typing import Dict, List, Any, Optional, Tuple
-from datetime import datetime
-from difflib import SequenceMatcher
+import time
+import threading
+import weakref
+from typing import Dict, Iterator, List, Any, Optional, Tuple
+from datetime import datetime, date
+from single_flight import SingleFlight, SingleFlightTimeout, normalize_sql
+from query_guard import QueryGuard
+from replica_router import ReplicaRouter, CONNECTION_ERRNOS
+from shard_pruner import detect_shard_families, parse_shard_name
+from table_index import TableIndex
+from result_rows import ResultRows
+from lazy_import import require_module
+import monitoring
+import query_deadline
+from query_deadline import Deadline, QueryWatchdog, TIMEOUT_ERRNOS, add_max_execution_time
+import prepared_statements
+from prepared_statements import StatementCache, UNKNOWN_STATEMENT_ERRNOS, UNSUPPORTED_ERRNOS
+from monitoring import (
+    REGISTRY, DB_QUERIES, DB_QUERY_SECONDS, DB_ROWS_FETCHED, DB_ROWS_PER_QUERY, DB_SHARED_RESULTS,
+    DB_GUARD_DECISIONS, DB_PREPARED_STATEMENTS, PREFETCH_HITS
+)
+
+# db_config.json 中不属于 mysql.connector.connect() 参数的扩展配置项
+EXTENSION_CONFIG_KEYS = {"query_guard", "replicas", "routing", "fan_out", "name", "monitoring", "query_timeout",
+                         "prepared_statements", "prefetch"}
+
+MYSQL_INSTALL_HINT = "需要安装mysql-connector-python: pip install mysql-connector-python"
+
+# use_driver() 替换的驱动，为 None 时使用 mysql.connector
+_driver_override = None
+
+
+def _driver():
+    """MySQL 驱动（第一次建立连接时才导入：命中计划缓存的 --mode sql、配置检查等不访问数据库的路径不加载）
+
+    未安装时抛出 MissingDependencyError，由命令行入口打印安装提示。
+    """
+    return _driver_override or require_module("mysql.connector", MYSQL_INSTALL_HINT)
+
+
+def _mysql_connect(**params):
+    return _driver().connect(**params)
+
+
+def use_driver(connector):
+    """替换 MySQL 驱动（需提供 connect() 和带 errno 的 Error，如负载测试的录制/回放替身数据库）
+
+    对之后建立的所有连接生效（包括只读副本和多库并行查询的实例）。
+    """
+    global _driver_override
+    _driver_override = connector
+
 
 class SmartDBConnector:
-    def __init__(self, config_file: str = "db_config.json"):
-        """初始化智能数据库连接器"""
+    def __init__(self, config_file: str = "db_config.json", config: Optional[Dict[str, Any]] = None):
+        """初始化智能数据库连接器
+
+        config 直接给出配置时不再读取 config_file（多库并行查询中的其他实例使用）。
+        """
         self.config_file = config_file
         self.connection = None
-        self.config = self._load_config()
+        self.config = config if config is not None else self._load_config()
         self.table_cache = {}
         self.table_keywords = {}
+        # 表/列注释（information_schema）和基于注释 + 实体配置的中文匹配索引（按需构建）
+        self.comments: Optional[Dict[str, Any]] = None
+        self.table_index: Optional[TableIndex] = None
+        self.entity_terms: Dict[str, str] = {}
+        self.column_aliases: Dict[str, List[str]] = {}
+        # 外键 / 索引 / 行数估算（联表规划使用，按需从 information_schema 加载）
+        self.foreign_keys: Optional[List[Dict[str, str]]] = None
+        self.index_cache: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.table_rows_cache: Dict[str, int] = {}
+        # 分表族（yt_xxx_YYYYMM）和分区信息
+        self.shard_families: Optional[Dict[str, List[Dict[str, Any]]]] = None
+        self.partition_cache: Dict[str, List[Dict[str, Any]]] = {}
+        # 低基数列的取值字典 {表名: {列名: {...}}}（由 ValueDictionary 在后台构建，随表结构缓存一起失效）
+        self.column_values: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._server_date: Optional[date] = None
+        self._server_date_checked_at = 0.0
+        # 表结构版本（用于计划缓存失效），按 schema_version_ttl 秒刷新一次
+        self.schema_version_ttl = 60
+        self._schema_version: Optional[str] = None
+        self._schema_version_checked_at = 0.0
+        # 并发的相同只读查询共享一次执行；连接本身不是线程安全的，执行时串行使用
+        self.single_flight = SingleFlight()
+        self.single_flight_timeout = 60.0
+        self._connection_lock = threading.RLock()
+        # 查询截止时间：MAX_EXECUTION_TIME 提示 + 客户端看门狗（超时或取消时在旁路连接上 KILL QUERY）
+        self.query_timeout = query_deadline.timeout_config(
+            self.config.get("query_timeout") if isinstance(self.config, dict) else None
+        )
+        # 带参数的 SELECT 走服务器端预处理语句，每个连接按模板缓存（连接释放后随之丢弃）
+        self.prepared_config = dict(prepared_statements.DEFAULT_PREPARED_CONFIG)
+        if isinstance(self.config, dict) and isinstance(self.config.get("prepared_statements"), dict):
+            self.prepared_config.update(self.config["prepared_statements"])
+        self._statement_caches: "weakref.WeakKeyDictionary[Any, StatementCache]" = weakref.WeakKeyDictionary()
+        self._statement_caches_lock = threading.Lock()
+        # 预取的追问结果（由 Prefetcher 写入，见 enable_result_cache），前台查询命中时直接返回；
+        # 正在执行的前台查询数供预取器让路
+        self.result_cache = None
+        self.active_queries = 0
+        self._active_lock = threading.Lock()
+        # 执行前成本检查（EXPLAIN），阈值来自 db_config.json 的 query_guard
+        self.query_guard = QueryGuard(self.config.get("query_guard") if isinstance(self.config, dict) else None)
+        # 只读副本路由：SELECT 优先发往副本，写入和元数据查询（SHOW/DESCRIBE/information_schema）留在主库
+        replicas = self.config.get("replicas") if isinstance(self.config, dict) else None
+        self.router = ReplicaRouter(
+            self._connection_params() if isinstance(self.config, dict) else {},
+            replicas if isinstance(replicas, list) else [],
+            _mysql_connect,
+            self.config.get("routing") if isinstance(self.config, dict) else None,
+        )
+        # 抓取指标时读取副本连接池占用
+        REGISTRY.add_collector(self._collect_metrics)
+
+    def enable_result_cache(self):
+        """创建预取结果缓存（容量和有效期来自 db_config.json 的 prefetch）并返回；不预取的进程不导入 prefetch"""
+        if self.result_cache is None:
+            from prefetch import ResultCache, prefetch_config
+
+            settings = prefetch_config(self.config.get("prefetch") if isinstance(self.config, dict) else None)
+            self.result_cache = ResultCache(settings["max_entries"], settings["ttl_seconds"])
+        return self.result_cache
 
     def validate_config(self) -> Dict[str, Any]:
         required_fields = {
@@ -60,6 +166,23 @@ class SmartDBConnector:
         if "charset" in self.config and self.config["charset"].lower() not in {"utf8", "utf8mb4"}:
             warnings.append(f"字符集为 {self.config['charset']}, 建议使用 utf8mb4")
 
+        if "query_guard" in self.config:
+            errors.extend(QueryGuard.validate(self.config["query_guard"]))
+        if "replicas" in self.config:
+            errors.extend(ReplicaRouter.validate(self.config["replicas"]))
+        if "fan_out" in self.config:
+            from fan_out import FanOutExecutor
+            errors.extend(FanOutExecutor.validate(self.config["fan_out"]))
+        if "monitoring" in self.config:
+            errors.extend(monitoring.validate(self.config["monitoring"]))
+        if "query_timeout" in self.config:
+            errors.extend(query_deadline.validate(self.config["query_timeout"]))
+        if "prepared_statements" in self.config:
+            errors.extend(prepared_statements.validate(self.config["prepared_statements"]))
+        if "prefetch" in self.config:
+            import prefetch
+            errors.extend(prefetch.validate(self.config["prefetch"]))
+
         return {"ok": not errors, "errors": errors, "warnings": warnings, "config": self.config}
     
     def _load_config(self) -> Dict[str, Any]:
@@ -82,93 +205,131 @@ class SmartDBConnector:
             print("请编辑配置文件中的数据库连接信息后重新运行")
             return default_config
     
-    def connect(self) -> bool:
-        """建立数据库连接"""
+    def _connection_params(self) -> Dict[str, Any]:
+        """提取 mysql.connector.connect() 的连接参数（去掉注释字段和扩展配置项）"""
+        return {
+            k: v for k, v in self.config.items()
+            if not k.startswith('_') and k not in EXTENSION_CONFIG_KEYS
+        }
+
+    def connect(self, verbose: bool = True) -> bool:
+        """建立数据库连接（verbose=False 时成功不打印，后台线程使用）"""
         try:
-            self.connection = mysql.connector.connect(**self.config)
+            self.connection = _mysql_connect(**self._connection_params())
             if self.connection.is_connected():
-                print(f"✅ 成功连接到MySQL数据库: {self.config['database']}")
+                if verbose:
+                    print(f"✅ 成功连接到MySQL数据库: {self.config['database']}")
                 return True
-        except mysql.connector.Error as e:
+        except _driver().Error as e:
             print(f"❌ 数据库连接失败: {e}")
             return False
         return False
     
     def disconnect(self):
-        """关闭数据库连接"""
-        if self.connection and self.connection.is_connected():
-            self.connection.close()
-            print("🔌 数据库连接已关闭")
-    
+        """关闭数据库连接（包括副本连接池）；等待后台线程（取值字典构建等）用完主连接"""
+        self.router.close_all()
+        with self._connection_lock:
+            if self.connection and self.connection.is_connected():
+                self.connection.close()
+                print("🔌 数据库连接已关闭")
+
+    def _collect_metrics(self) -> List[tuple]:
+        """运行指标采集：主连接状态和各副本连接池占用（抓取时调用）"""
+        database = self.config.get("name") or self.config.get("database") or ""
+        connected = self.connection is not None and self.connection.is_connected()
+        pool_samples, outstanding_samples = [], []
+        for endpoint in self.router.replicas:
+            pool = endpoint.pool.stats()
+            labels = {"database": database, "endpoint": endpoint.name}
+            pool_samples.append((dict(labels, state="idle"), pool["idle"]))
+            pool_samples.append((dict(labels, state="in_use"), pool["created"] - pool["idle"]))
+            pool_samples.append((dict(labels, state="max"), pool["size"]))
+            outstanding_samples.append((labels, endpoint.outstanding))
+        return [
+            ("smart_db_primary_connected", "gauge", "主库连接是否已建立（1/0）",
+             [({"database": database}, int(connected))]),
+            ("smart_db_pool_connections", "gauge", "副本连接池连接数（state: idle / in_use / max）", pool_samples),
+            ("smart_db_endpoint_outstanding", "gauge", "副本上正在执行的查询数", outstanding_samples),
+            ("smart_db_prepared_statements", "gauge", "各连接上缓存的预处理语句总数",
+             [({"database": database}, sum(len(cache) for cache in list(self._statement_caches.values())))]),
+        ]
+
     def discover_tables(self) -> Dict[str, Dict[str, Any]]:
         """发现数据库中的所有表及其结构"""
-        if not self.connection or not self.connection.is_connected():
-            if not self.connect():
-                return {}
-        
-        cursor = None
-        try:
-            cursor = self.connection.cursor(dictionary=True)
-            
-            # 获取所有表名
-            cursor.execute("SHOW TABLES")
-            tables = cursor.fetchall()
-            table_names = [list(row.values())[0] for row in tables]
-            
-            table_info = {}
-            
-            for table_name in table_names:
-                # 获取表结构
-                cursor.execute(f"DESCRIBE {table_name}")
-                columns = cursor.fetchall()
-                
-                # 处理列信息
-                column_names = []
-                primary_keys = []
-                
-                for col in columns:
-                    try:
-                        field_name = col['Field']
-                        key_type = col['Key']
-                        column_names.append(field_name)
-                        if key_type == 'PRI':
-                            primary_keys.append(field_name)
-                    except (KeyError, TypeError):
-                        # 如果字典访问失败，使用索引方式
-                        field_name = col[0]
-                        key_type = col[3] if len(col) > 3 else ''
-                        column_names.append(field_name)
-                        if key_type == 'PRI':
-                            primary_keys.append(field_name)
-                
-                table_info[table_name] = {
-                    'columns': columns,
-                    'column_names': column_names,
-                    'primary_keys': primary_keys,
-                    'foreign_keys': [],  # 可以进一步扩展获取外键信息
-                }
-            
-            # 缓存表信息
-            self.table_cache = table_info
-            
-            # 生成表关键词
-            self._generate_table_keywords()
-            
-            cursor.close()
-            print(f"📋 发现 {len(table_names)} 个表: {', '.join(table_names)}")
-            return table_info
-            
-        except mysql.connector.Error as e:
-            print(f"❌ 发现表失败: {e}")
-            if cursor:
+        with self._connection_lock:
+            if not self.connection or not self.connection.is_connected():
+                if not self.connect():
+                    return {}
+
+            cursor = None
+            try:
+                cursor = self.connection.cursor(dictionary=True)
+
+                # 获取所有表名
+                cursor.execute("SHOW TABLES")
+                tables = cursor.fetchall()
+                table_names = [list(row.values())[0] for row in tables]
+
+                table_info = {}
+
+                for table_name in table_names:
+                    # 获取表结构
+                    cursor.execute(f"DESCRIBE {table_name}")
+                    columns = cursor.fetchall()
+
+                    # 处理列信息
+                    column_names = []
+                    primary_keys = []
+
+                    for col in columns:
+                        try:
+                            field_name = col['Field']
+                            key_type = col['Key']
+                            column_names.append(field_name)
+                            if key_type == 'PRI':
+                                primary_keys.append(field_name)
+                        except (KeyError, TypeError):
+                            # 如果字典访问失败，使用索引方式
+                            field_name = col[0]
+                            key_type = col[3] if len(col) > 3 else ''
+                            column_names.append(field_name)
+                            if key_type == 'PRI':
+                                primary_keys.append(field_name)
+
+                    table_info[table_name] = {
+                        'columns': columns,
+                        'column_names': column_names,
+                        'primary_keys': primary_keys,
+                        'foreign_keys': [],  # 可以进一步扩展获取外键信息
+                    }
+
+                # 缓存表信息
+                self.table_cache = table_info
+
+                # 生成表关键词
+                self._generate_table_keywords()
+
                 cursor.close()
-            return {}
+                print(f"📋 发现 {len(table_names)} 个表: {', '.join(table_names)}")
+                return table_info
+
+            except _driver().Error as e:
+                print(f"❌ 发现表失败: {e}")
+                if cursor:
+                    cursor.close()
+                return {}
     
     def _generate_table_keywords(self):
-        """为每个表生成关键词映射（完全基于表结构，不依赖硬编码）"""
+        """为每个表生成关键词映射（完全基于表结构，不依赖硬编码）
+
+        分表族（xxx_202609、xxx_202610…）合并为一个逻辑表 xxx 参与匹配，使用最新分表的列。
+        """
         table_keyword_map = {}
+        self.shard_families = detect_shard_families(list(self.table_cache.keys()))
+        self.table_index = None
 
-        for table_name, info in self.table_cache.items():
+        for table_name, source in self._logical_tables().items():
+            info = self.table_cache[source]
             keywords = set()
 
             # 表名本身（各种形式）
@@ -194,9 +355,76 @@ class SmartDBConnector:
             table_keyword_map[table_name] = list(keywords)
 
         self.table_keywords = table_keyword_map
-    
+
+    def _logical_tables(self) -> Dict[str, str]:
+        """参与匹配的逻辑表 {逻辑表名: 提供表结构的物理表名}（分表族合并为一个逻辑表，使用最新分表）"""
+        families = self.shard_families or {}
+        logical_tables = {}
+        for table_name in self.table_cache:
+            parsed = parse_shard_name(table_name)
+            if parsed and parsed[0] in families:
+                logical_tables[parsed[0]] = families[parsed[0]][-1]["table"]
+            else:
+                logical_tables[table_name] = table_name
+        return logical_tables
+
+    def get_comments(self) -> Dict[str, Any]:
+        """读取当前库的表注释和列注释（结果缓存，表结构版本变化时清空）
+
+        返回 {"tables": {表名: 注释}, "columns": {表名: {列名: 注释}}}，只包含非空注释。
+        """
+        if self.comments is None:
+            database = self.config.get("database")
+            tables = {
+                row["TABLE_NAME"]: row["TABLE_COMMENT"]
+                for row in self._query_metadata(
+                    "SELECT TABLE_NAME, TABLE_COMMENT FROM information_schema.TABLES "
+                    "WHERE TABLE_SCHEMA = %s AND TABLE_COMMENT <> ''",
+                    (database,),
+                )
+            }
+            columns: Dict[str, Dict[str, str]] = {}
+            for row in self._query_metadata(
+                "SELECT TABLE_NAME, COLUMN_NAME, COLUMN_COMMENT FROM information_schema.COLUMNS "
+                "WHERE TABLE_SCHEMA = %s AND COLUMN_COMMENT <> ''",
+                (database,),
+            ):
+                columns.setdefault(row["TABLE_NAME"], {})[row["COLUMN_NAME"]] = row["COLUMN_COMMENT"]
+            self.comments = {"tables": tables, "columns": columns}
+        return self.comments
+
+    def set_entity_terms(self, entity_terms: Dict[str, str], column_aliases: Dict[str, List[str]]):
+        """设置实体配置中的中文词汇（实体名/表别名 → 表、字段别名），加入表匹配索引的词典和文档"""
+        if entity_terms != self.entity_terms or column_aliases != self.column_aliases:
+            self.entity_terms = entity_terms
+            self.column_aliases = column_aliases
+            self.table_index = None
+
+    def _get_table_index(self) -> TableIndex:
+        if self.table_index is None:
+            comments = self.get_comments()
+            logical_tables = self._logical_tables()
+            self.table_index = TableIndex.build(
+                {table: self.table_cache[source]['column_names'] for table, source in logical_tables.items()},
+                table_comments={
+                    table: comments["tables"][source]
+                    for table, source in logical_tables.items() if source in comments["tables"]
+                },
+                column_comments={
+                    table: comments["columns"][source]
+                    for table, source in logical_tables.items() if source in comments["columns"]
+                },
+                entity_terms=self.entity_terms,
+                column_aliases=self.column_aliases,
+            )
+        return self.table_index
+
     def match_tables(self, user_query: str) -> List[Tuple[str, float]]:
-        """根据用户查询匹配相关的表"""
+        """根据用户查询匹配相关的表
+
+        用表名、列名、表/列注释和实体配置建立的索引按 BM25 打分（分数 0~1，中文按词典最大匹配 + 二元组切分）；
+        一个词项都没有命中时，再对查询中的英文单词做模糊匹配（容忍拼写差异）。
+        """
         # 懒加载：只有在需要匹配时才去发现所有表并构建关键词
         if not self.table_cache:
             self.discover_tables()
@@ -204,16 +432,16 @@ class SmartDBConnector:
         if not self.table_keywords:
             return []
 
-        user_query_lower = user_query.lower()
-        # 支持中文分词：每个中文字符单独分词，英文单词保持完整
-        user_words = set()
-        # 匹配连续的中文字符（每个单独作为一个词）
-        for char in user_query_lower:
-            if '\u4e00' <= char <= '\u9fff':
-                user_words.add(char)
-        # 匹配英文单词、数字、下划线
-        user_words.update(re.findall(r'[a-zA-Z0-9_]+', user_query_lower))
-        
+        table_scores = self._get_table_index().search(user_query)
+        if table_scores:
+            return table_scores
+
+        user_words = {word for word in re.findall(r'[a-z0-9_]+', user_query.lower()) if len(word) > 2}
+        if not user_words:
+            return []
+
+        from difflib import SequenceMatcher
+
         table_scores = []
         
         for table_name, keywords in self.table_keywords.items():
@@ -233,78 +461,419 @@ class SmartDBConnector:
                         score += similarity * 0.4
             
             if score > 0:
-                table_scores.append((table_name, score))
+                table_scores.append((table_name, min(score, 1.0)))
         
         # 按分数排序
         table_scores.sort(key=lambda x: x[1], reverse=True)
         return table_scores
     
+    def get_shard_families(self) -> Dict[str, List[Dict[str, Any]]]:
+        """获取分表族 {逻辑表名: [{"table", "start", "end"}, ...]}（按表名模式识别，结果缓存）"""
+        if self.shard_families is None:
+            if self.table_cache:
+                table_names = list(self.table_cache.keys())
+            else:
+                table_names = [list(row.values())[0] for row in self._query_metadata("SHOW TABLES")]
+            self.shard_families = detect_shard_families(table_names)
+        return self.shard_families
+
+    def get_server_date(self) -> date:
+        """数据库服务器的当前日期（与 SQL 中 CURDATE() 一致），一分钟内复用；无法连接时使用本地日期"""
+        now = time.time()
+        if self._server_date is None or now - self._server_date_checked_at >= 60:
+            rows = self._query_metadata("SELECT CURDATE() AS today")
+            value = rows[0]["today"] if rows else None
+            if isinstance(value, str):
+                value = date.fromisoformat(value[:10])
+            self._server_date = value if isinstance(value, date) else date.today()
+            self._server_date_checked_at = now
+        return self._server_date
+
+    def get_partitions(self, table_name: str) -> List[Dict[str, Any]]:
+        """获取表的分区定义（information_schema.PARTITIONS），未分区的表返回空列表"""
+        if table_name not in self.partition_cache:
+            rows = self._query_metadata(
+                "SELECT PARTITION_NAME, PARTITION_ORDINAL_POSITION, PARTITION_METHOD, "
+                "PARTITION_EXPRESSION, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS "
+                "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL "
+                "ORDER BY PARTITION_ORDINAL_POSITION",
+                (self.config.get("database"), table_name),
+            )
+            self.partition_cache[table_name] = [
+                {
+                    "name": row["PARTITION_NAME"],
+                    "ordinal": row["PARTITION_ORDINAL_POSITION"],
+                    "method": row["PARTITION_METHOD"],
+                    "expression": row["PARTITION_EXPRESSION"],
+                    "description": row["PARTITION_DESCRIPTION"],
+                }
+                for row in rows
+            ]
+        return self.partition_cache[table_name]
+
+    def _shard_family_structure(self, logical_table: str) -> Dict[str, Any]:
+        """分表族的逻辑表结构：取最新分表的结构，并附带全部分表列表"""
+        shards = self.get_shard_families()[logical_table]
+        info = dict(self.get_table_structure(shards[-1]["table"]))
+        if not info:
+            return {}
+        info['shards'] = [s["table"] for s in shards]
+        self.table_cache[logical_table] = info
+        return info
+
     def get_table_structure(self, table_name: str) -> Dict[str, Any]:
-        """获取指定表的结构信息"""
+        """获取指定表的结构信息（分表族的逻辑表名返回最新分表的结构）"""
         if table_name in self.table_cache:
             return self.table_cache[table_name]
+        if self.shard_families and table_name in self.shard_families:
+            return self._shard_family_structure(table_name)
         
-        # 如果缓存中没有，实时获取
-        if not self.connection or not self.connection.is_connected():
-            if not self.connect():
+        # 如果缓存中没有，实时获取（列值字典会在后台线程读取表结构，连接需要串行使用）
+        with self._connection_lock:
+            if not self.connection or not self.connection.is_connected():
+                if not self.connect():
+                    return {}
+
+            cursor = None
+            try:
+                cursor = self.connection.cursor(dictionary=True)
+                cursor.execute(f"DESCRIBE {table_name}")
+                columns = cursor.fetchall()
+                cursor.close()
+
+                # 处理列信息
+                column_names = []
+                primary_keys = []
+
+                for col in columns:
+                    try:
+                        field_name = col['Field']
+                        key_type = col['Key']
+                        column_names.append(field_name)
+                        if key_type == 'PRI':
+                            primary_keys.append(field_name)
+                    except (KeyError, TypeError):
+                        field_name = col[0]
+                        key_type = col[3] if len(col) > 3 else ''
+                        column_names.append(field_name)
+                        if key_type == 'PRI':
+                            primary_keys.append(field_name)
+
+                info = {
+                    'columns': columns,
+                    'column_names': column_names,
+                    'primary_keys': primary_keys,
+                }
+
+                self.table_cache[table_name] = info
+                return info
+
+            except _driver().Error as e:
+                if cursor:
+                    cursor.close()
+                # 表不存在时，可能是分表族的逻辑表名（只有 xxx_202609 这样的物理表）
+                if self.shard_families is None and table_name in self.get_shard_families():
+                    return self._shard_family_structure(table_name)
+                print(f"❌ 获取表结构失败: {e}")
                 return {}
-        
-        cursor = None
+    
+    def execute_query(self, query: str, params: Optional[tuple] = None, timeout: Optional[float] = None,
+                      cancel_event: Optional[threading.Event] = None) -> Dict[str, Any]:
+        """执行SQL查询
+
+        只读查询（SELECT/SHOW/DESCRIBE/EXPLAIN）经过单飞去重：并发的相同SQL只执行一次，
+        其余调用等待并共享结果（结果中 single_flight 为 "shared"）。
+        开启 query_guard 时，SELECT 执行前先做成本检查，决策记录在结果的 guard 字段中。
+        timeout 为截止时间（秒，默认 query_timeout.seconds，0 不限时）；cancel_event 被设置时立即取消查询。
+        超时或取消时服务器上的查询会被 KILL QUERY，已读到部分行时返回部分结果（partial 为 True），
+        否则返回失败结果；两种情况下 timeout 字段都记录原因（timeout / cancelled）。
+        预取过的只读查询直接返回缓存的结果（result_cache 为 "prefetched"）。
+        执行次数、耗时和返回行数计入运行指标（monitoring）。
+        """
+        started = time.perf_counter()
+        deadline = Deadline(self.query_timeout["seconds"] if timeout is None else timeout, cancel_event)
+        with self._active_lock:
+            self.active_queries += 1
         try:
-            cursor = self.connection.cursor(dictionary=True)
-            cursor.execute(f"DESCRIBE {table_name}")
-            columns = cursor.fetchall()
-            cursor.close()
-            
-            # 处理列信息
-            column_names = []
-            primary_keys = []
-            
-            for col in columns:
-                try:
-                    field_name = col['Field']
-                    key_type = col['Key']
-                    column_names.append(field_name)
-                    if key_type == 'PRI':
-                        primary_keys.append(field_name)
-                except (KeyError, TypeError):
-                    field_name = col[0]
-                    key_type = col[3] if len(col) > 3 else ''
-                    column_names.append(field_name)
-                    if key_type == 'PRI':
-                        primary_keys.append(field_name)
-            
-            info = {
-                'columns': columns,
-                'column_names': column_names,
-                'primary_keys': primary_keys,
+            result = self._execute_query(query, params, deadline)
+        finally:
+            with self._active_lock:
+                self.active_queries -= 1
+        DB_QUERY_SECONDS.observe(time.perf_counter() - started)
+        if result.get("success"):
+            DB_QUERIES.inc(status="partial" if result.get("partial") and result.get("timeout") else "success")
+            if result.get("result_cache"):
+                PREFETCH_HITS.inc()
+            elif result.get("single_flight") == "shared":
+                DB_SHARED_RESULTS.inc()
+            else:
+                rows = result.get("row_count") or 0
+                DB_ROWS_FETCHED.inc(rows)
+                DB_ROWS_PER_QUERY.observe(rows)
+        else:
+            rejected = (result.get("guard") or {}).get("decision") == "reject"
+            DB_QUERIES.inc(status="rejected" if rejected else "timeout" if result.get("timeout") else "error")
+        return result
+
+    def _execute_query(self, query: str, params: Optional[tuple], deadline: Deadline) -> Dict[str, Any]:
+        if not self._is_read_query(query):
+            return self._execute_query_direct(query, params, deadline)
+
+        key = normalize_sql(query, params)
+        wait = self.single_flight_timeout
+        if deadline.remaining() is not None:
+            wait = min(wait, deadline.remaining() + self.query_timeout["kill_grace_seconds"])
+        cached = self.result_cache.lookup(key, wait) if self.result_cache is not None else None
+        if cached is not None:
+            result = dict(cached)
+            result["result_cache"] = "prefetched"
+            return result
+        try:
+            result, shared = self.single_flight.do(
+                key, lambda: self._execute_guarded(query, params, deadline), timeout=wait
+            )
+        except SingleFlightTimeout:
+            if deadline.expired():
+                return self._timeout_result(query, deadline, "timeout")
+            return {
+                "success": False,
+                "error": f"等待相同查询的执行结果超时（{self.single_flight_timeout}秒）",
+                "query": query,
+                "timestamp": datetime.now().isoformat()
             }
-            
-            self.table_cache[table_name] = info
-            return info
-            
-        except mysql.connector.Error as e:
-            print(f"❌ 获取表结构失败: {e}")
-            if cursor:
-                cursor.close()
-            return {}
-    
-    def execute_query(self, query: str, params: Optional[tuple] = None) -> Dict[str, Any]:
-        """执行SQL查询"""
-        if not self.connection or not self.connection.is_connected():
-            if not self.connect():
-                return {"success": False, "error": "无法连接到数据库"}
-        
+
+        if shared:
+            result = dict(result)
+            result["single_flight"] = "shared"
+        return result
+
+    @staticmethod
+    def _is_read_query(query: str) -> bool:
+        head = (query or "").lstrip().split(None, 1)
+        return bool(head) and head[0].upper() in {"SELECT", "SHOW", "DESCRIBE", "DESC", "EXPLAIN", "WITH"}
+
+    def _execute_guarded(self, query: str, params: Optional[tuple], deadline: Deadline) -> Dict[str, Any]:
+        """先 EXPLAIN 估算成本，再按守卫决策放行、加提示、降级或拒绝"""
+        if not self.query_guard.enabled or not query.lstrip().upper().startswith("SELECT"):
+            return self._execute_routed(query, params, deadline=deadline)
+
+        explain = self._explain(query, params)
+        if explain is None:
+            result = self._execute_routed(query, params, deadline=deadline)
+            if result.get("success"):
+                result["guard"] = {"decision": "unchecked", "reason": "EXPLAIN 失败，未做成本检查"}
+            DB_GUARD_DECISIONS.inc(decision="unchecked")
+            return result
+
+        analysis = self.query_guard.analyze_explain(explain)
+        decision = self.query_guard.decide(analysis, has_replica=self.router.has_replicas)
+        guard_meta = {
+            "decision": decision["decision"],
+            "reason": decision["reason"],
+            "estimated_rows": analysis["estimated_rows"],
+            "query_cost": analysis["query_cost"],
+            "full_scan_tables": analysis["full_scan_tables"],
+            "indexes_used": analysis["indexes_used"],
+        }
+
+        executed_query = query
+        if decision["decision"] == "hint":
+            executed_query = self.query_guard.add_execution_time_hint(query)
+        elif decision["decision"] == "sample":
+            table_name = self.query_guard.primary_table(query)
+            primary_keys = self.get_table_structure(table_name).get("primary_keys", []) if table_name else []
+            sampled = self.query_guard.rewrite_sampled(
+                query, table_name, primary_keys, self.config.get("database")
+            ) if table_name else None
+            if sampled is None:
+                guard_meta["decision"] = "reject"
+                guard_meta["reason"] += "，且无法降级为采样查询（缺少主键）"
+            else:
+                executed_query = self.query_guard.add_execution_time_hint(sampled)
+                guard_meta["approximate"] = True
+        DB_GUARD_DECISIONS.inc(decision=guard_meta["decision"])
+
+        if guard_meta["decision"] == "reject":
+            return {
+                "success": False,
+                "error": f"查询被成本守卫拒绝: {guard_meta['reason']}",
+                "query": query,
+                "guard": guard_meta,
+                "timestamp": datetime.now().isoformat()
+            }
+
+        if executed_query != query:
+            guard_meta["executed_query"] = executed_query
+        result = self._execute_routed(executed_query, params, replica_only=guard_meta["decision"] == "replica",
+                                      deadline=deadline)
+        result["guard"] = guard_meta
+        return result
+
+    def _explain(self, query: str, params: Optional[tuple] = None) -> Optional[str]:
+        """运行 EXPLAIN FORMAT=JSON，失败时返回 None"""
+        with self._connection_lock:
+            if not self.connection or not self.connection.is_connected():
+                if not self.connect():
+                    return None
+            cursor = None
+            try:
+                cursor = self.connection.cursor()
+                cursor.execute(f"EXPLAIN FORMAT=JSON {query}", params or ())
+                row = cursor.fetchone()
+                return row[0] if row else None
+            except _driver().Error as e:
+                print(f"⚠️ EXPLAIN 失败，跳过成本检查: {e}")
+                return None
+            finally:
+                if cursor:
+                    cursor.close()
+
+    def explain_query(self, query: str, params: Optional[tuple] = None) -> Dict[str, Any]:
+        """EXPLAIN 查询并给出成本守卫的分析和决策（不执行查询本身，未开启 query_guard 时也会分析）"""
+        explain = self._explain(query, params)
+        if explain is None:
+            return {"success": False, "error": "EXPLAIN 失败", "query": query}
+        try:
+            analysis = self.query_guard.analyze_explain(explain)
+        except ValueError as e:
+            return {"success": False, "error": f"无法解析 EXPLAIN 输出: {e}", "query": query, "explain": explain}
+        return {
+            "success": True,
+            "query": query,
+            "explain": explain,
+            "analysis": analysis,
+            "decision": self.query_guard.decide(analysis, has_replica=self.router.has_replicas),
+        }
+
+    def _execute_routed(self, query: str, params: Optional[tuple] = None, replica_only: bool = False,
+                        deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """SELECT 按最少在途请求路由到副本，副本连接失败时换下一个，全部不可用时回退主库
+
+        replica_only=True（成本守卫要求转副本）且没有可用副本时，主库执行会加上执行时间上限。
+        """
+        head = (query or "").lstrip().split(None, 1)
+        if self.router.has_replicas and head and head[0].upper() in ("SELECT", "WITH"):
+            tried = set()
+            while True:
+                endpoint = self.router.pick(exclude=tried)
+                if endpoint is None:
+                    break
+                tried.add(endpoint.name)
+                try:
+                    conn = endpoint.pool.acquire()
+                except Exception as e:
+                    print(f"⚠️ 副本 {endpoint.name} 获取连接失败，尝试下一个: {e}")
+                    self.router.done(endpoint, failed=True)
+                    continue
+
+                try:
+                    result = self._execute_on_connection(query, params, connection=conn, deadline=deadline,
+                                                         kill_params=endpoint.params)
+                except BaseException:
+                    # Ctrl-C 等中断：连接状态未知，不放回连接池
+                    endpoint.pool.release(conn, broken=True)
+                    self.router.done(endpoint)
+                    raise
+                failed = not result["success"] and result.get("errno") in CONNECTION_ERRNOS
+                endpoint.pool.release(conn, broken=failed)
+                self.router.done(endpoint, failed=failed)
+                if failed:
+                    print(f"⚠️ 副本 {endpoint.name} 执行失败，故障转移: {result['error']}")
+                    continue
+                result["endpoint"] = endpoint.name
+                return result
+
+            if replica_only:
+                query = self.query_guard.add_execution_time_hint(query)
+
+        result = self._execute_query_direct(query, params, deadline)
+        result["endpoint"] = "primary"
+        return result
+
+    def _execute_query_direct(self, query: str, params: Optional[tuple] = None,
+                              deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """在主库连接上直接执行SQL"""
+        with self._connection_lock:
+            return self._execute_on_connection(query, params, deadline=deadline)
+
+    def _statement_cache(self, connection) -> StatementCache:
+        with self._statement_caches_lock:
+            cache = self._statement_caches.get(connection)
+            if cache is None:
+                cache = StatementCache(self.prepared_config["cache_size"])
+                self._statement_caches[connection] = cache
+            return cache
+
+    def _execute_on_connection(self, query: str, params: Optional[tuple] = None, connection=None,
+                               deadline: Optional[Deadline] = None,
+                               kill_params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """在指定连接上执行SQL；未指定时使用主库连接（必要时重连）
+
+        deadline 到期或被取消时，看门狗在旁路连接（kill_params，默认主库参数）上 KILL QUERY。
+        带参数的 SELECT / WITH 使用该连接上缓存的预处理语句（二进制协议）。
+        结果的 data 为 ResultRows（元组行 + 共享列索引），按行访问得到只读的 Row 视图。
+        """
+        if connection is None:
+            if not self.connection or not self.connection.is_connected():
+                if not self.connect():
+                    return {"success": False, "error": "无法连接到数据库"}
+            connection = self.connection
+
+        deadline = deadline or Deadline()
+        if deadline.expires_at is not None:
+            query = add_max_execution_time(query, deadline.hint_ms())
+        connection_id = getattr(connection, "connection_id", None)
+        watchdog = QueryWatchdog(
+            deadline, lambda: self._kill_query(connection_id, kill_params), self.query_timeout["kill_grace_seconds"]
+        ).start()
+
         cursor = None
+        statement_cache: Optional[StatementCache] = None
+        completed = False
+        columns: List[str] = []
+        results = ResultRows(columns)
         try:
-            cursor = self.connection.cursor(dictionary=True)
-            cursor.execute(query, params or ())
+            head = query.lstrip().split(None, 1)
+            if (params is not None and self.prepared_config["enabled"]
+                    and head and head[0].upper() in {"SELECT", "WITH"}):
+                statement_cache = self._statement_cache(connection)
+                statement, cursor, cached = statement_cache.get(connection, query)
+                DB_PREPARED_STATEMENTS.inc(result="hit" if cached else "miss")
+                try:
+                    cursor.execute(statement, params)
+                except _driver().Error as e:
+                    if getattr(e, "errno", None) not in UNKNOWN_STATEMENT_ERRNOS | UNSUPPORTED_ERRNOS:
+                        raise
+                    # 服务器端语句已失效（连接重连过）或语句不支持预处理：丢弃后这次改用文本协议
+                    statement_cache.discard(query)
+                    statement_cache = None
+                    cursor = connection.cursor()
+                    cursor.execute(query, params)
+            else:
+                cursor = connection.cursor()
+                cursor.execute(query, params or ())
             
             # 判断是否为查询语句
             if cursor.description:
-                results = cursor.fetchall()
                 columns = [desc[0] for desc in cursor.description]
+                results = ResultRows(columns)
+                # 分批读取，两批之间检查截止时间：结果传输过慢时保留已读取的行
+                batch_rows = self.query_timeout["fetch_batch_rows"]
+                while True:
+                    batch = cursor.fetchmany(batch_rows)
+                    if not batch:
+                        break
+                    results.extend(batch)
+                    if deadline.expired():
+                        watchdog.trigger("cancelled" if deadline.cancel_event is not None
+                                         and deadline.cancel_event.is_set() else "timeout")
+                        try:
+                            cursor.fetchall()
+                        except _driver().Error:
+                            pass
+                        return self._timeout_result(query, deadline, watchdog.reason, columns, results)
                 
+                completed = True
                 return {
                     "success": True,
                     "data": results,
@@ -315,7 +884,7 @@ class SmartDBConnector:
                 }
             else:
                 # 对于INSERT, UPDATE, DELETE语句
-                self.connection.commit()
+                connection.commit()
                 return {
                     "success": True,
                     "affected_rows": cursor.rowcount,
@@ -323,19 +892,306 @@ class SmartDBConnector:
                     "timestamp": datetime.now().isoformat()
                 }
                 
-        except mysql.connector.Error as e:
+        except KeyboardInterrupt:
+            # Ctrl-C：取消服务器上的查询；连接上可能还有未读完的结果，直接关闭，下次使用时重连
+            watchdog.trigger("interrupted")
+            cursor = None
+            if statement_cache is not None:
+                statement_cache.clear()
+                statement_cache = None
+            try:
+                connection.close()
+            except Exception:
+                pass
+            raise
+        except _driver().Error as e:
+            errno = getattr(e, "errno", None)
+            if watchdog.reason is not None or errno in TIMEOUT_ERRNOS:
+                return self._timeout_result(query, deadline, watchdog.reason or "timeout", columns, results, errno)
             return {
                 "success": False,
                 "error": str(e),
+                "errno": errno,
                 "query": query,
                 "timestamp": datetime.now().isoformat()
             }
         finally:
-            if cursor:
-                cursor.close()
+            watchdog.stop()
+            if statement_cache is not None:
+                # 预处理游标留在缓存中复用；出错或超时的语句丢弃，下次重新 PREPARE
+                if not completed:
+                    statement_cache.discard(query)
+            elif cursor:
+                try:
+                    cursor.close()
+                except _driver().Error:
+                    pass
+
+    @staticmethod
+    def _timeout_result(query: str, deadline: Deadline, reason: str, columns: Optional[List[str]] = None,
+                        rows: Optional[ResultRows] = None, errno: Optional[int] = None) -> Dict[str, Any]:
+        """超时/取消的结果：已读到部分行时返回部分结果，否则返回失败"""
+        if reason == "cancelled":
+            label = "已被调用方取消"
+        elif deadline.seconds:
+            label = f"超过截止时间（{deadline.seconds:g}秒）"
+        else:
+            label = "超过服务器执行时间上限（MAX_EXECUTION_TIME）"
+        if rows:
+            return {
+                "success": True,
+                "data": rows,
+                "columns": columns or [],
+                "row_count": len(rows),
+                "partial": True,
+                "timeout": reason,
+                "warning": f"查询{label}，只返回了已读取的 {len(rows)} 行",
+                "query": query,
+                "timestamp": datetime.now().isoformat()
+            }
+        return {
+            "success": False,
+            "error": f"查询{label}" if reason == "cancelled" else f"查询{label}，已在服务器上中止",
+            "errno": errno,
+            "timeout": reason,
+            "query": query,
+            "timestamp": datetime.now().isoformat()
+        }
+
+    def _kill_query(self, connection_id: Optional[int], params: Optional[Dict[str, Any]] = None) -> bool:
+        """在旁路连接上 KILL QUERY（只中止查询，被取消查询所在的连接本身保持可用）"""
+        if connection_id is None:
+            return False
+        side = None
+        try:
+            side = _mysql_connect(**(params or self._connection_params()))
+            cursor = side.cursor()
+            cursor.execute(f"KILL QUERY {int(connection_id)}")
+            cursor.close()
+            print(f"🛑 已在服务器上取消查询（连接 {connection_id}）")
+            return True
+        except Exception as e:
+            print(f"⚠️ 取消查询失败（连接 {connection_id}）: {e}")
+            return False
+        finally:
+            if side is not None:
+                try:
+                    side.close()
+                except Exception:
+                    pass
+
+    def iter_query_batches(self, query: str, params: Optional[tuple] = None,
+                           batch_rows: int = 5000) -> Iterator[Tuple[List[str], List[tuple]]]:
+        """流式执行查询，每次产出 (列名, 最多 batch_rows 个元组行)
+
+        使用非缓冲的元组游标逐批 fetchmany，结果不会整体读入内存，也不构造 dict 行（导出使用）。
+        不经过单飞去重和副本路由，迭代期间独占主库连接；结果为空时产出一次 (列名, [])。
+        出错时抛出 mysql.connector.Error。
+        """
+        with self._connection_lock:
+            if not self.connection or not self.connection.is_connected():
+                if not self.connect():
+                    raise _driver().Error("无法连接到数据库")
+            cursor = self.connection.cursor(buffered=False)
+            finished = False
+            try:
+                cursor.execute(query, params or ())
+                columns = [desc[0] for desc in cursor.description or []]
+                emitted = False
+                while True:
+                    rows = cursor.fetchmany(batch_rows)
+                    if not rows:
+                        break
+                    emitted = True
+                    yield columns, rows
+                if not emitted:
+                    yield columns, []
+                finished = True
+            finally:
+                try:
+                    cursor.close()
+                except _driver().Error:
+                    pass
+                if not finished:
+                    # 中途放弃时连接上还有未读完的结果，直接关闭主库连接，下次使用时重连
+                    try:
+                        self.connection.close()
+                    except _driver().Error:
+                        pass
+
+    def get_schema_version(self) -> Optional[str]:
+        """获取当前库的表结构版本指纹（表数量、列数量、最近建表/改表时间）
+
+        结果在 schema_version_ttl 秒内复用；版本变化时清空本地表结构缓存。
+        无法连接时返回 None，调用方应跳过依赖版本的缓存。
+        """
+        now = time.time()
+        if self._schema_version and now - self._schema_version_checked_at < self.schema_version_ttl:
+            return self._schema_version
+
+        database = self.config.get("database")
+        rows = self._query_metadata(
+            "SELECT "
+            "(SELECT COUNT(*) FROM information_schema.TABLES WHERE TABLE_SCHEMA = %s) AS table_count, "
+            "(SELECT COUNT(*) FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = %s) AS column_count, "
+            "(SELECT MAX(CREATE_TIME) FROM information_schema.TABLES WHERE TABLE_SCHEMA = %s) AS last_created",
+            (database, database, database),
+        )
+        if not rows:
+            return None
+        version = "-".join(str(v.isoformat() if hasattr(v, "isoformat") else v) for v in rows[0].values())
+
+        if self._schema_version and version != self._schema_version:
+            self.table_cache = {}
+            self.table_keywords = {}
+            self.comments = None
+            self.table_index = None
+            self.foreign_keys = None
+            self.index_cache = {}
+            self.table_rows_cache = {}
+            self.shard_families = None
+            self.partition_cache = {}
+            self.column_values = {}
+            if self.result_cache is not None:
+                self.result_cache.clear()
+        self._schema_version = version
+        self._schema_version_checked_at = now
+        return version
+
+    def seed_schema_version(self, version: str, checked_at: float):
+        """用进程外记录的表结构版本（计划缓存文件）预置本地版本
+
+        只在本进程还没有查询过版本时生效；checked_at 起 schema_version_ttl 秒内 get_schema_version 不访问数据库。
+        """
+        if self._schema_version is None:
+            self._schema_version = version
+            self._schema_version_checked_at = checked_at
+
+    def get_table_update_times(self, table_names: List[str]) -> Dict[str, Optional[str]]:
+        """批量获取表的最后更新时间（information_schema.TABLES.UPDATE_TIME）
+
+        返回 {表名: ISO时间字符串或None}；InnoDB 在重启后或未开启统计时可能返回 NULL，
+        调用方应把 None 视为“未知”，而不是“未变化”。
+        """
+        if not table_names:
+            return {}
+
+        with self._connection_lock:
+            if not self.connection or not self.connection.is_connected():
+                if not self.connect():
+                    return {}
+
+            cursor = None
+            try:
+                cursor = self.connection.cursor(dictionary=True)
+                placeholders = ", ".join(["%s"] * len(table_names))
+                cursor.execute(
+                    "SELECT TABLE_NAME, UPDATE_TIME FROM information_schema.TABLES "
+                    f"WHERE TABLE_SCHEMA = %s AND TABLE_NAME IN ({placeholders})",
+                    (self.config.get("database"), *table_names),
+                )
+                update_times = {name: None for name in table_names}
+                for row in cursor.fetchall():
+                    value = row.get("UPDATE_TIME")
+                    update_times[row["TABLE_NAME"]] = value.isoformat() if hasattr(value, "isoformat") else value
+                return update_times
+            except _driver().Error as e:
+                print(f"❌ 获取表更新时间失败: {e}")
+                return {}
+            finally:
+                if cursor:
+                    cursor.close()
+
+    def _query_metadata(self, query: str, params: tuple = ()) -> List[Dict[str, Any]]:
+        """在主库上执行 information_schema 元数据查询，失败时返回空列表"""
+        with self._connection_lock:
+            if not self.connection or not self.connection.is_connected():
+                if not self.connect():
+                    return []
+            cursor = None
+            try:
+                cursor = self.connection.cursor(dictionary=True)
+                cursor.execute(query, params)
+                return cursor.fetchall()
+            except _driver().Error as e:
+                print(f"❌ 读取元数据失败: {e}")
+                return []
+            finally:
+                if cursor:
+                    cursor.close()
+
+    def internal_query(self, query: str, params: tuple = ()) -> List[Dict[str, Any]]:
+        """内部探测查询（取值字典的 DISTINCT 等）：直接在主连接上执行，失败时返回空列表
+
+        不经过成本守卫、单飞、结果缓存和运行指标：这些查询不是用户请求，守卫按全表估算会误拒绝。
+        """
+        return self._query_metadata(query, params)
+
+    def get_foreign_keys(self) -> List[Dict[str, str]]:
+        """获取当前库声明的全部外键（KEY_COLUMN_USAGE），结果缓存"""
+        if self.foreign_keys is None:
+            rows = self._query_metadata(
+                "SELECT TABLE_NAME, COLUMN_NAME, REFERENCED_TABLE_NAME, REFERENCED_COLUMN_NAME "
+                "FROM information_schema.KEY_COLUMN_USAGE "
+                "WHERE TABLE_SCHEMA = %s AND REFERENCED_TABLE_NAME IS NOT NULL",
+                (self.config.get("database"),),
+            )
+            self.foreign_keys = [
+                {
+                    "table": row["TABLE_NAME"],
+                    "column": row["COLUMN_NAME"],
+                    "referenced_table": row["REFERENCED_TABLE_NAME"],
+                    "referenced_column": row["REFERENCED_COLUMN_NAME"],
+                }
+                for row in rows
+            ]
+        return self.foreign_keys
+
+    def get_index_info(self, table_name: str) -> Dict[str, Dict[str, Any]]:
+        """获取表的索引信息（STATISTICS）
+
+        返回 {索引名: {"columns": [按顺序的列], "unique": bool, "cardinality": 首列基数}}
+        """
+        if table_name not in self.index_cache:
+            rows = self._query_metadata(
+                "SELECT INDEX_NAME, SEQ_IN_INDEX, COLUMN_NAME, NON_UNIQUE, CARDINALITY "
+                "FROM information_schema.STATISTICS "
+                "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s ORDER BY INDEX_NAME, SEQ_IN_INDEX",
+                (self.config.get("database"), table_name),
+            )
+            indexes: Dict[str, Dict[str, Any]] = {}
+            for row in rows:
+                index = indexes.setdefault(row["INDEX_NAME"], {
+                    "columns": [],
+                    "unique": not int(row["NON_UNIQUE"] or 0),
+                    "cardinality": int(row["CARDINALITY"] or 0),
+                })
+                index["columns"].append(row["COLUMN_NAME"])
+            self.index_cache[table_name] = indexes
+        return self.index_cache[table_name]
+
+    def get_table_rows(self, table_names: List[str]) -> Dict[str, int]:
+        """获取表行数估算值（TABLES.TABLE_ROWS），结果缓存"""
+        missing = [t for t in table_names if t not in self.table_rows_cache]
+        if missing:
+            placeholders = ", ".join(["%s"] * len(missing))
+            rows = self._query_metadata(
+                "SELECT TABLE_NAME, TABLE_ROWS FROM information_schema.TABLES "
+                f"WHERE TABLE_SCHEMA = %s AND TABLE_NAME IN ({placeholders})",
+                (self.config.get("database"), *missing),
+            )
+            for row in rows:
+                self.table_rows_cache[row["TABLE_NAME"]] = int(row["TABLE_ROWS"] or 0)
+            for table in missing:
+                self.table_rows_cache.setdefault(table, 0)
+        return {t: self.table_rows_cache[t] for t in table_names}
 
     def suggest_related_tables(self, primary_table: str, user_query: str) -> List[Tuple[str, float]]:
-        """建议可能与主表相关的表"""
+        """建议可能与主表相关的表
+
+        声明了外键的表优先；共同列名只有在至少一侧建了索引（列是索引首列）时才计入，
+        避免把 status / created_at 这类普通同名列当作关联关系。
+        """
         if not self.table_cache:
             self.discover_tables()
         
@@ -345,19 +1201,38 @@ class SmartDBConnector:
         
         primary_columns = set(primary_info['column_names'])
         suggestions = []
+
+        fk_tables = set()
+        for fk in self.get_foreign_keys():
+            if fk["table"] == primary_table:
+                fk_tables.add(fk["referenced_table"])
+            elif fk["referenced_table"] == primary_table:
+                fk_tables.add(fk["table"])
+
+        primary_indexed = self._leading_index_columns(primary_table)
         
         for table_name, info in self.table_cache.items():
             if table_name == primary_table:
                 continue
-            
-            # 查找共同的列名（可能是外键关系）
+
+            score = 1.0 if table_name in fk_tables else 0.0
+
+            # 查找共同的列名（可能是未声明的外键关系），要求至少一侧有索引
             common_columns = primary_columns.intersection(info['column_names'])
-            if common_columns:
-                score = len(common_columns) / max(len(primary_columns), len(info['column_names']))
+            other_indexed = self._leading_index_columns(table_name)
+            indexed_common = {c for c in common_columns if c in primary_indexed or c in other_indexed}
+            if indexed_common:
+                score += len(indexed_common) / max(len(primary_columns), len(info['column_names']))
+
+            if score > 0:
                 suggestions.append((table_name, score))
         
         suggestions.sort(key=lambda x: x[1], reverse=True)
         return suggestions
+
+    def _leading_index_columns(self, table_name: str) -> set:
+        """表中作为某个索引首列的列名集合（可以走索引查找）"""
+        return {index["columns"][0] for index in self.get_index_info(table_name).values() if index["columns"]}
     
     def test_connection(self) -> bool:
         """测试数据库连接"""
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+查询结果快照库（SQLite）
+每次 process_query 的结果（数据、统计、图表和查询计划）按“查询指纹 + 时间”追加保存，
+同时把标量指标（总行数、单行聚合值、分组计数、数值列的均值/分位数等）写入指标表：
+
+- 从快照重新生成看板，不需要连接 MySQL（离线看板、历史回看）
+- 比较两个快照的指标变化
+- 历史趋势直接读取已保存的指标，不再扫描原始表
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from collections.abc import Mapping
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Dict, List, Any, Optional
+
+from plan_cache import normalize_query
+from result_rows import ResultRows, Row
+
+# 每个查询最多保留的快照数量，超出时删除最旧的快照（指标一并删除）
+DEFAULT_MAX_SNAPSHOTS_PER_QUERY = 200
+# 单行分组结果最多记录的分组数量（超过时只记录整体指标）
+MAX_GROUP_METRICS = 50
+# 数值列写入指标表的分布指标
+SUMMARY_METRICS = ("mean", "min", "max", "p50", "p90")
+
+
+def _json_default(obj):
+    """快照 JSON 编码：结果行（每行一个数组）和 datetime / Decimal / bytes / timedelta 等 MySQL 返回类型"""
+    if isinstance(obj, ResultRows):
+        return obj.rows
+    if isinstance(obj, Row):
+        return dict(obj)
+    if hasattr(obj, "strftime"):
+        return obj.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, bytes):
+        return obj.decode("utf-8", errors="ignore")
+    if isinstance(obj, timedelta):
+        return str(obj)
+    return str(obj)
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float, Decimal)) and not isinstance(value, bool)
+
+
+def query_hash(user_query: str, database: Optional[str] = None) -> str:
+    """查询指纹：数据库名 + 规范化后的查询文本（与计划缓存的规范化方式一致）"""
+    text = f"{database or ''}:{normalize_query(user_query)}"
+    return hashlib.md5(text.encode("utf-8")).hexdigest()[:16]
+
+
+def extract_metrics(result: Dict[str, Any]) -> Dict[str, float]:
+    """从查询结果中提取可以跨快照比较的标量指标
+
+    - row_count：结果行数
+    - 单行结果（COUNT/SUM/AVG 等聚合）：每个数值列一个指标，名称为列名
+    - 分组结果（一个分类列 + 数值列，不超过 MAX_GROUP_METRICS 组）：“数值列[分组取值]”
+    - 多行结果 stats["columns"] 中数值列的分布：“列名.mean”、“列名.p50” 等
+    """
+    metrics: Dict[str, float] = {"row_count": float(result.get("row_count") or 0)}
+    data = result.get("data") or []
+    columns = result.get("columns") or []
+
+    if len(data) == 1 and isinstance(data[0], Mapping):
+        for col in columns:
+            if _is_number(data[0].get(col)):
+                metrics[col] = float(data[0][col])
+    elif data and len(data) <= MAX_GROUP_METRICS and isinstance(data[0], Mapping):
+        numeric = [c for c in columns if all(_is_number(row.get(c)) or row.get(c) is None for row in data)]
+        labels = [c for c in columns if c not in numeric]
+        if len(labels) == 1 and numeric:
+            for row in data:
+                group = row.get(labels[0])
+                if not isinstance(group, str):
+                    group = "-" if group is None else _json_default(group)
+                for col in numeric:
+                    if row.get(col) is not None:
+                        metrics[f"{col}[{group}]"] = float(row[col])
+
+    summaries = (result.get("stats") or {}).get("columns") or {} if len(data) > 1 else {}
+    for col, summary in summaries.items():
+        for name in SUMMARY_METRICS:
+            if summary.get(name) is not None:
+                metrics[f"{col}.{name}"] = float(summary[name])
+    return metrics
+
+
+class SnapshotStore:
+    def __init__(self, store_file: str, max_snapshots_per_query: int = DEFAULT_MAX_SNAPSHOTS_PER_QUERY):
+        """打开（必要时创建）快照库
+
+        store_file: SQLite 文件路径
+        max_snapshots_per_query: 每个查询保留的快照数量上限
+        """
+        self.store_file = store_file
+        self.max_snapshots_per_query = max_snapshots_per_query
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(store_file, check_same_thread=False)
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS snapshots ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " query_hash TEXT NOT NULL,"
+            " query TEXT NOT NULL,"
+            " sql_query TEXT,"
+            " created_at REAL NOT NULL,"
+            " row_count INTEGER NOT NULL,"
+            " result_blob BLOB NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_snapshots_query ON snapshots (query_hash, created_at);"
+            "CREATE TABLE IF NOT EXISTS snapshot_metrics ("
+            " snapshot_id INTEGER NOT NULL,"
+            " query_hash TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " name TEXT NOT NULL,"
+            " value REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_metrics_query ON snapshot_metrics (query_hash, name, created_at);"
+            "CREATE INDEX IF NOT EXISTS idx_metrics_snapshot ON snapshot_metrics (snapshot_id);"
+        )
+        self._db.commit()
+
+    # ---------- 写入 ----------
+
+    def save(self, result: Dict[str, Any], database: Optional[str] = None) -> Optional[int]:
+        """保存一次成功的查询结果，返回快照 id；失败的结果不保存"""
+        if not result.get("success"):
+            return None
+        user_query = result.get("original_query") or ""
+        key = query_hash(user_query, database)
+        created_at = time.time()
+        try:
+            blob = zlib.compress(
+                json.dumps(result, ensure_ascii=False, default=_json_default).encode("utf-8")
+            )
+            metrics = extract_metrics(result)
+        except (TypeError, ValueError) as e:
+            print(f"⚠️ 保存结果快照失败: {e}")
+            return None
+
+        with self._lock:
+            try:
+                cursor = self._db.execute(
+                    "INSERT INTO snapshots (query_hash, query, sql_query, created_at, row_count, result_blob) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, user_query, result.get("sql_query"), created_at, int(result.get("row_count") or 0), blob),
+                )
+                snapshot_id = cursor.lastrowid
+                self._db.executemany(
+                    "INSERT INTO snapshot_metrics (snapshot_id, query_hash, created_at, name, value) VALUES (?, ?, ?, ?, ?)",
+                    [(snapshot_id, key, created_at, name, value) for name, value in metrics.items()],
+                )
+                self._prune(key)
+                self._db.commit()
+                return snapshot_id
+            except sqlite3.Error as e:
+                self._db.rollback()
+                print(f"⚠️ 保存结果快照失败: {e}")
+                return None
+
+    def _prune(self, key: str):
+        stale = [row[0] for row in self._db.execute(
+            "SELECT id FROM snapshots WHERE query_hash = ? ORDER BY created_at DESC, id DESC LIMIT -1 OFFSET ?",
+            (key, self.max_snapshots_per_query),
+        )]
+        if stale:
+            marks = ", ".join("?" * len(stale))
+            self._db.execute(f"DELETE FROM snapshot_metrics WHERE snapshot_id IN ({marks})", stale)
+            self._db.execute(f"DELETE FROM snapshots WHERE id IN ({marks})", stale)
+
+    # ---------- 读取 ----------
+
+    def recent(self, user_query: Optional[str] = None, database: Optional[str] = None,
+               limit: int = 20) -> List[Dict[str, Any]]:
+        """最近的快照（不含结果数据）；指定 user_query 时只列出该查询的快照"""
+        sql = "SELECT id, query, sql_query, created_at, row_count FROM snapshots"
+        params: tuple = ()
+        if user_query:
+            sql += " WHERE query_hash = ?"
+            params = (query_hash(user_query, database),)
+        sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        with self._lock:
+            rows = self._db.execute(sql, params + (limit,)).fetchall()
+        return [
+            {
+                "id": row[0],
+                "query": row[1],
+                "sql_query": row[2],
+                "created_at": datetime.fromtimestamp(row[3]).strftime("%Y-%m-%d %H:%M:%S"),
+                "row_count": row[4],
+            }
+            for row in rows
+        ]
+
+    def load(self, snapshot_id: int) -> Optional[Dict[str, Any]]:
+        """读取快照中的完整查询结果（与 process_query 的返回结构一致），另带 snapshot 字段"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT result_blob, created_at FROM snapshots WHERE id = ?", (snapshot_id,)
+            ).fetchone()
+        if not row:
+            return None
+        result = json.loads(zlib.decompress(row[0]).decode("utf-8"))
+        # 行保存为数组（早期版本的快照为 dict 行），读取后统一为 ResultRows
+        if isinstance(result.get("data"), list):
+            result["data"] = ResultRows.from_records(result.get("columns") or [], result["data"])
+        result["snapshot"] = {
+            "id": snapshot_id,
+            "created_at": datetime.fromtimestamp(row[1]).strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        return result
+
+    def latest(self, user_query: str, database: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """该查询最近一次的快照结果"""
+        snapshots = self.recent(user_query, database, limit=1)
+        return self.load(snapshots[0]["id"]) if snapshots else None
+
+    def metrics(self, snapshot_id: int) -> Dict[str, float]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT name, value FROM snapshot_metrics WHERE snapshot_id = ?", (snapshot_id,)
+            ).fetchall()
+        return dict(rows)
+
+    def compare(self, old_id: int, new_id: int) -> Dict[str, Any]:
+        """比较两个快照的指标：[{name, old, new, change, change_pct}]，只出现在一侧的指标对应值为 None"""
+        old_snapshot = self.info(old_id)
+        new_snapshot = self.info(new_id)
+        if old_snapshot is None or new_snapshot is None:
+            missing = old_id if old_snapshot is None else new_id
+            return {"success": False, "error": f"快照不存在: {missing}"}
+
+        old_metrics, new_metrics = self.metrics(old_id), self.metrics(new_id)
+        changes = []
+        for name in sorted(set(old_metrics) | set(new_metrics)):
+            old, new = old_metrics.get(name), new_metrics.get(name)
+            change = new - old if old is not None and new is not None else None
+            changes.append({
+                "name": name,
+                "old": old,
+                "new": new,
+                "change": change,
+                "change_pct": round(change / old * 100, 2) if change is not None and old else None,
+            })
+        return {
+            "success": True,
+            "old": old_snapshot,
+            "new": new_snapshot,
+            "same_query": old_snapshot["query_hash"] == new_snapshot["query_hash"],
+            "metrics": changes,
+        }
+
+    def info(self, snapshot_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, query, query_hash, created_at, row_count FROM snapshots WHERE id = ?", (snapshot_id,)
+            ).fetchone()
+        if not row:
+            return None
+        return {
+            "id": row[0],
+            "query": row[1],
+            "query_hash": row[2],
+            "created_at": datetime.fromtimestamp(row[3]).strftime("%Y-%m-%d %H:%M:%S"),
+            "row_count": row[4],
+        }
+
+    def trend(self, user_query: str, database: Optional[str] = None,
+              names: Optional[List[str]] = None, since: Optional[float] = None) -> Dict[str, List[tuple]]:
+        """该查询历次快照的指标序列 {指标名: [(时间, 值)]}，只读取指标表，不访问数据库"""
+        sql = "SELECT name, created_at, value FROM snapshot_metrics WHERE query_hash = ?"
+        params: list = [query_hash(user_query, database)]
+        if names:
+            sql += f" AND name IN ({', '.join('?' * len(names))})"
+            params.extend(names)
+        if since is not None:
+            sql += " AND created_at >= ?"
+            params.append(since)
+        sql += " ORDER BY created_at"
+        series: Dict[str, List[tuple]] = {}
+        with self._lock:
+            for name, created_at, value in self._db.execute(sql, params):
+                label = datetime.fromtimestamp(created_at).strftime("%Y-%m-%d %H:%M:%S")
+                series.setdefault(name, []).append((label, value))
+        return series
+
+    def close(self):
+        with self._lock:
+            self._db.close()
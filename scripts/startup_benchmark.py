@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+命令行启动耗时测量
+每次都启动新的 Python 进程（与实际命令行调用一致），分别测量：
+
+- python：空解释器启动（基线，机器本身的开销）
+- import：只导入 smart_dashboard_generator
+- sql：--mode sql 在计划缓存已预热时的端到端耗时（第一次调用用于预热计划缓存和表结构版本，不计入）
+
+并用 -X importtime 列出预热后 --mode sql 路径上导入最慢的模块，便于发现被提前加载的重依赖。
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+GENERATOR = os.path.join(SCRIPT_DIR, "smart_dashboard_generator.py")
+DEFAULT_QUERY = "今天的用户注册量"
+# --mode sql（缓存已预热）的耗时目标（毫秒，取中位数）
+DEFAULT_BUDGET_MS = 100
+
+
+def _run(cmd: List[str]) -> float:
+    start = time.perf_counter()
+    completed = subprocess.run(cmd, cwd=SCRIPT_DIR, capture_output=True, text=True)
+    elapsed = (time.perf_counter() - start) * 1000
+    if completed.returncode != 0:
+        raise RuntimeError(f"命令执行失败: {' '.join(cmd)}\n{completed.stderr}")
+    return elapsed
+
+
+def _summary(samples: List[float]) -> Dict[str, float]:
+    return {
+        "min": round(min(samples), 1),
+        "median": round(statistics.median(samples), 1),
+        "max": round(max(samples), 1),
+    }
+
+
+def slowest_imports(cmd: List[str], top: int = 8) -> List[tuple]:
+    """用 -X importtime 运行一次，返回累计导入耗时最长的顶层模块 [(模块, 毫秒)]"""
+    completed = subprocess.run(
+        [cmd[0], "-X", "importtime"] + cmd[1:], cwd=SCRIPT_DIR, capture_output=True, text=True
+    )
+    modules = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        # 只看顶层导入（缩进最少的模块），子模块的耗时已计入其父模块
+        if name.startswith(" ") and not name.startswith("  "):
+            try:
+                modules.append((name.strip(), int(cumulative.strip()) / 1000))
+            except ValueError:
+                continue
+    modules.sort(key=lambda item: item[1], reverse=True)
+    return modules[:top]
+
+
+def measure(db_config: str, plan_cache: str, query: str, runs: int) -> Dict[str, Dict[str, float]]:
+    python = sys.executable
+    import_cmd = [python, "-c", "import smart_dashboard_generator"]
+    sql_cmd = [python, GENERATOR, "--db-config", db_config, "--plan-cache", plan_cache, "--mode", "sql", query]
+
+    results = {
+        "python": _summary([_run([python, "-c", "pass"]) for _ in range(runs)]),
+        "import": _summary([_run(import_cmd) for _ in range(runs)]),
+    }
+    _run(sql_cmd)  # 预热：生成计划并记录表结构版本
+    results["sql"] = _summary([_run(sql_cmd) for _ in range(runs)])
+    results["slowest_imports"] = slowest_imports(sql_cmd)
+    return results
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="命令行启动耗时测量")
+    parser.add_argument("query", nargs="*", help=f"用于测量 --mode sql 的查询（默认：{DEFAULT_QUERY}）")
+    parser.add_argument("--db-config", default=os.path.join(os.path.dirname(SCRIPT_DIR), "db_config.json"),
+                        help="数据库配置文件路径（预热时需要连接数据库）")
+    parser.add_argument("--plan-cache", default=os.path.join(tempfile.gettempdir(), "smart_dashboard_startup_benchmark.sqlite"),
+                        help="计划缓存文件（SQLite）")
+    parser.add_argument("--runs", type=int, default=10, help="每项测量的次数")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS, help="--mode sql 中位数耗时目标（毫秒）")
+    args = parser.parse_args()
+
+    query = " ".join(args.query) or DEFAULT_QUERY
+    try:
+        results = measure(args.db_config, args.plan_cache, query, args.runs)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        sys.exit(2)
+
+    print(f"⏱️ 启动耗时（{args.runs} 次，毫秒）")
+    for name in ("python", "import", "sql"):
+        item = results[name]
+        print(f"  {name:<7} 最小 {item['min']:>7}  中位数 {item['median']:>7}  最大 {item['max']:>7}")
+    print("🐢 --mode sql 路径上导入最慢的模块（毫秒）:")
+    for module, ms in results["slowest_imports"]:
+        print(f"  {module:<28} {ms:.1f}")
+
+    if results["sql"]["median"] > args.budget_ms:
+        print(f"❌ --mode sql 中位数 {results['sql']['median']}ms 超过目标 {args.budget_ms}ms")
+        sys.exit(1)
+    print(f"✅ --mode sql 中位数在目标 {args.budget_ms}ms 以内")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+中文感知的表匹配索引
+把每个（逻辑）表看作一篇文档：表名、表注释（TABLE_COMMENT）、映射到该表的实体名为表级词项，
+列名、列注释（COLUMN_COMMENT）、字段别名为列级词项，用 BM25 对查询打分。
+
+分词：英文/数字按单词切分；中文片段先用词典（表注释、列注释中的短语 + entity_config.json 的实体名和字段别名）
+构建的 trie 做正向最大匹配，识别出完整的词，同时补充片段的二元组（bigram），
+这样词典里没有的说法（“注册用户” 对 “注册时间”）也能按公共的两个字匹配上。
+"""
+
+import math
+import re
+from typing import Dict, List, Iterable, Optional, Tuple
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# 表级词项（表名、表注释、实体名）的词频权重，列级词项为 1
+TABLE_FIELD_WEIGHT = 3
+# 注释中超过该长度的中文短语不加入词典（只参与二元组匹配）
+MAX_DICTIONARY_WORD_LENGTH = 12
+
+_CJK_RUN = re.compile(r"[\u4e00-\u9fff]+")
+_ASCII_CHUNK = re.compile(r"[a-z0-9_]+")
+_ASCII_WORD = re.compile(r"[a-z0-9]+")
+
+
+class WordTrie:
+    """中文词典 trie，用于正向最大匹配"""
+
+    def __init__(self, words: Iterable[str] = ()):
+        self.root: Dict[str, dict] = {}
+        for word in words:
+            self.add(word)
+
+    def add(self, word: str):
+        if len(word) < 2:
+            return
+        node = self.root
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def longest_match(self, text: str, start: int) -> int:
+        """从 start 开始能匹配到的最长词的长度，没有时返回 0"""
+        node, longest = self.root, 0
+        for offset in range(start, len(text)):
+            node = node.get(text[offset])
+            if node is None:
+                break
+            if "" in node:
+                longest = offset - start + 1
+        return longest
+
+
+def tokenize(text: str, trie: Optional[WordTrie] = None) -> List[str]:
+    """切分为词项：英文/数字单词（带下划线的整体也保留）、中文词典词（最大匹配）和中文二元组"""
+    text = (text or "").lower()
+    tokens: List[str] = []
+    for chunk in _ASCII_CHUNK.findall(text):
+        if "_" in chunk.strip("_"):
+            tokens.append(chunk)
+        tokens.extend(word for word in _ASCII_WORD.findall(chunk) if len(word) >= 2)
+
+    for run in _CJK_RUN.findall(text):
+        if trie is not None:
+            i = 0
+            while i < len(run):
+                length = trie.longest_match(run, i)
+                if length:
+                    tokens.append(run[i:i + length])
+                    i += length
+                else:
+                    i += 1
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def dictionary_words(texts: Iterable[str]) -> List[str]:
+    """从注释、实体名等文本中提取词典词：标点/空白/英文分隔出的中文短语"""
+    words = []
+    for text in texts:
+        for run in _CJK_RUN.findall(text or ""):
+            if 2 <= len(run) <= MAX_DICTIONARY_WORD_LENGTH:
+                words.append(run)
+    return words
+
+
+class TableIndex:
+    def __init__(self, documents: Dict[str, List[Tuple[str, int]]], trie: WordTrie):
+        """documents: {表名: [(文本, 词频权重)]}，文本按同一个 trie 分词"""
+        self.trie = trie
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.lengths: Dict[str, int] = {}
+        for table, texts in documents.items():
+            length = 0
+            for text, weight in texts:
+                for token in tokenize(text, trie):
+                    table_tf = self.postings.setdefault(token, {})
+                    table_tf[table] = table_tf.get(table, 0) + weight
+                    length += weight
+            self.lengths[table] = length
+        self.avg_length = (sum(self.lengths.values()) / len(self.lengths)) if self.lengths else 0.0
+        total = len(self.lengths)
+        self.idf = {
+            token: math.log(1 + (total - len(tables) + 0.5) / (len(tables) + 0.5))
+            for token, tables in self.postings.items()
+        }
+
+    @classmethod
+    def build(cls, tables: Dict[str, List[str]],
+              table_comments: Optional[Dict[str, str]] = None,
+              column_comments: Optional[Dict[str, Dict[str, str]]] = None,
+              entity_terms: Optional[Dict[str, str]] = None,
+              column_aliases: Optional[Dict[str, List[str]]] = None) -> "TableIndex":
+        """构建索引
+
+        tables: {表名: [列名]}；table_comments: {表名: 注释}；column_comments: {表名: {列名: 注释}}
+        entity_terms: {实体名/表别名: 表名}（entity_config.json）；column_aliases: {列名: [中文叫法]}
+        """
+        table_comments = table_comments or {}
+        column_comments = column_comments or {}
+        entity_terms = entity_terms or {}
+        column_aliases = column_aliases or {}
+        aliases_of = {column: names if isinstance(names, list) else [names] for column, names in column_aliases.items()}
+
+        trie = WordTrie(dictionary_words(
+            list(table_comments.values())
+            + [comment for comments in column_comments.values() for comment in comments.values()]
+            + list(entity_terms)
+            + [alias for names in aliases_of.values() for alias in names]
+        ))
+
+        documents: Dict[str, List[Tuple[str, int]]] = {}
+        for table, columns in tables.items():
+            texts = [(table, TABLE_FIELD_WEIGHT), (table_comments.get(table, ""), TABLE_FIELD_WEIGHT)]
+            texts += [(name, TABLE_FIELD_WEIGHT) for name, target in entity_terms.items() if target == table]
+            comments = column_comments.get(table, {})
+            for column in columns:
+                texts.append((column, 1))
+                if comments.get(column):
+                    texts.append((comments[column], 1))
+                texts += [(alias, 1) for alias in aliases_of.get(column, [])]
+            documents[table] = texts
+        return cls(documents, trie)
+
+    def search(self, query: str) -> List[Tuple[str, float]]:
+        """BM25 打分，返回 [(表名, 分数)]（按分数降序，只含分数大于 0 的表）
+
+        分数除以查询中已知词项的理论上限，落在 0~1 之间，可以与固定阈值比较。
+        """
+        terms = [t for t in dict.fromkeys(tokenize(query, self.trie)) if t in self.postings]
+        if not terms:
+            return []
+        scores: Dict[str, float] = {}
+        for term in terms:
+            idf = self.idf[term]
+            for table, tf in self.postings[term].items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[table] / (self.avg_length or 1))
+                scores[table] = scores.get(table, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        upper = sum(self.idf[term] for term in terms) * (BM25_K1 + 1)
+        ranked = [(table, round(score / upper, 4)) for table, score in scores.items() if score > 0]
+        ranked.sort(key=lambda item: item[1], reverse=True)
+        return ranked
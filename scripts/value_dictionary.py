@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+列值字典
+为低基数的文本列（渠道、状态、类型等）缓存去重后的取值，解析查询时一次扫描即可把
+“渠道为华为的用户”识别为 source = 'huawei' 这样的等值/IN 过滤条件。
+
+- 只为有索引的列（读 STATISTICS 的基数判定低基数）和 ENUM/SET 列建字典：识别出的等值/IN 条件
+  都能走索引或取值固定；没有索引的列上的等值过滤会全表扫描，采样得到的取值也不完整，不建字典
+- 字典有总量上限，保存在连接器的表结构缓存中（db.column_values），表结构版本变化时一起清空
+- 只在常驻进程的后台线程中构建，解析查询时只使用已经构建好的字典，不等待构建
+- 取值探测直接在主连接上执行（db.internal_query），不经过成本守卫、单飞、结果缓存和运行指标
+"""
+
+import hashlib
+import re
+import threading
+import time
+from typing import Dict, List, Any, Optional
+
+DEFAULT_VALUE_DICTIONARY_CONFIG = {
+    # 去重取值不超过该数量的列才建字典
+    "max_distinct": 50,
+    # 整个字典最多保存的取值数量
+    "max_total_values": 20000,
+    # 取值长度上限（过长的文本不可能出现在自然语言查询中）
+    "max_value_length": 64,
+    # 字典刷新间隔（秒），新增的取值在刷新后才能被识别
+    "refresh_seconds": 3600,
+}
+
+# 可以建字典的列类型（数字列的取值无法与自然语言对应，不处理）
+_TEXT_TYPES = ("char", "varchar", "enum", "set")
+
+_ENUM_VALUES = re.compile(r"'((?:[^']|'')*)'")
+
+
+def sql_literal(value: Any) -> str:
+    """把取值转为 SQL 字符串字面量"""
+    text = str(value).replace("\\", "\\\\").replace("'", "''")
+    return f"'{text}'"
+
+
+class ValueDictionary:
+    def __init__(self, db_connector, config: Optional[Dict[str, Any]] = None,
+                 aliases: Optional[Dict[str, List[str]]] = None):
+        """初始化列值字典
+
+        aliases: 取值 → 中文别名列表，例如 {"huawei": ["华为", "华为渠道"]}（entity_config.json 的 value_aliases）
+        """
+        self.db = db_connector
+        self.reconfigure(config, aliases)
+        self._build_lock = threading.Lock()
+        self._building: Dict[str, threading.Event] = {}
+        # 等待后台构建的表；构建线程在队列取空时退出（_thread 置为 None）
+        self._queued: List[str] = []
+        self._thread: Optional[threading.Thread] = None
+
+    def reconfigure(self, config: Optional[Dict[str, Any]] = None,
+                    aliases: Optional[Dict[str, List[str]]] = None):
+        """替换配置和取值别名（实体配置热加载时调用），已构建的字典保留，识别用的正则按新别名重新编译"""
+        merged = dict(DEFAULT_VALUE_DICTIONARY_CONFIG)
+        merged.update(config or {})
+        self.config = merged
+        self.aliases = {
+            str(value): [a for a in (names if isinstance(names, list) else [names]) if a]
+            for value, names in (aliases or {}).items()
+            if not str(value).startswith("_")
+        }
+        self._matcher_cache: Dict[tuple, Any] = {}
+
+    # ---------- 构建 ----------
+
+    def _fresh(self, table_name: str) -> bool:
+        entry = self.db.column_values.get(table_name)
+        return entry is not None and time.time() - entry.get("_built_at", 0) < self.config["refresh_seconds"]
+
+    def start_background(self, tables: List[str]):
+        """后台依次为这些表中缺失或过期（超过 refresh_seconds）的字典构建；构建线程在运行时追加到其队列"""
+        with self._build_lock:
+            for table in dict.fromkeys(tables):
+                if table and table not in self._queued and table not in self._building and not self._fresh(table):
+                    self._queued.append(table)
+            if not self._queued or self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._drain, name="value-dictionary", daemon=True)
+            self._thread.start()
+
+    def _drain(self):
+        while True:
+            with self._build_lock:
+                if not self._queued:
+                    self._thread = None
+                    return
+                table = self._queued.pop(0)
+            try:
+                self.ensure_table(table)
+            except Exception as e:
+                print(f"⚠️ 构建取值字典失败（{table}）: {e}")
+
+    def ensure_table(self, table_name: str) -> Dict[str, Dict[str, Any]]:
+        """返回表的列值字典，缺失或过期时构建；其他线程正在构建时等待其完成"""
+        if self._fresh(table_name):
+            return self.db.column_values[table_name]["columns"]
+
+        with self._build_lock:
+            event = self._building.get(table_name)
+            leader = event is None
+            if leader:
+                event = threading.Event()
+                self._building[table_name] = event
+        if not leader:
+            event.wait()
+            entry = self.db.column_values.get(table_name)
+            return entry["columns"] if entry else {}
+
+        try:
+            columns = self._profile_table(table_name)
+            digest = hashlib.md5(
+                "|".join(f"{c}=" + ",".join(info["values"]) for c, info in sorted(columns.items())).encode("utf-8")
+            ).hexdigest()[:12]
+            self.db.column_values[table_name] = {"columns": columns, "digest": digest, "_built_at": time.time()}
+            return columns
+        finally:
+            with self._build_lock:
+                self._building.pop(table_name, None)
+            event.set()
+
+    def _total_values(self) -> int:
+        return sum(
+            len(col["values"])
+            for entry in self.db.column_values.values()
+            for col in entry["columns"].values()
+        )
+
+    def _profile_table(self, table_name: str) -> Dict[str, Dict[str, Any]]:
+        """找出有索引（或 ENUM/SET）的低基数文本列并读取其取值：{列名: {"values", "indexed"}}"""
+        table_info = self.db.get_table_structure(table_name)
+        if not table_info:
+            return {}
+        physical_table = (table_info.get("shards") or [table_name])[-1]
+        indexes = self.db.get_index_info(physical_table)
+        leading = {}
+        for index in indexes.values():
+            if index["columns"]:
+                col = index["columns"][0]
+                leading[col] = max(leading.get(col, 0), index["cardinality"])
+
+        max_distinct = self.config["max_distinct"]
+        budget = self.config["max_total_values"] - self._total_values()
+        result: Dict[str, Dict[str, Any]] = {}
+        for column in table_info.get("columns", []):
+            name, col_type = self._column_name_type(column)
+            if budget <= 0:
+                break
+            if not name or name in table_info.get("primary_keys", []):
+                continue
+            if not col_type.startswith(_TEXT_TYPES):
+                continue
+
+            if col_type.startswith(("enum", "set")):
+                values = [v.replace("''", "'") for v in _ENUM_VALUES.findall(col_type)]
+            elif name in leading:
+                # 有索引：基数来自统计信息，取值走索引去重
+                if leading[name] > max_distinct:
+                    continue
+                values = self._distinct_values(
+                    f"SELECT DISTINCT {name} AS v FROM {physical_table} LIMIT {max_distinct + 1}"
+                )
+            else:
+                continue
+
+            values = [v for v in values if 0 < len(v) <= self.config["max_value_length"]]
+            if not values or len(values) > max_distinct:
+                continue
+            values = values[:budget]
+            budget -= len(values)
+            result[name] = {"values": values, "indexed": name in leading}
+        return result
+
+    @staticmethod
+    def _column_name_type(column: Any) -> tuple:
+        try:
+            return column["Field"], str(column["Type"]).lower()
+        except (KeyError, TypeError):
+            return column[0], str(column[1]).lower()
+
+    def _distinct_values(self, sql: str) -> List[str]:
+        return [str(row["v"]) for row in self.db.internal_query(sql) if row.get("v") is not None]
+
+    # ---------- 识别 ----------
+
+    def built(self, tables: List[str]) -> bool:
+        """这些表中是否有已构建（且有内容）的字典"""
+        return any((self.db.column_values.get(table) or {}).get("columns") for table in tables)
+
+    def version(self, tables: List[str]) -> str:
+        """这些表当前字典内容的指纹（记录在查询计划中，字典变化后重新生成计划）"""
+        parts = []
+        for table in sorted(tables):
+            entry = self.db.column_values.get(table)
+            if entry and entry["columns"]:
+                parts.append(f"{table}:{entry['digest']}")
+        return hashlib.md5("|".join(parts).encode("utf-8")).hexdigest()[:12]
+
+    def _matcher(self, tables: List[str]):
+        """把这些表所有取值和别名编译为一个正则（长的优先），返回 (正则, {小写表面形式: [(表, 列, 取值)]})"""
+        key = tuple((t, id(self.db.column_values.get(t))) for t in tables)
+        cached = self._matcher_cache.get(key)
+        if cached is not None:
+            return cached
+
+        surfaces: Dict[str, List[tuple]] = {}
+        for table in tables:
+            entry = self.db.column_values.get(table)
+            if not entry:
+                continue
+            for column, info in entry["columns"].items():
+                for value in info["values"]:
+                    forms = [value] + self.aliases.get(value, [])
+                    for form in forms:
+                        form = form.lower()
+                        # 单字符或纯数字的取值太容易误命中
+                        if len(form) < 2 or form.isdigit():
+                            continue
+                        surfaces.setdefault(form, []).append((table, column, value))
+
+        if not surfaces:
+            matcher = (None, {})
+        else:
+            alternatives = sorted(surfaces, key=len, reverse=True)
+            # ASCII 取值需要完整单词匹配，避免 "on" 命中 "iphone"
+            pattern = "|".join(
+                rf"(?<![a-z0-9_]){re.escape(form)}(?![a-z0-9_])" if form.isascii() else re.escape(form)
+                for form in alternatives
+            )
+            matcher = (re.compile(pattern), surfaces)
+        if len(self._matcher_cache) >= 32:
+            self._matcher_cache.clear()
+        self._matcher_cache[key] = matcher
+        return matcher
+
+    def extract_filters(self, query: str, tables: List[str], primary_table: str,
+                        column_hints: Optional[Dict[str, List[str]]] = None) -> List[Dict[str, Any]]:
+        """一次扫描查询文本，识别出等值/IN 过滤条件
+
+        同一个取值出现在多个列时：查询中出现了列的中文提示词（column_hints）的列优先，
+        其次是主表的列（不需要额外联表），再次是有索引的列。返回 [{"table", "column", "values", "indexed"}]。
+        """
+        pattern, surfaces = self._matcher(tables)
+        if pattern is None:
+            return []
+
+        query_lower = query.lower()
+        hinted = set()
+        for column, words in (column_hints or {}).items():
+            if any(word in query_lower for word in words):
+                hinted.add(column)
+
+        filters: Dict[tuple, Dict[str, Any]] = {}
+        for match in pattern.finditer(query_lower):
+            candidates = surfaces[match.group(0)]
+
+            def rank(candidate):
+                table, column, _ = candidate
+                info = self.db.column_values[table]["columns"][column]
+                return (column in hinted, table == primary_table, info["indexed"])
+
+            table, column, value = max(candidates, key=rank)
+            info = self.db.column_values[table]["columns"][column]
+            item = filters.setdefault((table, column), {
+                "table": table,
+                "column": column,
+                "values": [],
+                "indexed": info["indexed"],
+            })
+            if value not in item["values"]:
+                item["values"].append(value)
+        return list(filters.values())
+
+    @staticmethod
+    def condition(column_ref: str, values: List[str]) -> str:
+        if len(values) == 1:
+            return f"{column_ref} = {sql_literal(values[0])}"
+        return f"{column_ref} IN ({', '.join(sql_literal(v) for v in values)})"
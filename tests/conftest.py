@@ -0,0 +1,5 @@
+import os
+import sys
+
+# scripts/ 下是平铺的模块（脚本之间直接 import），测试同样从该目录导入
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
@@ -0,0 +1,77 @@
+"""测试用的连接器替身：表结构、索引、分区和取值都来自内存中的定义，不连接数据库"""
+
+import re
+from datetime import date
+
+_DISTINCT = re.compile(r"SELECT DISTINCT (\w+) AS v FROM (\w+) LIMIT (\d+)")
+
+
+class StubConnector:
+    """tables: {表名: {"columns": [(列名, 类型)], "primary_keys": [...], "indexes": {索引名: (首列, 基数)},
+    "values": {列名: [取值]}, "partitions": [...]}}"""
+
+    def __init__(self, tables, foreign_keys=(), schema_version="v1", server_date=date(2026, 3, 15)):
+        self.tables = tables
+        self.foreign_keys = list(foreign_keys)
+        self.config = {"host": "stub", "port": 3306, "database": "app"}
+        self.schema_version_ttl = 60
+        self.schema_version = schema_version
+        self.server_date = server_date
+        self.column_values = {}
+        self.connection = None
+        self.probes = []
+        self.schema_version_queries = 0
+        self.seeded = None
+
+    def get_schema_version(self):
+        if self.seeded is not None:
+            return self.seeded
+        self.schema_version_queries += 1
+        return self.schema_version
+
+    def seed_schema_version(self, version, checked_at):
+        self.seeded = version
+
+    def set_entity_terms(self, entity_terms, column_aliases):
+        pass
+
+    def get_table_structure(self, table_name):
+        table = self.tables.get(table_name)
+        if table is None:
+            return {}
+        return {
+            "columns": [{"Field": name, "Type": col_type} for name, col_type in table["columns"]],
+            "column_names": [name for name, _ in table["columns"]],
+            "primary_keys": list(table.get("primary_keys", [])),
+        }
+
+    def get_index_info(self, table_name):
+        indexes = self.tables.get(table_name, {}).get("indexes", {})
+        return {
+            name: {"columns": [column], "unique": False, "cardinality": cardinality}
+            for name, (column, cardinality) in indexes.items()
+        }
+
+    def get_foreign_keys(self):
+        return self.foreign_keys
+
+    def get_shard_families(self):
+        return {}
+
+    def get_partitions(self, table_name):
+        return self.tables.get(table_name, {}).get("partitions", [])
+
+    def get_table_rows(self, table_names):
+        return {name: 1000 for name in table_names}
+
+    def get_server_date(self):
+        return self.server_date
+
+    def match_tables(self, user_query):
+        return []
+
+    def internal_query(self, query, params=()):
+        self.probes.append(query)
+        column, table, limit = _DISTINCT.match(query).groups()
+        values = self.tables[table].get("values", {}).get(column, [])
+        return [{"v": v} for v in values[:int(limit)]]
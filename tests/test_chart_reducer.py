@@ -0,0 +1,78 @@
+import math
+
+import pytest
+
+from chart_reducer import OTHER_LABEL, lttb, lttb_stream, reduce_trend, top_k_with_other
+
+
+def _wave(n):
+    return [(float(i), math.sin(i / 7.0) * 100 + i % 5) for i in range(n)]
+
+
+@pytest.mark.parametrize("total, threshold", [(1000, 100), (1000, 3), (101, 50), (10, 9)])
+def test_lttb_returns_threshold_points(total, threshold):
+    assert len(lttb(_wave(total), threshold)) == threshold
+
+
+def test_lttb_keeps_first_and_last_points():
+    points = _wave(1000)
+    reduced = lttb(points, 50)
+
+    assert reduced[0] == points[0]
+    assert reduced[-1] == points[-1]
+
+
+def test_lttb_selects_existing_points_in_order():
+    points = _wave(500)
+    reduced = lttb(points, 40)
+
+    assert set(reduced) <= set(points)
+    assert [x for x, _ in reduced] == sorted(x for x, _ in reduced)
+
+
+def test_lttb_keeps_a_single_spike():
+    points = [(float(i), 0.0) for i in range(1000)]
+    points[437] = (437.0, 500.0)
+
+    assert (437.0, 500.0) in lttb(points, 20)
+
+
+@pytest.mark.parametrize("threshold", [1000, 2000, 2])
+def test_lttb_returns_everything_when_nothing_to_reduce(threshold):
+    points = _wave(1000)
+
+    assert lttb(points, threshold) == points
+
+
+def test_lttb_stream_consumes_a_generator():
+    generated = ((float(i), float(i % 13)) for i in range(300))
+
+    assert len(list(lttb_stream(generated, 300, 30))) == 30
+
+
+def test_reduce_trend_fills_missing_days_and_caps_points():
+    labels, values = reduce_trend({"2026-01-01": 3, "2026-01-03": 5})
+    assert labels == ["2026-01-01", "2026-01-02", "2026-01-03"]
+    assert values == [3, 0, 5]
+
+    day_counts = {f"2025-{m:02d}-{d:02d}": m * d for m in range(1, 13) for d in range(1, 29)}
+    labels, values = reduce_trend(day_counts, max_points=60)
+    assert len(labels) == len(values) == 60
+    assert labels[0] == "2025-01-01" and labels[-1] == "2025-12-28"
+
+
+def test_top_k_with_other_buckets_the_rest():
+    counts = {f"c{i}": i for i in range(1, 21)}  # 合计 210
+    labels, values = top_k_with_other(counts, k=5)
+
+    assert labels == ["c20", "c19", "c18", "c17", OTHER_LABEL]
+    assert values[:4] == [20, 19, 18, 17]
+    assert values[-1] == 210 - (20 + 19 + 18 + 17)
+    assert sum(values) == sum(counts.values())
+
+
+def test_top_k_with_other_keeps_all_when_within_k():
+    labels, values = top_k_with_other({"a": 1, "b": 3, "c": 2}, k=3)
+
+    assert labels == ["b", "c", "a"]
+    assert values == [3, 2, 1]
@@ -0,0 +1,156 @@
+import json
+import time
+from datetime import date
+
+import pytest
+
+from nlp_query_parser import NLPQueryParser
+from plan_cache import PlanCache, normalize_query
+from stub_db import StubConnector
+
+
+def _plan(name):
+    return {"success": True, "primary_table": name, "related_tables": [], "sql_query": f"SELECT * FROM {name}"}
+
+
+def test_normalize_query_folds_width_case_whitespace_and_punctuation():
+    assert normalize_query(" 最近７天 ＡＰＰ 启动次数？ ") == "最近7天app启动次数"
+    assert normalize_query("最近7天的用户。") != normalize_query("最近3天的用户。")
+
+
+def test_make_key_includes_version():
+    assert PlanCache.make_key("用户数？", "v1") == PlanCache.make_key("用户数", "v1") == "v1:用户数"
+    assert PlanCache.make_key("用户数", "v2") != PlanCache.make_key("用户数", "v1")
+
+
+def test_get_returns_copies_and_counts_hits():
+    cache = PlanCache()
+    cache.put("k", _plan("users"))
+    cache.get("k")["sql_query"] = "changed"
+
+    assert cache.get("k")["sql_query"] == "SELECT * FROM users"
+    assert cache.get("missing") is None
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_failed_plans_are_not_cached():
+    cache = PlanCache()
+    cache.put("k", {"success": False, "error": "无法找到匹配的数据表"})
+
+    assert cache.get("k") is None
+
+
+def test_evicts_least_recently_used():
+    cache = PlanCache(max_entries=2)
+    cache.put("a", _plan("a"))
+    cache.put("b", _plan("b"))
+    cache.get("a")
+    cache.put("c", _plan("c"))
+
+    assert cache.get("b") is None
+    assert cache.get("a") and cache.get("c")
+
+
+def test_sqlite_store_round_trip(tmp_path):
+    store = str(tmp_path / "plans.db")
+    PlanCache(store_file=store).put("k", _plan("users"))
+
+    reopened = PlanCache(max_entries=1, store_file=store)
+    assert reopened.get("k") == _plan("users")
+
+    reopened.invalidate(["users"])
+    assert PlanCache(store_file=store).get("k") is None
+
+
+def test_meta_round_trip(tmp_path):
+    store = str(tmp_path / "plans.db")
+    assert PlanCache().get_meta("schema_version") is None
+
+    before = time.time()
+    PlanCache(store_file=store).put_meta("schema_version", "v1")
+    value, updated_at = PlanCache(store_file=store).get_meta("schema_version")
+
+    assert value == "v1"
+    assert updated_at >= before
+
+
+# ---------- 解析器：表结构版本复用与时间相关计划的刷新 ----------
+
+def _to_days(d):
+    return d.toordinal() + 365
+
+
+def _partitioned_tables():
+    bounds = [("p202603", date(2026, 4, 1)), ("p202604", date(2026, 5, 1)), ("pmax", None)]
+    return {
+        "users": {
+            "columns": [("id", "int"), ("created_at", "datetime")],
+            "primary_keys": ["id"],
+            "partitions": [
+                {
+                    "name": name,
+                    "ordinal": i + 1,
+                    "method": "RANGE",
+                    "expression": "to_days(`created_at`)",
+                    "description": _to_days(bound) if bound else "MAXVALUE",
+                }
+                for i, (name, bound) in enumerate(bounds)
+            ],
+        },
+    }
+
+
+@pytest.fixture
+def config_file(tmp_path):
+    path = tmp_path / "entity_config.json"
+    path.write_text(json.dumps({"entity_mappings": {"core": {"用户表": "users"}}}, ensure_ascii=False),
+                    encoding="utf-8")
+    return str(path)
+
+
+def _parser(db, config_file, plan_cache):
+    return NLPQueryParser(db, config_file, plan_cache=plan_cache, record_metrics=False,
+                          build_value_dictionary=False)
+
+
+def test_schema_version_is_reused_across_processes_within_ttl(tmp_path, config_file):
+    store = str(tmp_path / "plans.db")
+    first = StubConnector(_partitioned_tables())
+    _parser(first, config_file, PlanCache(store_file=store)).parse_query("用户表有多少")
+    assert first.schema_version_queries == 1
+
+    second = StubConnector(_partitioned_tables())
+    plan = _parser(second, config_file, PlanCache(store_file=store)).parse_query("用户表有多少")
+    assert plan["from_cache"]
+    assert second.seeded == "v1"
+    assert second.schema_version_queries == 0
+
+
+def test_expired_schema_version_is_queried_again(tmp_path, config_file, monkeypatch):
+    store = str(tmp_path / "plans.db")
+    _parser(StubConnector(_partitioned_tables()), config_file, PlanCache(store_file=store)).parse_query("用户表有多少")
+
+    later = time.time() + 61
+    monkeypatch.setattr(time, "time", lambda: later)
+    db = StubConnector(_partitioned_tables())
+    _parser(db, config_file, PlanCache(store_file=store)).parse_query("用户表有多少")
+
+    assert db.seeded is None
+    assert db.schema_version_queries == 1
+
+
+def test_cache_hit_recomputes_partition_pruning_for_current_date(config_file):
+    db = StubConnector(_partitioned_tables(), server_date=date(2026, 3, 31))
+    parser = _parser(db, config_file, PlanCache())
+
+    first = parser.parse_query("今天用户表有多少")
+    assert first["time_relative"]
+    assert first["pruning"]["partitions"] == ["p202603"]
+    assert "PARTITION (p202603)" in first["sql_query"]
+
+    db.server_date = date(2026, 4, 1)
+    hit = parser.parse_query("今天用户表有多少")
+    assert hit["from_cache"]
+    assert hit["pruning"]["partitions"] == ["p202604"]
+    assert "PARTITION (p202604)" in hit["sql_query"]
+    assert "p202603" not in hit["sql_template"]
@@ -0,0 +1,123 @@
+import threading
+
+import pytest
+
+import prefetch
+from prefetch import ResultCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(prefetch.time, "monotonic", fake)
+    return fake
+
+
+def _stored(cache, key, result):
+    assert cache.claim(key)
+    cache.release(key, result)
+
+
+def test_lookup_returns_stored_result_until_ttl(clock):
+    cache = ResultCache(max_entries=4, ttl_seconds=10)
+    _stored(cache, "q1", {"success": True, "row_count": 1})
+
+    clock.now += 9
+    assert cache.lookup("q1") == {"success": True, "row_count": 1}
+    assert cache.contains("q1")
+
+    clock.now += 2
+    assert not cache.contains("q1")
+    assert cache.lookup("q1") is None
+    assert len(cache) == 0
+
+
+def test_expired_entry_can_be_claimed_again(clock):
+    cache = ResultCache(ttl_seconds=5)
+    _stored(cache, "q1", {"success": True})
+
+    assert not cache.claim("q1")
+    clock.now += 6
+    assert cache.claim("q1")
+
+
+def test_evicts_least_recently_used(clock):
+    cache = ResultCache(max_entries=2, ttl_seconds=60)
+    _stored(cache, "a", {"v": "a"})
+    _stored(cache, "b", {"v": "b"})
+    cache.lookup("a")
+    _stored(cache, "c", {"v": "c"})
+
+    assert cache.contains("a") and cache.contains("c")
+    assert not cache.contains("b")
+
+
+def test_claim_is_exclusive_and_release_without_result_stores_nothing():
+    cache = ResultCache()
+
+    assert cache.claim("q1")
+    assert not cache.claim("q1")
+    cache.release("q1")
+    assert not cache.contains("q1")
+    assert cache.claim("q1")
+
+
+def test_release_wakes_waiting_lookup():
+    cache = ResultCache()
+    assert cache.claim("q1")
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(cache.lookup("q1", wait=5)))
+    waiter.start()
+
+    cache.release("q1", {"success": True, "row_count": 3})
+    waiter.join(timeout=5)
+
+    assert not waiter.is_alive()
+    assert results == [{"success": True, "row_count": 3}]
+
+
+def test_release_without_result_wakes_waiter_with_miss():
+    cache = ResultCache()
+    assert cache.claim("q1")
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(cache.lookup("q1", wait=5)))
+    waiter.start()
+
+    cache.release("q1")
+    waiter.join(timeout=5)
+
+    assert results == [None]
+
+
+def test_listener_fires_on_miss_only():
+    cache = ResultCache()
+    calls = []
+    cache.add_listener(lambda: calls.append(1))
+
+    assert cache.lookup("missing") is None
+    assert len(calls) == 1
+
+    _stored(cache, "q1", {"success": True})
+    cache.lookup("q1")
+    assert len(calls) == 1
+
+    cache.lookup("other")
+    assert len(calls) == 2
+
+
+def test_clear_drops_entries():
+    cache = ResultCache()
+    _stored(cache, "q1", {"success": True})
+
+    cache.clear()
+
+    assert len(cache) == 0
+    assert cache.lookup("q1") is None
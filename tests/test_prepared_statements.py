@@ -0,0 +1,95 @@
+import pytest
+
+from prepared_statements import _unquote, parameterize, plan_statement
+
+
+@pytest.mark.parametrize("literal, value", [
+    ("'huawei'", "huawei"),
+    ("''", ""),
+    ("'it''s'", "it's"),
+    (r"'it\'s'", "it's"),
+    (r"'a\\b'", "a\\b"),
+    (r"'line\nnext\ttab'", "line\nnext\ttab"),
+    (r"'\0\Z'", "\0\x1a"),
+    (r"'\q'", "q"),
+    # LIKE 通配符的转义要原样保留给 MySQL
+    (r"'50\%'", "50\\%"),
+    (r"'a\_b'", "a\\_b"),
+])
+def test_unquote(literal, value):
+    assert _unquote(literal) == value
+
+
+def test_parameterize_strings_interval_and_limit():
+    sql = ("SELECT source, COUNT(*) AS total FROM users WHERE source = 'huawei' "
+           "AND DATE(register_time) >= DATE_SUB(CURDATE(), INTERVAL 7 DAY) GROUP BY source LIMIT 100")
+
+    template, params = parameterize(sql)
+
+    assert template == (
+        "SELECT source, COUNT(*) AS total FROM users WHERE source = %s "
+        "AND DATE(register_time) >= DATE_SUB(CURDATE(), INTERVAL %s DAY) GROUP BY source LIMIT %s"
+    )
+    assert params == ["huawei", 7, 100]
+
+
+def test_parameterize_same_template_for_query_family():
+    seven, _ = parameterize("SELECT * FROM t WHERE d >= DATE_SUB(CURDATE(), INTERVAL 7 DAY) AND s IN ('a', 'b')")
+    thirty, _ = parameterize("SELECT * FROM t WHERE d >= DATE_SUB(CURDATE(), INTERVAL 30 DAY) AND s IN ('c', 'd')")
+
+    assert seven == thirty
+
+
+@pytest.mark.parametrize("sql, template, params", [
+    ("SELECT * FROM t LIMIT 20, 10", "SELECT * FROM t LIMIT %s, %s", [20, 10]),
+    ("SELECT * FROM t LIMIT 10 OFFSET 20", "SELECT * FROM t LIMIT %s OFFSET %s", [10, 20]),
+])
+def test_parameterize_limit_forms(sql, template, params):
+    assert parameterize(sql) == (template, params)
+
+
+def test_parameterize_escaped_and_doubled_quotes():
+    template, params = parameterize(r"SELECT * FROM t WHERE a = 'it''s' AND b = 'x\'y' AND c = ''")
+
+    assert template == "SELECT * FROM t WHERE a = %s AND b = %s AND c = %s"
+    assert params == ["it's", "x'y", ""]
+
+
+def test_parameterize_keeps_structural_numbers_inline():
+    sql = "SELECT YEARWEEK(created_at, 1) AS w, COUNT(*) AS c FROM t WHERE kind = 'a' GROUP BY 1 ORDER BY 2 DESC"
+
+    template, params = parameterize(sql)
+
+    assert template == "SELECT YEARWEEK(created_at, 1) AS w, COUNT(*) AS c FROM t WHERE kind = %s GROUP BY 1 ORDER BY 2 DESC"
+    assert params == ["a"]
+
+
+def test_parameterize_leaves_quoted_identifiers_and_comments():
+    sql = "SELECT `it's` FROM t /* 'not a value' */ WHERE a = 'v'"
+
+    assert parameterize(sql) == ("SELECT `it's` FROM t /* 'not a value' */ WHERE a = %s", ["v"])
+
+
+def test_parameterize_percent_inside_literal_is_a_parameter():
+    assert parameterize("SELECT DATE_FORMAT(d, '%Y-%m') AS m FROM t") == (
+        "SELECT DATE_FORMAT(d, %s) AS m FROM t", ["%Y-%m"]
+    )
+
+
+def test_parameterize_bails_out_on_bare_percent():
+    sql = "SELECT id % 2 AS parity FROM t WHERE a = 'x' LIMIT 5"
+
+    assert parameterize(sql) == (sql, None)
+
+
+def test_parameterize_without_literals_returns_no_params():
+    sql = "SELECT COUNT(*) AS total FROM t WHERE DATE(d) = CURDATE()"
+
+    assert parameterize(sql) == (sql, None)
+    assert plan_statement({"sql_query": sql, "sql_template": sql, "sql_params": None}) == (sql, None)
+
+
+def test_plan_statement_uses_template_and_params():
+    plan = {"sql_query": "SELECT * FROM t LIMIT 5", "sql_template": "SELECT * FROM t LIMIT %s", "sql_params": [5]}
+
+    assert plan_statement(plan) == ("SELECT * FROM t LIMIT %s", (5,))
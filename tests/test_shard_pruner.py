@@ -0,0 +1,95 @@
+import sqlite3
+
+import pytest
+
+from shard_pruner import build_union_sql, split_aggregates
+
+GROUPED_SQL = (
+    "SELECT source, COUNT(*) AS total, AVG(age) AS avg_age FROM users WHERE age > 0 "
+    "GROUP BY source ORDER BY total DESC LIMIT 10"
+)
+
+
+def test_split_aggregates_turns_avg_into_sum_and_count():
+    plan = split_aggregates(GROUPED_SQL)
+
+    assert plan["group_names"] == ["source"]
+    assert plan["merges"] == [{"name": "total", "func": "SUM"}, {"name": "avg_age", "func": "AVG"}]
+    assert plan["inner_sql"] == (
+        "SELECT source, COUNT(*) AS total, SUM(age) AS avg_age_sum, COUNT(age) AS avg_age_count "
+        "FROM users WHERE age > 0 GROUP BY source"
+    )
+    assert plan["order"] == "ORDER BY total DESC"
+    assert plan["limit"] == "LIMIT 10"
+
+
+@pytest.mark.parametrize("func, merged", [("COUNT", "SUM"), ("SUM", "SUM"), ("MAX", "MAX"), ("MIN", "MIN")])
+def test_split_aggregates_merge_functions(func, merged):
+    plan = split_aggregates(f"SELECT {func}(age) AS v FROM users")
+
+    assert plan["merges"] == [{"name": "v", "func": merged}]
+    assert plan["group_names"] == []
+
+
+def test_split_aggregates_merges_count_distinct_as_sum():
+    # 只对分片间不重叠的键（主键）成立：同一个值出现在多个分片时合并结果会偏大
+    plan = split_aggregates("SELECT COUNT(DISTINCT id) AS users FROM users")
+
+    assert plan["inner_sql"] == "SELECT COUNT(DISTINCT id) AS users FROM users"
+    assert plan["merges"] == [{"name": "users", "func": "SUM"}]
+
+
+def test_split_aggregates_rejects_detail_and_unsplittable_queries():
+    assert split_aggregates("SELECT id, name FROM users LIMIT 5") is None
+    assert split_aggregates("SELECT COUNT(*) / 2 AS half FROM users") is None
+    # 非聚合列没有 GROUP BY 时无法在外层重新分组
+    assert split_aggregates("SELECT source, COUNT(*) AS total FROM users") is None
+
+
+def test_split_aggregates_accepts_its_own_merged_avg():
+    merged = build_union_sql(GROUPED_SQL, "users", ["users_1", "users_2"])
+    plan = split_aggregates(merged)
+
+    assert plan["merges"] == [{"name": "total", "func": "SUM"}, {"name": "avg_age", "func": "AVG"}]
+
+
+def test_build_union_sql_single_shard_only_renames_table():
+    assert build_union_sql("SELECT COUNT(*) AS c FROM users", "users", ["users_2024"]) == (
+        "SELECT COUNT(*) AS c FROM users_2024"
+    )
+
+
+def test_build_union_sql_reaggregates_groups():
+    sql = build_union_sql(GROUPED_SQL, "users", ["users_1", "users_2"])
+
+    assert sql.startswith(
+        "SELECT source, SUM(total) AS total, SUM(avg_age_sum) / NULLIF(SUM(avg_age_count), 0) AS avg_age FROM ("
+    )
+    assert "FROM users_1 WHERE age > 0 GROUP BY source UNION ALL" in sql
+    assert "FROM users_2 WHERE age > 0 GROUP BY source) AS shard_union" in sql
+    assert sql.endswith("AS shard_union GROUP BY source ORDER BY total DESC LIMIT 10")
+
+
+def test_build_union_sql_detail_query_orders_and_limits_outside():
+    sql = build_union_sql("SELECT id, name FROM users ORDER BY id DESC LIMIT 5", "users", ["users_1", "users_2"])
+
+    assert sql == (
+        "(SELECT id, name FROM users_1 ORDER BY id DESC LIMIT 5) UNION ALL "
+        "(SELECT id, name FROM users_2 ORDER BY id DESC LIMIT 5) ORDER BY id DESC LIMIT 5"
+    )
+
+
+def test_build_union_sql_matches_unsharded_result():
+    rows = [
+        (1, "huawei", 20), (2, "huawei", 30), (3, "xiaomi", 25),
+        (4, "huawei", 40), (5, "xiaomi", 35), (6, "oppo", 50), (7, "xiaomi", 45),
+    ]
+    db = sqlite3.connect(":memory:")
+    for table, part in (("users", rows), ("users_1", rows[:3]), ("users_2", rows[3:])):
+        db.execute(f"CREATE TABLE {table} (id INTEGER PRIMARY KEY, source TEXT, age INTEGER)")
+        db.executemany(f"INSERT INTO {table} VALUES (?, ?, ?)", part)
+    sql = "SELECT source, COUNT(*) AS total, AVG(age) AS avg_age FROM users GROUP BY source ORDER BY source"
+
+    merged = db.execute(build_union_sql(sql, "users", ["users_1", "users_2"])).fetchall()
+
+    assert merged == db.execute(sql).fetchall()
@@ -0,0 +1,203 @@
+import json
+
+import pytest
+
+from nlp_query_parser import NLPQueryParser
+from stub_db import StubConnector
+from value_dictionary import ValueDictionary
+
+
+def _tables():
+    return {
+        "users": {
+            "columns": [
+                ("id", "int"),
+                ("source", "varchar(32)"),
+                ("device", "varchar(64)"),
+                ("nickname", "varchar(64)"),
+                ("status", "enum('active','banned','it''s')"),
+                ("level", "int"),
+                ("channel_id", "int"),
+                ("created_at", "datetime"),
+            ],
+            "primary_keys": ["id"],
+            "indexes": {"idx_source": ("source", 3), "idx_device": ("device", 5000), "idx_level": ("level", 5)},
+            "values": {"source": ["huawei", "xiaomi", "oppo"], "nickname": ["neo"]},
+        },
+        "channels": {
+            "columns": [("id", "int"), ("name", "varchar(32)"), ("source", "varchar(32)")],
+            "primary_keys": ["id"],
+            "indexes": {"idx_name": ("name", 2), "idx_source": ("source", 2)},
+            "values": {"name": ["huawei", "appstore"], "source": ["huawei", "apple"]},
+        },
+        "orders": {
+            "columns": [("id", "int"), ("pay_type", "varchar(16)")],
+            "primary_keys": ["id"],
+            "indexes": {"idx_pay_type": ("pay_type", 2)},
+            "values": {"pay_type": ["alipay", "wechat"]},
+        },
+    }
+
+
+@pytest.fixture
+def db():
+    return StubConnector(_tables(), foreign_keys=[
+        {"table": "users", "column": "channel_id", "referenced_table": "channels", "referenced_column": "id"},
+    ])
+
+
+def test_builds_indexed_low_cardinality_and_enum_columns_only(db):
+    columns = ValueDictionary(db).ensure_table("users")
+
+    assert columns == {
+        "source": {"values": ["huawei", "xiaomi", "oppo"], "indexed": True},
+        "status": {"values": ["active", "banned", "it's"], "indexed": False},
+    }
+    # 高基数索引列、无索引文本列、主键和数字列都不探测；ENUM 取值来自列类型
+    assert db.probes == ["SELECT DISTINCT source AS v FROM users LIMIT 51"]
+
+
+def test_fresh_table_is_not_probed_again(db):
+    dictionary = ValueDictionary(db)
+    dictionary.ensure_table("users")
+    dictionary.ensure_table("users")
+
+    assert len(db.probes) == 1
+
+
+def test_total_value_budget_and_value_length():
+    tables = _tables()
+    tables["users"]["values"]["source"] = ["huawei", "x" * 80, "oppo"]
+    db = StubConnector(tables)
+    dictionary = ValueDictionary(db, {"max_total_values": 4})
+
+    columns = dictionary.ensure_table("users")
+    assert columns["source"]["values"] == ["huawei", "oppo"]
+    # 剩余预算只够两个 ENUM 取值，之后的表不再探测
+    assert columns["status"]["values"] == ["active", "banned"]
+    assert dictionary.ensure_table("channels") == {}
+    assert len(db.probes) == 1
+
+
+def test_extract_filters_single_value_and_in_list(db):
+    dictionary = ValueDictionary(db, aliases={"xiaomi": ["小米"]})
+    dictionary.ensure_table("users")
+
+    assert dictionary.extract_filters("oppo渠道的用户数", ["users"], "users") == [
+        {"table": "users", "column": "source", "values": ["oppo"], "indexed": True},
+    ]
+    filters = dictionary.extract_filters("华为和小米以及oppo的用户", ["users"], "users")
+    assert filters == [{"table": "users", "column": "source", "values": ["xiaomi", "oppo"], "indexed": True}]
+    assert ValueDictionary.condition("t0.source", filters[0]["values"]) == "t0.source IN ('xiaomi', 'oppo')"
+
+
+def test_extract_filters_matches_ascii_values_as_whole_words(db):
+    dictionary = ValueDictionary(db)
+    dictionary.ensure_table("users")
+
+    assert dictionary.extract_filters("oppoa5 的用户", ["users"], "users") == []
+    assert dictionary.extract_filters("OPPO 的用户", ["users"], "users")[0]["values"] == ["oppo"]
+
+
+def test_extract_filters_ranks_hinted_then_primary_table_columns(db):
+    dictionary = ValueDictionary(db)
+    for table in ("users", "channels"):
+        dictionary.ensure_table(table)
+    tables = ["users", "channels"]
+
+    # 同一个取值出现在多列：默认优先主表的列
+    assert dictionary.extract_filters("huawei的用户", tables, "users")[0]["table"] == "users"
+    assert dictionary.extract_filters("huawei的用户", tables, "channels")[0]["table"] == "channels"
+    # 查询中出现列的提示词时优先该列
+    hinted = dictionary.extract_filters("名称为huawei的用户", tables, "users", {"name": ["名称"]})
+    assert (hinted[0]["table"], hinted[0]["column"]) == ("channels", "name")
+
+
+def test_condition_escapes_quotes():
+    assert ValueDictionary.condition("status", ["it's"]) == "status = 'it''s'"
+
+
+def test_version_covers_only_given_tables(db):
+    dictionary = ValueDictionary(db)
+    before = dictionary.version(["users"])
+    assert not dictionary.built(["users"])
+
+    dictionary.ensure_table("orders")
+    assert dictionary.version(["users"]) == before
+    assert not dictionary.built(["users"])
+
+    dictionary.ensure_table("users")
+    assert dictionary.built(["users"])
+    assert dictionary.version(["users"]) != before
+
+
+def test_start_background_builds_missing_tables_once(db):
+    dictionary = ValueDictionary(db)
+    dictionary.ensure_table("users")
+    dictionary.start_background(["users", "orders", "orders"])
+    dictionary._thread.join(5)
+
+    assert set(db.column_values) == {"users", "orders"}
+    assert db.probes.count("SELECT DISTINCT pay_type AS v FROM orders LIMIT 51") == 1
+    assert dictionary._thread is None
+
+    dictionary.start_background(["users", "orders"])
+    assert dictionary._thread is None
+
+
+# ---------- 解析器：计划缓存与字典版本 ----------
+
+@pytest.fixture
+def config_file(tmp_path):
+    path = tmp_path / "entity_config.json"
+    path.write_text(json.dumps({
+        "entity_mappings": {"core": {"用户表": "users", "渠道表": "channels", "订单表": "orders"}},
+        "value_aliases": {"huawei": ["华为"]},
+    }, ensure_ascii=False), encoding="utf-8")
+    return str(path)
+
+
+def _parser(db, config_file, **kwargs):
+    return NLPQueryParser(db, config_file, record_metrics=False, **kwargs)
+
+
+def test_plan_is_rebuilt_after_dictionary_of_its_tables_is_built(db, config_file):
+    parser = _parser(db, config_file, build_value_dictionary=False)
+
+    first = parser.parse_query("华为的用户表有多少")
+    assert "huawei" not in first["sql_query"]
+    assert parser.parse_query("华为的用户表有多少")["from_cache"]
+
+    parser.value_dictionary.ensure_table("users")
+    rebuilt = parser.parse_query("华为的用户表有多少")
+    assert "from_cache" not in rebuilt
+    assert "source = 'huawei'" in rebuilt["sql_query"]
+    assert rebuilt["value_dictionary"]["version"] == parser.value_dictionary.version(["users"])
+    assert parser.parse_query("华为的用户表有多少")["from_cache"]
+
+
+def test_dictionary_of_unrelated_table_keeps_cached_plan(db, config_file):
+    parser = _parser(db, config_file, build_value_dictionary=False)
+    parser.parse_query("用户表有多少")
+
+    parser.value_dictionary.ensure_table("orders")
+    assert parser.parse_query("用户表有多少")["from_cache"]
+
+
+def test_parse_does_not_build_dictionary_synchronously(db, config_file):
+    parser = _parser(db, config_file, build_value_dictionary=False)
+    parser.parse_query("华为的用户表有多少")
+
+    assert db.probes == []
+    assert parser.value_dictionary._thread is None
+
+
+def test_parse_starts_background_build_for_plan_tables(db, config_file):
+    parser = _parser(db, config_file)
+    parser.parse_query("华为的用户表有多少")
+    thread = parser.value_dictionary._thread
+    if thread is not None:
+        thread.join(5)
+
+    assert {"users", "channels", "orders"} <= set(db.column_values)
+    assert "source = 'huawei'" in parser.parse_query("华为的用户表有多少")["sql_query"]